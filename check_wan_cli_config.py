@@ -31,6 +31,8 @@ def check_model_paths():
         print(f"✅ WAN_HOME: {output.get('wan_home')}")
         print(f"✅ WAN_CKPT_DIR: {output.get('ckpt_dir')}")
         print(f"✅ ComfyUI: {output.get('comfyui_url')} ({output.get('comfyui_status')})")
+        for name, state in (output.get('wan_models') or {}).items():
+            print(f"{'✅' if state == 'ok' else '⚠️ '} {name}: {state}")
         
         ckpt_dir = output.get('ckpt_dir', '')
         print(f"\n📁 Current Model Directory Structure:")
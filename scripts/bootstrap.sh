@@ -7,11 +7,19 @@ set -euo pipefail
 : "${COMFYUI_HOST:=127.0.0.1}"
 : "${COMFYUI_PORT:=8188}"
 
+# Startup timeline: the handler merges these marks into its health response
+STARTUP_TIMELINE_PATH="${STARTUP_TIMELINE_PATH:-/tmp/startup_timeline.jsonl}"
+export STARTUP_TIMELINE_PATH
+: > "${STARTUP_TIMELINE_PATH}"
+mark() { printf '{"phase":"%s","event":"%s","t":%s}\n' "$1" "$2" "$(date +%s.%N)" >> "${STARTUP_TIMELINE_PATH}"; }
+mark bootstrap start
+
 echo "[bootstrap] ===== WAN 2.2 + ComfyUI Setup ====="
 echo "[bootstrap] WAN models directory: ${WAN_CKPT_DIR}"
 echo "[bootstrap] ComfyUI root: ${COMFYUI_ROOT}"
 
 # Fallbacks for common RunPod mounts
+mark locate_models start
 if [ ! -d "${WAN_CKPT_DIR}" ] || [ -z "$(ls -A "${WAN_CKPT_DIR}" 2>/dev/null || true)" ]; then
   if [ -d "/runpod-volume/models" ] && [ -n "$(ls -A "/runpod-volume/models" 2>/dev/null || true)" ]; then
     export WAN_CKPT_DIR="/runpod-volume/models"
@@ -25,6 +33,8 @@ if [ ! -d "${WAN_CKPT_DIR}" ] || [ -z "$(ls -A "${WAN_CKPT_DIR}" 2>/dev/null ||
 fi
 
 echo "[bootstrap] Final WAN model path: ${WAN_CKPT_DIR}"
+export WAN_CKPT_DIR
+mark locate_models end
 
 # Optional: Check if WAN I2V model exists, download if AUTO_DOWNLOAD_MODELS=true
 # Users can pre-download models or download manually to avoid this
@@ -34,7 +44,15 @@ if [ "${AUTO_DOWNLOAD_I2V:-false}" = "true" ]; then
 
   if [ ! -f "${WAN_T5_CHECK}" ]; then
     echo "[bootstrap] WAN I2V model not found at ${WAN_MODEL_DIR}"
-    echo "[bootstrap] Downloading Wan2.2-I2V-A14B model from Hugging Face..."
+    echo "[bootstrap] Downloading Wan2.2-I2V-A14B model from Hugging Face in the background..."
+    # WAN actions wait while this marker exists; ComfyUI and status actions don't
+    WAN_DOWNLOAD_PENDING_FILE="${WAN_DOWNLOAD_PENDING_FILE:-/tmp/wan_download.pending}"
+    export WAN_DOWNLOAD_PENDING_FILE
+    touch "${WAN_DOWNLOAD_PENDING_FILE}"
+    (
+    # The handler fails waiting WAN jobs if this pid dies with the marker still present
+    echo "${BASHPID}" > "${WAN_DOWNLOAD_PENDING_FILE}"
+    mark wan_download start
     
     # Set Hugging Face token if provided via environment
     if [ -n "${HF_TOKEN:-}" ]; then
@@ -53,6 +71,9 @@ if [ "${AUTO_DOWNLOAD_I2V:-false}" = "true" ]; then
       echo "[bootstrap] WARNING: huggingface-cli not found. Install with: pip install huggingface_hub[cli]"
       echo "[bootstrap] Jobs may fail until models are manually downloaded to ${WAN_MODEL_DIR}"
     fi
+    mark wan_download end
+    rm -f "${WAN_DOWNLOAD_PENDING_FILE}"
+    ) > /tmp/wan_download.log 2>&1 &
   else
     echo "[bootstrap] WAN I2V model found at ${WAN_MODEL_DIR}"
   fi
@@ -66,6 +87,7 @@ else
 fi
 
 # Setup ComfyUI model paths
+mark comfyui_config start
 echo "[bootstrap] Setting up ComfyUI model configuration..."
 
 # Create/update extra_model_paths.yaml from permanent storage or template
@@ -99,34 +121,40 @@ fi
 
 echo "[bootstrap] ComfyUI model paths configured"
 cat "${COMFYUI_ROOT}/extra_model_paths.yaml"
+mark comfyui_config end
+
+# Prewarm likely-needed model weights into the page cache while ComfyUI and the handler start
+if [ "${PREWARM_ENABLED:-true}" = "true" ]; then
+  python3 /workspace/src/prewarm.py --ckpt-dir "${WAN_CKPT_DIR}" --comfyui-root "${COMFYUI_ROOT}" > /tmp/prewarm.log 2>&1 &
+  echo "[bootstrap] Prewarm started with PID: $! (log: /tmp/prewarm.log)"
+fi
 
 # Start ComfyUI in background
 echo "[bootstrap] Starting ComfyUI server on ${COMFYUI_HOST}:${COMFYUI_PORT}..."
+mark comfyui_launch start
+# Local NVMe model tier: ComfyUI searches the cached copies ahead of the volume
+COMFYUI_EXTRA_ARGS=""
+if [ "${LOCAL_MODEL_CACHE_GB:-0}" != "0" ]; then
+  LOCAL_PATHS_YAML="${LOCAL_MODEL_CACHE_DIR:-/workspace/model_cache}/extra_model_paths.local.yaml"
+  if COMFYUI_ROOT="${COMFYUI_ROOT}" python3 /workspace/src/model_cache.py "${LOCAL_PATHS_YAML}"; then
+    COMFYUI_EXTRA_ARGS="--extra-model-paths-config ${LOCAL_PATHS_YAML}"
+    echo "[bootstrap] Local model cache overlay: ${LOCAL_PATHS_YAML}"
+  fi
+fi
 cd "${COMFYUI_ROOT}"
-python3 main.py --listen ${COMFYUI_HOST} --port ${COMFYUI_PORT} > /tmp/comfyui.log 2>&1 &
+python3 main.py --listen ${COMFYUI_HOST} --port ${COMFYUI_PORT} ${COMFYUI_EXTRA_ARGS} > /tmp/comfyui.log 2>&1 &
 COMFYUI_PID=$!
+COMFYUI_PID_FILE="${COMFYUI_PID_FILE:-/tmp/comfyui.pid}"
+export COMFYUI_PID_FILE
+echo "${COMFYUI_PID}" > "${COMFYUI_PID_FILE}"
+mark comfyui_launch end
 echo "[bootstrap] ComfyUI started with PID: ${COMFYUI_PID}"
 
-# Wait for ComfyUI to be ready
-echo "[bootstrap] Waiting for ComfyUI to start..."
-MAX_WAIT=60
-WAITED=0
-while [ $WAITED -lt $MAX_WAIT ]; do
-  if curl -s http://${COMFYUI_HOST}:${COMFYUI_PORT}/ > /dev/null 2>&1; then
-    echo "[bootstrap] ComfyUI is ready!"
-    break
-  fi
-  sleep 2
-  WAITED=$((WAITED + 2))
-done
-
-if [ $WAITED -ge $MAX_WAIT ]; then
-  echo "[bootstrap] WARNING: ComfyUI did not start within ${MAX_WAIT}s"
-  echo "[bootstrap] ComfyUI logs:"
-  tail -50 /tmp/comfyui.log
-fi
+# No wait for ComfyUI here: the handler starts right away and gates ComfyUI
+# actions on its readiness (see startup.py); health reports the timeline.
 
 # Start RunPod serverless worker directly (avoid python -m runpod)
 echo "[bootstrap] Starting RunPod handler..."
 export PYTHONPATH="/workspace:${PYTHONPATH:-}"
+mark bootstrap end
 exec python3 /workspace/src/handler.py
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Cold-start import budget check for src/handler.py.
+Imports the handler in a fresh interpreter under `python -X importtime`,
+reports the slowest imports, and fails if the total import time exceeds the
+budget in scripts/import_budget.json or if a backend module that should load
+lazily (ComfyUI client, websocket, boto3, torch, ...) is imported eagerly.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, "..", "src")
+BUDGET_PATH = os.path.join(HERE, "import_budget.json")
+
+# Used when import_budget.json is missing
+DEFAULT_BUDGET = {
+    "total_ms": 166,
+    "lazy_modules": ["runpod", "comfyui_client", "websocket", "asset_fetcher", "wan_worker",
+                     "output_store", "webhook", "boto3", "botocore", "torch", "numpy", "yaml"],
+}
+
+
+def measure(module="handler"):
+    """
+    Import `module` from src/ in a fresh interpreter with -X importtime.
+
+    Returns:
+        {module name: (self_us, cumulative_us)} and the total in microseconds
+    """
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=SRC, capture_output=True, text=True,
+                          env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"})
+    if proc.returncode != 0:
+        tail = [l for l in proc.stderr.splitlines() if not l.startswith("import time:")][-5:]
+        raise RuntimeError(f"import {module} failed:\n" + "\n".join(tail))
+    mods = {}
+    total = 0
+    for line in proc.stderr.splitlines():
+        # "import time:      self [us] |  cumulative | imported package"
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        self_us, cum_us = int(parts[0]), int(parts[1])
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        mods[name] = (self_us, cum_us)
+        if depth == 0:  # top-level entries add up to the whole import
+            total += cum_us
+    return mods, total
+
+
+def load_budget(path):
+    if os.path.isfile(path):
+        with open(path) as f:
+            return {**DEFAULT_BUDGET, **json.load(f)}
+    return dict(DEFAULT_BUDGET)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold-start import budget check for handler.py')
+    parser.add_argument('--budget', default=BUDGET_PATH, help='Budget JSON file')
+    parser.add_argument('--runs', type=int, default=3, help='Fresh imports to measure; the fastest counts (default: 3)')
+    parser.add_argument('--top', type=int, default=15, help='Slowest imports to list (default: 15)')
+    parser.add_argument('--record', action='store_true',
+                        help='Write the measured total plus headroom as the new budget')
+    parser.add_argument('--headroom', type=float, default=1.25, help='Budget multiplier for --record (default: 1.25)')
+    args = parser.parse_args()
+
+    budget = load_budget(args.budget)
+    try:
+        runs = [measure() for _ in range(max(1, args.runs))]
+    except RuntimeError as e:
+        print(f"FAIL: {e}")
+        sys.exit(1)
+    mods, total = min(runs, key=lambda r: r[1])
+
+    print(f"import handler: {total / 1000:.1f} ms (best of {len(runs)}, budget {budget['total_ms']} ms)")
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    for name, (self_us, cum_us) in sorted(mods.items(), key=lambda kv: -kv[1][1])[:args.top]:
+        print(f"{cum_us / 1000:>14.1f} {self_us / 1000:>8.1f}  {name}")
+
+    if args.record:
+        budget["total_ms"] = int(total / 1000 * args.headroom) + 1
+        with open(args.budget, "w") as f:
+            json.dump(budget, f, indent=2)
+            f.write("\n")
+        print(f"Recorded budget {budget['total_ms']} ms to {args.budget}")
+        return
+
+    failures = []
+    eager = [m for m in budget["lazy_modules"] if m in mods]
+    if eager:
+        failures.append(f"modules that should load lazily were imported: {', '.join(eager)}")
+    if total / 1000 > budget["total_ms"]:
+        failures.append(f"import time {total / 1000:.1f} ms exceeds budget {budget['total_ms']} ms")
+    for msg in failures:
+        print(f"FAIL: {msg}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Local check for job cancellation and deadlines on both backends.
+Runs the handler in-process against a sleeping stub generate.py (which
+ignores SIGINT, so escalation to SIGTERM is exercised), the persistent
+worker's CPU stub pipeline, and a fake ComfyUI server that keeps a prompt
+running until it is interrupted. No GPU needed.
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+STUB_GENERATE = r"""
+import os, signal, subprocess, sys, time
+signal.signal(signal.SIGINT, signal.SIG_IGN)  # only SIGTERM stops it
+child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(600)"])
+with open(os.environ["STUB_PIDS"], "a") as f:
+    f.write(f"{os.getpid()} {child.pid}\n")
+print("Generating video ...", flush=True)
+time.sleep(600)
+"""
+
+
+class FakeComfyUI(BaseHTTPRequestHandler):
+    """Minimal /prompt, /history, /queue and /interrupt; prompts run until interrupted."""
+    running = []
+    pending = []
+    calls = []
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body, code=200):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.startswith("/history/"):
+            return self._reply({})
+        if self.path == "/queue":
+            return self._reply({"queue_running": [[0, p, {}, {}, []] for p in self.running],
+                                "queue_pending": [[1, p, {}, {}, []] for p in self.pending]})
+        return self._reply({})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self.calls.append((self.path, body))
+        if self.path == "/prompt":
+            prompt_id = str(uuid.uuid4())
+            self.running.append(prompt_id)
+            return self._reply({"prompt_id": prompt_id})
+        if self.path == "/interrupt":
+            # The executing prompt stops shortly after an interrupt
+            threading.Timer(1.0, lambda: self.running.clear()).start()
+            return self._reply({})
+        if self.path == "/queue":
+            for p in body.get("delete", []):
+                if p in self.pending:
+                    self.pending.remove(p)
+            return self._reply({})
+        return self._reply({})
+
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # Reaped or zombie both count as gone
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except OSError:
+        return False
+
+
+def check(name, ok, detail=""):
+    print(f"{'OK  ' if ok else 'FAIL'} {name} {detail}")
+    return ok
+
+
+def main():
+    tmp = tempfile.mkdtemp(prefix="cancel_test_")
+    wan_home = os.path.join(tmp, "wan")
+    ckpt = os.path.join(tmp, "models", "Wan2.2-T2V-A14B")
+    for d in (wan_home, os.path.join(ckpt, "high_noise_model"), os.path.join(ckpt, "low_noise_model")):
+        os.makedirs(d)
+    for f in ("models_t5_umt5-xxl-enc-bf16.pth", "Wan2.1_VAE.pth"):
+        open(os.path.join(ckpt, f), "w").close()
+    with open(os.path.join(wan_home, "generate.py"), "w") as f:
+        f.write(STUB_GENERATE)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeComfyUI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    pids_file = os.path.join(tmp, "pids")
+    os.environ.update({
+        "WAN_HOME": wan_home, "WAN_CKPT_DIR": os.path.dirname(ckpt), "WAN_OUT_DIR": os.path.join(tmp, "out"),
+        "WAN_PERSISTENT_WORKER": "false", "COMFYUI_PORT": str(server.server_port),
+        "JOB_DB_PATH": os.path.join(tmp, "jobs.sqlite3"), "MODEL_CATALOG_PATH": os.path.join(tmp, "catalog.json"),
+        "COST_MODEL_PATH": os.path.join(tmp, "cost.json"), "MEMORY_PROFILE_PATH": os.path.join(tmp, "mem.json"),
+        "JOB_LOG_DIR": os.path.join(tmp, "logs"), "RESULT_CACHE_DIR": os.path.join(tmp, "cache"),
+        "CANCEL_GRACE_S": "1", "STUB_PIDS": pids_file, "ADMISSION_POLICY": "off",
+    })
+    sys.path.insert(0, SRC)
+    import handler
+
+    def stub_pids():
+        with open(pids_file) as f:
+            return [int(x) for x in f.read().split()]
+
+    wan = {"action": "generate", "return_video": False,
+           "params": {"task": "t2v-A14B", "size": "832*480", "prompt": "test"}}
+    results = []
+
+    # 1. WAN deadline: SIGINT is ignored, SIGTERM stops the group
+    t0 = time.time()
+    res = handler.run_action({"id": "job-deadline", "input": dict(wan, deadline_s=3)})
+    st = res.get("status") or {}
+    results.append(check("wan deadline", st.get("status") == "TIMEOUT",
+                         f"{st.get('status')} in {time.time() - t0:.1f}s, cancel={st.get('cancel')}"))
+    results.append(check("wan process group gone", not any(alive(p) for p in stub_pids()), str(stub_pids())))
+    results.append(check("queue time reported", isinstance(res.get("queue_s"), float), str(res.get("queue_s"))))
+
+    # 1b. The deadline clock starts when the job gets the GPU, not while it is queued
+    from cancellation import JobControl
+    control = JobControl(0.5, start=False)
+    time.sleep(0.8)
+    queued, before = control.check(), control.start()
+    time.sleep(0.7)
+    results.append(check("deadline starts at the GPU", queued is None and before >= 0.8 and control.check() == "deadline",
+                         f"queued {before:.1f}s"))
+
+    # 2. WAN cancel by RunPod job id while running
+    open(pids_file, "w").close()
+    out = {}
+    th = threading.Thread(target=lambda: out.update(handler.run_action({"id": "job-cancel", "input": wan})))
+    th.start()
+    time.sleep(2)
+    reply = handler.run_action({"input": {"action": "cancel", "job_id": "job-cancel", "wait_s": 30}})
+    th.join(60)
+    results.append(check("wan cancel", reply.get("stopped") and (out.get("status") or {}).get("status") == "CANCELLED",
+                         f"{(out.get('status') or {}).get('status')} signal={reply.get('cancel', {}).get('signal')}"))
+    results.append(check("wan cancel group gone", not any(alive(p) for p in stub_pids()), str(stub_pids())))
+
+    # 3. ComfyUI cancel: interrupt + queue delete, then the prompt leaves the queue
+    FakeComfyUI.calls.clear()
+    comfy = {"action": "comfyui_workflow", "params": {"workflow": {"1": {"class_type": "Noop", "inputs": {}}},
+                                                      "use_cache": False}}
+    out = {}
+    th = threading.Thread(target=lambda: out.update(handler.run_action({"id": "comfy-cancel", "input": comfy})))
+    th.start()
+    time.sleep(3)
+    reply = handler.run_action({"input": {"action": "cancel", "job_id": "comfy-cancel", "wait_s": 30}})
+    th.join(60)
+    paths = [p for p, _ in FakeComfyUI.calls]
+    results.append(check("comfyui cancel", reply.get("stopped") and "/interrupt" in paths and "/queue" in paths
+                         and out.get("result", {}).get("released") is True, f"calls={paths}"))
+
+    # 4. ComfyUI timeout also interrupts instead of leaving the prompt on the GPU
+    FakeComfyUI.calls.clear()
+    res = handler.run_action({"input": dict(comfy, params=dict(comfy["params"], timeout=3))})
+    paths = [p for p, _ in FakeComfyUI.calls]
+    results.append(check("comfyui timeout", "/interrupt" in paths and not FakeComfyUI.running, f"calls={paths}"))
+
+    # 5. Persistent worker: cancel kills the worker group and the job is not re-run via generate.py
+    os.environ.update({"WAN_WORKER_STUB": "true", "WAN_WORKER_STUB_STEP_S": "1"})
+    handler.WAN_PERSISTENT_WORKER = True
+    open(pids_file, "w").close()
+    out = {}
+    job = dict(wan, params=dict(wan["params"], sample_steps=300))
+    th = threading.Thread(target=lambda: out.update(handler.run_action({"id": "worker-cancel", "input": job})))
+    th.start()
+    time.sleep(5)
+    reply = handler.run_action({"input": {"action": "cancel", "job_id": "worker-cancel", "wait_s": 30}})
+    th.join(60)
+    worker = handler._get_wan_worker()
+    results.append(check("worker cancel", reply.get("stopped") and (out.get("status") or {}).get("status") == "CANCELLED"
+                         and worker.proc.poll() is not None and not os.path.getsize(pids_file),
+                         f"{(out.get('status') or {}).get('status')} signal={reply.get('cancel', {}).get('signal')}"))
+
+    server.shutdown()
+    if not all(results):
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
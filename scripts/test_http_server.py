@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Local check for the standalone HTTP API (src/http_server.py) against a stub
+backend: async jobs with Server-Sent Events, direct action calls answered
+while a GPU job runs, cancellation, bearer auth, and output downloads with
+Range / If-Range / HEAD. No GPU needed.
+"""
+import asyncio
+import http.client
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from http_server import HttpApi  # noqa: E402
+
+API_KEY = "test-key"
+
+
+class StubBackend:
+    """run_action stand-in: "generate" holds a single GPU slot and reports progress."""
+
+    def __init__(self, out_dir):
+        self.gpu = threading.Semaphore(1)
+        self.out_dir = out_dir
+        self.outputs = {}
+        self.cancelled = set()
+
+    def run_action(self, event, progress=None):
+        job_id, event = event.get("id"), event["input"]
+        action = event.get("action")
+        if event.get("health"):
+            return {"ok": True}
+        if action == "status":
+            return {"request_id": event.get("request_id"), "status": {"status": "COMPLETED"}}
+        if action == "cancel":
+            self.cancelled.add(event["job_id"])
+            return {"cancelled": True, "stopped": True}
+        if action != "generate":
+            return {"error": f"Unsupported action {action}"}
+        with self.gpu:
+            for step in range(1, 11):
+                if job_id in self.cancelled:
+                    return {"request_id": job_id, "status": {"status": "CANCELLED"}}
+                progress({"phase": "sampling", "percent": 20 + 7 * step, "step": step, "total_steps": 10})
+                time.sleep(float(event.get("step_s", 0.1)))
+        rid = f"r-{job_id}"
+        path = os.path.join(self.out_dir, f"{rid}.mp4")
+        with open(path, "wb") as f:
+            f.write(bytes(range(256)) * 4096)
+        self.outputs[rid] = path
+        return {"request_id": rid, "status": {"status": "COMPLETED"}, "result_path": path}
+
+    def output_path(self, rid, index):
+        path = self.outputs.get(rid)
+        return (path, None) if path and index == 0 else (None, f"No output {index} for {rid}")
+
+
+def check(name, ok, detail=""):
+    print(f"{'OK  ' if ok else 'FAIL'} {name} {detail}")
+    return ok
+
+
+def request(port, method, path, body=None, headers=None, auth=True):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    h = dict(headers or {})
+    if auth:
+        h["Authorization"] = f"Bearer {API_KEY}"
+    data = json.dumps(body).encode() if body is not None else None
+    if data is not None:
+        h["Content-Type"] = "application/json"
+    conn.request(method, path, body=data, headers=h)
+    r = conn.getresponse()
+    raw = r.read()
+    conn.close()
+    try:
+        parsed = json.loads(raw) if r.getheader("Content-Type") == "application/json" else raw
+    except ValueError:
+        parsed = raw
+    return r.status, dict((k.lower(), v) for k, v in r.getheaders()), parsed
+
+
+def sse(port, path, last_id=None):
+    """All events of an SSE stream until the server closes it."""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    h = {"Authorization": f"Bearer {API_KEY}"}
+    if last_id is not None:
+        h["Last-Event-ID"] = str(last_id)
+    conn.request("GET", path, headers=h)
+    r = conn.getresponse()
+    events, cur = [], {}
+    for line in r:
+        line = line.decode().rstrip("\n")
+        if not line:
+            if cur:
+                events.append(cur)
+            cur = {}
+        elif not line.startswith(":"):
+            k, v = line.split(": ", 1)
+            cur[k] = json.loads(v) if k == "data" else v
+    conn.close()
+    return r.getheader("Content-Type"), events
+
+
+def main():
+    tmp = tempfile.mkdtemp(prefix="http_test_")
+    backend = StubBackend(tmp)
+    api = HttpApi(backend.run_action, backend.output_path, api_key=API_KEY, threads=2, keepalive_s=0.5)
+    ready = threading.Event()
+    threading.Thread(target=lambda: asyncio.run(api.serve("127.0.0.1", 0, ready=ready.set)), daemon=True).start()
+    ready.wait(10)
+    port = api.port
+    results = []
+
+    # 1. Auth and health
+    results.append(check("health without auth", request(port, "GET", "/health", auth=False)[0] == 200))
+    results.append(check("auth required", request(port, "GET", "/v1/status?request_id=x", auth=False)[0] == 401))
+
+    # 2. Two async jobs; the second queues behind the GPU slot
+    code, _, a = request(port, "POST", "/v1/jobs", {"input": {"action": "generate"}})
+    _, _, b = request(port, "POST", "/v1/jobs", {"input": {"action": "generate"}})
+    results.append(check("submit", code == 202 and a["status"] in ("IN_QUEUE", "IN_PROGRESS"), str(a)))
+
+    # 3. Direct calls answer while the GPU job runs
+    t0 = time.time()
+    code, _, st = request(port, "GET", "/v1/status?request_id=abc")
+    results.append(check("status during GPU job", code == 200 and st["request_id"] == "abc" and time.time() - t0 < 0.5,
+                         f"{(time.time() - t0) * 1000:.0f}ms"))
+
+    # 4. SSE: progress then done
+    ctype, events = sse(port, f"/v1/jobs/{a['id']}/events")
+    kinds = [e["event"] for e in events]
+    progress = [e["data"]["step"] for e in events if e["event"] == "progress"]
+    results.append(check("sse stream", ctype == "text/event-stream" and kinds[-1] == "done"
+                         and progress == list(range(1, 11)) and events[-1]["data"]["status"] == "COMPLETED",
+                         f"{len(events)} events"))
+    _, replay = sse(port, f"/v1/jobs/{a['id']}/events", last_id=events[-3]["id"])
+    results.append(check("sse resume with Last-Event-ID", [e["id"] for e in replay] == [e["id"] for e in events[-2:]]))
+    code, _, job = request(port, "GET", f"/v1/jobs/{a['id']}")
+    results.append(check("job status", job["status"] == "COMPLETED" and job["output"]["request_id"] == f"r-{a['id']}"))
+
+    # 5. Cancel: with both job threads busy (b running, c waiting for the GPU), d is still
+    # queued and never starts; c is stopped through the cancel action once it runs
+    _, _, c = request(port, "POST", "/v1/jobs", {"input": {"action": "generate", "step_s": 0.5}})
+    _, _, d = request(port, "POST", "/v1/jobs", {"input": {"action": "generate"}})
+    code, _, dc = request(port, "POST", f"/v1/jobs/{d['id']}/cancel")
+    time.sleep(1.5)  # b finishes, c starts
+    code, _, cc = request(port, "POST", f"/v1/jobs/{c['id']}/cancel", {"wait_s": 5})
+    _, events = sse(port, f"/v1/jobs/{c['id']}/events")
+    results.append(check("cancel queued", dc["status"] == "CANCELLED" and dc["started_at"] is None))
+    results.append(check("cancel running", cc.get("cancelled") and events[-1]["data"]["status"] == "CANCELLED",
+                         events[-1]["data"]["status"]))
+
+    # 6. Output downloads with ranges
+    rid = f"r-{a['id']}"
+    with open(backend.outputs[rid], "rb") as f:
+        full = f.read()
+    code, h, body = request(port, "GET", f"/v1/outputs/{rid}")
+    results.append(check("full download", code == 200 and body == full and h["accept-ranges"] == "bytes"))
+    code, h, body = request(port, "GET", f"/v1/outputs/{rid}", headers={"Range": "bytes=1000-1999"})
+    results.append(check("range 206", code == 206 and body == full[1000:2000]
+                         and h["content-range"] == f"bytes 1000-1999/{len(full)}"))
+    code, h, body = request(port, "GET", f"/v1/outputs/{rid}/0", headers={"Range": "bytes=-100"})
+    results.append(check("suffix range", code == 206 and body == full[-100:]))
+    code, h, body = request(port, "GET", f"/v1/outputs/{rid}", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    results.append(check("stale If-Range gets full file", code == 200 and len(body) == len(full)))
+    code, h, _ = request(port, "GET", f"/v1/outputs/{rid}", headers={"Range": f"bytes={len(full)}-"})
+    results.append(check("416", code == 416 and h["content-range"] == f"bytes */{len(full)}"))
+    code, h, body = request(port, "HEAD", f"/v1/outputs/{rid}")
+    results.append(check("HEAD", code == 200 and int(h["content-length"]) == len(full) and not body))
+    results.append(check("unknown output", request(port, "GET", "/v1/outputs/nope")[0] == 404))
+    results.append(check("encoded traversal rejected",
+                         request(port, "GET", f"/v1/outputs/..%2F{rid}")[0] == 400
+                         and request(port, "GET", "/v1/outputs/%2E%2E")[0] == 400))
+
+    # 7. Keep-alive: several requests on one connection
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    codes = []
+    for _ in range(3):
+        conn.request("GET", "/v1/status?request_id=k", headers={"Authorization": f"Bearer {API_KEY}"})
+        r = conn.getresponse()
+        r.read()
+        codes.append(r.status)
+    conn.close()
+    results.append(check("keep-alive", codes == [200, 200, 200]))
+
+    # 8. No unauthenticated listener on a public address
+    try:
+        asyncio.run(HttpApi(backend.run_action, backend.output_path, api_key="").serve("0.0.0.0", 0))
+        refused = False
+    except ValueError:
+        refused = True
+    results.append(check("public bind needs an API key", refused))
+
+    if not all(results):
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Local check for the multi-GPU launcher (src/launcher.py): process count,
+ulysses/FSDP validation and the torchrun command line, for a range of
+simulated GPU counts. No GPU or torch needed.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from launcher import plan_launch, wrap_command, is_distributed, strip_rank_prefix  # noqa: E402
+
+CMD = ["python3", "/workspace/Wan2.2/generate.py", "--task", "t2v-A14B", "--size", "1280*720"]
+
+
+def check(name, ok, detail=""):
+    print(f"{'OK  ' if ok else 'FAIL'} {name} {detail}")
+    return ok
+
+
+def rejects(params, devices, mode="auto"):
+    try:
+        plan_launch(params, devices=devices, mode=mode, nproc=0)
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+def main():
+    t2v = {"task": "t2v-A14B", "t5_cpu": True}
+    results = []
+
+    p = plan_launch(t2v, devices=8, mode="auto", nproc=0)
+    results.append(check("single GPU by default", p["nproc"] == 1 and wrap_command(CMD, 1) == CMD))
+
+    p = plan_launch(dict(t2v, multi_gpu=True), devices=8, mode="auto", nproc=0)
+    results.append(check("multi_gpu recipe", p["nproc"] == 8 and p["ulysses_size"] == 8 and p["dit_fsdp"]
+                         and p["t5_fsdp"] and p["t5_cpu"] is False, str(p)))
+    results.append(check("plan is idempotent", plan_launch(p, devices=8, mode="auto", nproc=0) == p))
+
+    p = plan_launch(dict(t2v, multi_gpu=True), devices=3, mode="auto", nproc=0)
+    results.append(check("heads limit process count", p["nproc"] == 2 and p["ulysses_size"] == 2, str(p)))
+
+    p = plan_launch({"task": "ti2v-5B", "ulysses_size": 4}, devices=4, mode="auto", nproc=0)
+    results.append(check("explicit ulysses", p["nproc"] == 4 and "t5_fsdp" not in p, str(p)))
+
+    p = plan_launch(dict(t2v, dit_fsdp=True), devices=2, mode="auto", nproc=0)
+    results.append(check("fsdp only uses all GPUs", p["nproc"] == 2 and "ulysses_size" not in p, str(p)))
+
+    p = plan_launch(t2v, devices=1, mode="torchrun", nproc=0)
+    results.append(check("torchrun mode on one GPU runs single", p["nproc"] == 1))
+
+    for name, params, devices, mode in (
+        ("more GPUs than visible", dict(t2v, ulysses_size=4), 2, "auto"),
+        ("fsdp on one GPU", dict(t2v, t5_fsdp=True), 1, "auto"),
+        ("ulysses vs nproc", dict(t2v, ulysses_size=2, nproc=4), 4, "auto"),
+        ("heads not divisible", {"task": "ti2v-5B", "ulysses_size": 5}, 8, "auto"),
+        ("single mode", dict(t2v, multi_gpu=True), 8, "single"),
+    ):
+        err = rejects(params, devices, mode)
+        results.append(check(f"rejects {name}", err is not None, err or ""))
+
+    cmd = wrap_command(CMD, 4)
+    results.append(check("torchrun command", cmd[:8] == ["python3", "-m", "torch.distributed.run", "--standalone",
+                                                         "--nnodes", "1", "--nproc_per_node", "4"]
+                         and "--local-ranks-filter" in cmd and cmd[-len(CMD) + 1:] == CMD[1:]
+                         and is_distributed(cmd) and not is_distributed(CMD), " ".join(cmd)))
+    results.append(check("rank prefix stripped",
+                         strip_rank_prefix("[default0]: 45%|####| 18/40 [01:23<01:42,  4.65s/it]\n")
+                         == " 45%|####| 18/40 [01:23<01:42,  4.65s/it]\n"))
+
+    if not all(results):
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Local check for S3 output delivery (src/output_store.py) against a local
+S3: a moto server started in-process by default, or any S3-compatible
+endpoint (e.g. MinIO) with --endpoint. Checks single and multipart uploads,
+presigned downloads, the inline/URL decision, and the handler's status
+delivery=url path. No GPU or AWS account needed.
+
+Requires boto3, plus moto[server] unless --endpoint is given. moto is a
+test-only dependency and is not in requirements.txt:
+
+    pip install boto3 "moto[server]"
+    python3 scripts/test_output_store.py
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import urllib.request
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+
+def check(name, ok, detail=""):
+    print(f"{'OK  ' if ok else 'FAIL'} {name} {detail}")
+    return ok
+
+
+def get(url, headers=None):
+    with urllib.request.urlopen(urllib.request.Request(url, headers=headers or {}), timeout=30) as r:
+        return r.status, r.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="S3 output delivery check")
+    parser.add_argument("--endpoint", help="S3-compatible endpoint (default: start a local moto server)")
+    parser.add_argument("--bucket", default="wan22-test-outputs")
+    args = parser.parse_args()
+
+    # Before output_store is imported: 5 MB parts so a small file goes multipart
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "test")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "test")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ["S3_MULTIPART_CHUNK_MB"] = "5"
+    server = None
+    endpoint = args.endpoint
+    if endpoint is None:
+        import logging
+        from moto.server import ThreadedMotoServer
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        server = ThreadedMotoServer(ip_address="127.0.0.1", port=0, verbose=False)
+        server.start()
+        host, port = server.get_host_and_port()
+        endpoint = f"http://{host}:{port}"
+    tmp = tempfile.mkdtemp(prefix="s3_test_")
+    os.environ.update({
+        "S3_BUCKET": args.bucket, "S3_ENDPOINT_URL": endpoint, "S3_PREFIX": "test/",
+        "WAN_OUT_DIR": os.path.join(tmp, "out"), "JOB_DB_PATH": os.path.join(tmp, "jobs.sqlite3"),
+        "MODEL_CATALOG_PATH": os.path.join(tmp, "catalog.json"), "WAN_CKPT_DIR": tmp,
+        "RESULT_CACHE_DIR": os.path.join(tmp, "cache"), "JOB_LOG_DIR": os.path.join(tmp, "logs"),
+    })
+    sys.path.insert(0, SRC)
+    import output_store
+    from output_store import OutputStore, want_url
+
+    store = OutputStore()
+    try:
+        store.client.create_bucket(Bucket=args.bucket)
+    except store.client.exceptions.BucketAlreadyOwnedByYou:
+        pass
+    results = [check("store enabled", store.enabled and store.transfer is not None, endpoint)]
+
+    # 1. Small file: one PUT, content type from the extension
+    small = os.path.join(tmp, "small.mp4")
+    with open(small, "wb") as f:
+        f.write(os.urandom(64 << 10))
+    key = store.upload(small, store.object_key("job-small", small))
+    head = store.client.head_object(Bucket=args.bucket, Key=key)
+    results.append(check("upload", key == "test/job-small/small.mp4" and head["ContentType"] == "video/mp4"
+                         and head["ContentLength"] == 64 << 10))
+
+    # 2. Larger than the part size: multipart in parallel parts, in the background
+    big = os.path.join(tmp, "big.webm")
+    with open(big, "wb") as f:
+        for _ in range(12):
+            f.write(os.urandom(1 << 20))
+    with open(big, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    key = store.upload_async(big, store.object_key("job-big", big)).result(timeout=120)
+    head = store.client.head_object(Bucket=args.bucket, Key=key)
+    parts = head["ETag"].strip('"').partition("-")[2]
+    results.append(check("multipart upload", parts == "3" and head["ContentType"] == "video/webm",
+                         f"ETag {head['ETag']}"))
+
+    # 3. Presigned URL serves the same bytes, ranges included
+    entry = store.describe(key, big)
+    status, body = get(entry["url"])
+    results.append(check("presigned download", status == 200 and hashlib.sha256(body).hexdigest() == digest
+                         and entry["size"] == len(body) and entry["key"] == key))
+    status, part = get(entry["url"], {"Range": "bytes=100-199"})
+    results.append(check("presigned range", status == 206 and part == body[100:200]))
+
+    # 4. Inline vs URL decision
+    limit = output_store.RESPONSE_LIMIT_BYTES
+    results.append(check("want_url", want_url("auto", limit, store) and not want_url("auto", 1000, store)
+                         and want_url("url", 1, store) and not want_url("inline", limit * 2, store)
+                         and not want_url("url", 1, None)))
+
+    # 5. Handler: status with delivery=url uploads once, later calls only re-sign
+    import handler
+    handler._output_store = store
+    out = os.path.join(tmp, "out", "job-1.mp4")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "wb") as f:
+        f.write(os.urandom(256 << 10))
+    handler.JOBS.put("job-1", {"status": "COMPLETED", "outputs": [out]})
+    first = handler.run_action({"input": {"action": "status", "request_id": "job-1", "return_video": True,
+                                          "delivery": "url"}})
+    url = (first.get("result") or {}).get("url")
+    with open(out, "rb") as f:
+        results.append(check("status delivery=url", url is not None and get(url)[1] == f.read()
+                             and "data" not in first["result"], str(first.get("delivery_error") or "")))
+    # A second upload would replace this marker object with the file again
+    store.client.put_object(Bucket=args.bucket, Key="test/job-1/job-1.mp4", Body=b"marker")
+    second = handler.run_action({"input": {"action": "status", "request_id": "job-1", "return_video": True}})
+    results.append(check("status re-signs without re-uploading", get(second["result"]["url"])[1] == b"marker"))
+
+    if server is not None:
+        server.stop()
+    if not all(results):
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Peak-RSS regression check for inline result serialization (src/payload.py).
+Encodes a large synthetic file in a fresh interpreter and fails if peak RSS
+grows by more than the encoded size times the allowed factor.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+# Runs in a child process so each measurement starts from a clean heap
+CHILD = r"""
+import resource, sys
+sys.path.insert(0, sys.argv[1])
+def rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+if sys.argv[3] == "payload":
+    import payload
+    base = rss()
+    s = payload.data_uri(sys.argv[2], "video/mp4")
+else:
+    import base64
+    base = rss()
+    s = "data:video/mp4;base64," + base64.b64encode(open(sys.argv[2], "rb").read()).decode("utf-8")
+print(rss() - base, len(s))
+"""
+
+
+def measure(path, mode):
+    out = subprocess.run([sys.executable, "-c", CHILD, SRC, path, mode],
+                         capture_output=True, text=True, check=True).stdout.split()
+    return int(out[0]), int(out[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Peak-RSS check for base64 result encoding')
+    parser.add_argument('--size-mb', type=int, default=200, help='Synthetic file size (default: 200)')
+    parser.add_argument('--max-factor', type=float, default=1.3,
+                        help='Allowed peak growth as a multiple of the encoded size (default: 1.3)')
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as f:
+        block = os.urandom(1 << 20)
+        for _ in range(args.size_mb):
+            f.write(block)
+        path = f.name
+    try:
+        new_peak, encoded = measure(path, "payload")
+        old_peak, _ = measure(path, "naive")
+    finally:
+        os.unlink(path)
+
+    mb = 1 << 20
+    print(f"file: {args.size_mb} MB, encoded: {encoded / mb:.1f} MB")
+    print(f"naive  read+b64encode+decode+concat: peak +{old_peak / mb:.1f} MB ({old_peak / encoded:.2f}x)")
+    print(f"payload.data_uri (chunked):          peak +{new_peak / mb:.1f} MB ({new_peak / encoded:.2f}x)")
+    if new_peak > encoded * args.max_factor:
+        print(f"FAIL: peak exceeds {args.max_factor}x encoded size")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Local check for the persistent WAN worker (src/wan_worker.py) with the CPU
+stub pipeline: the IPC protocol (ping, streamed logs, results, stats),
+pipeline reuse across requests, LRU eviction past WAN_WORKER_MAX_PIPELINES,
+and respawn of a crashed worker by WorkerClient. No GPU needed.
+"""
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Client
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from wan_worker import (PipelineCache, StubPipelineFactory, WanWorker, WorkerClient, can_serve,  # noqa: E402
+                        parse_generate_argv, pipeline_key)
+
+
+def check(name, ok, detail=""):
+    print(f"{'OK  ' if ok else 'FAIL'} {name} {detail}")
+    return ok
+
+
+def argv(tmp, task="t2v-A14B", name="out", steps=3):
+    return ["--task", task, "--size", "832*480", "--ckpt_dir", f"/models/{task}", "--sample_steps", str(steps),
+            "--prompt", "a cat", "--save_file", os.path.join(tmp, f"{name}.mp4")]
+
+
+def call(conn, msg):
+    """Send one request; returns (final reply, streamed log lines)."""
+    conn.send(msg)
+    lines = []
+    while True:
+        reply = conn.recv()
+        if reply.get("type") != "log":
+            return reply, lines
+        lines.append((reply["stream"], reply["line"]))
+
+
+def main():
+    tmp = tempfile.mkdtemp(prefix="wan_worker_test_")
+    results = []
+
+    # 1. PipelineCache: least recently used pipeline goes first
+    factory = StubPipelineFactory()
+    cache = PipelineCache(factory, max_resident=2)
+    keys = {t: pipeline_key({"task": t}) for t in ("a", "b", "c")}
+    for t in ("a", "b", "a", "c"):
+        cache.get(keys[t], factory.parse_args(["--task", t]))
+    resident = [k["task"] for k in cache.keys()]
+    results.append(check("lru eviction", resident == ["a", "c"] and factory.releases == 1
+                         and cache.stats == {"hits": 1, "misses": 3, "evictions": 1}, f"{resident} {cache.stats}"))
+
+    # 1b. Routing: values that look like flags, and extra_args the worker cannot honour
+    dashed = argv(tmp)
+    dashed[dashed.index("--prompt") + 1] = "--neon sign, rain"
+    opts = parse_generate_argv(dashed + ["--t5_cpu"])
+    results.append(check("flag-like prompt", opts["prompt"] == "--neon sign, rain" and opts["t5_cpu"] is True
+                         and opts["save_file"].endswith("out.mp4"), opts["prompt"]))
+    results.append(check("extra_args go to the CLI", can_serve(argv(tmp)) and can_serve(dashed)
+                         and not can_serve(argv(tmp) + ["--lora_dir", "/x"])
+                         and not can_serve(argv(tmp) + ["--sample_steps", "8"])
+                         and not can_serve(argv(tmp) + ["stray"])))
+
+    # 2. Protocol against an in-process worker on a Unix socket
+    address = os.path.join(tmp, "worker.sock")
+    factory = StubPipelineFactory(load_s=0.3)
+    worker = WanWorker(factory, max_resident=1)
+    threading.Thread(target=worker.serve, args=(address, b"key"), daemon=True).start()
+    deadline = time.time() + 10
+    while not os.path.exists(address) and time.time() < deadline:
+        time.sleep(0.05)
+    conn = Client(address, authkey=b"key")
+    pong, _ = call(conn, {"op": "ping"})
+    results.append(check("ping", pong == {"type": "pong", "pid": os.getpid()}))
+
+    first, lines = call(conn, {"op": "generate", "argv": argv(tmp, name="a")})
+    second, _ = call(conn, {"op": "generate", "argv": argv(tmp, name="b")})
+    progress = [line for stream, line in lines if stream == "stderr" and "it/s" in line]
+    results.append(check("streamed logs", len(progress) == 3 and any("Generating video" in line for _, line in lines),
+                         f"{len(lines)} lines"))
+    results.append(check("result", first["returncode"] == 0 and os.path.isfile(first["save_file"])))
+    results.append(check("pipeline reused", not first["reused"] and second["reused"] and factory.builds == 1
+                         and second["load_s"] < 0.1, f"load {first['load_s']:.2f}s then {second['load_s']:.3f}s"))
+
+    other, _ = call(conn, {"op": "generate", "argv": argv(tmp, task="i2v-A14B", name="c")})
+    stats, _ = call(conn, {"op": "stats"})
+    results.append(check("new key evicts at capacity", other["returncode"] == 0 and not other["reused"]
+                         and factory.releases == 1 and [k["task"] for k in stats["resident"]] == ["i2v-A14B"]
+                         and stats["jobs"] == 3, str(stats)))
+    unsupported, _ = call(conn, {"op": "generate", "argv": argv(tmp, task="s2v-14B", name="d")})
+    results.append(check("unsupported task", unsupported.get("unsupported") is True))
+    results.append(check("unknown op", call(conn, {"op": "nope"})[0]["type"] == "error"))
+    results.append(check("shutdown", call(conn, {"op": "shutdown"})[0] == {"type": "bye"}))
+    conn.close()
+
+    # 3. WorkerClient starts a stub worker process and respawns it after a crash
+    os.environ["WAN_WORKER_STUB"] = "true"
+    client = WorkerClient(address=os.path.join(tmp, "client.sock"), python=sys.executable)
+    try:
+        ok = client.generate(argv(tmp, name="e"))
+        again = client.generate(argv(tmp, name="f"))
+        pid = client.request({"op": "ping"})["pid"]
+        results.append(check("client reuses worker", ok["returncode"] == 0 and again["reused"] and pid == client.proc.pid))
+        os.kill(pid, signal.SIGKILL)
+        client.proc.wait(10)
+        after = client.generate(argv(tmp, name="g"))
+        new_pid = client.request({"op": "ping"})["pid"]
+        results.append(check("crashed worker respawned", after["returncode"] == 0 and not after["reused"]
+                             and new_pid != pid, f"pid {pid} -> {new_pid}"))
+        client.request({"op": "shutdown"})
+        client.proc.wait(10)
+    finally:
+        client.kill()
+
+    if not all(results):
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
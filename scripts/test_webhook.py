@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Local check for completion webhooks (src/webhook.py). Runs a local HTTP
+receiver that verifies signatures and fails on purpose, then checks retries
+with backoff, permanent failures, that sending never blocks, and the
+handler's job.completed / job.failed payloads against a stub generate.py.
+No GPU needed.
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+SECRET = "test-secret"
+
+# Writes a small file to --save_file, or fails when the prompt is "fail"
+STUB_GENERATE = r"""
+import sys
+args = dict(zip(sys.argv[1::2], sys.argv[2::2]))
+print("Generating video ...", flush=True)
+if args.get("--prompt") == "fail":
+    print("RuntimeError: stub failure", file=sys.stderr)
+    sys.exit(1)
+with open(args["--save_file"], "wb") as f:
+    f.write(b"\x00" * 4096)
+"""
+
+
+class Receiver(BaseHTTPRequestHandler):
+    """/flaky answers 503 twice per delivery id, /gone 410, everything else 200."""
+    received = []
+    failures = {}
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        from webhook import verify
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        did = self.headers.get("X-Webhook-Id")
+        self.received.append({"path": self.path, "id": did, "at": time.monotonic(),
+                              "signed": verify(body, self.headers, SECRET), "body": json.loads(body)})
+        code = 200
+        if self.path == "/flaky" and self.failures.get(did, 0) < 2:
+            self.failures[did] = self.failures.get(did, 0) + 1
+            code = 503
+        elif self.path == "/gone":
+            code = 410
+        self.send_response(code)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+def check(name, ok, detail=""):
+    print(f"{'OK  ' if ok else 'FAIL'} {name} {detail}")
+    return ok
+
+
+def wait_for(pred, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if pred():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def main():
+    tmp = tempfile.mkdtemp(prefix="webhook_test_")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Receiver)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    # The local receiver is on loopback, which webhooks refuse unless allowlisted
+    os.environ["WEBHOOK_ALLOW_HOSTS"] = "127.0.0.1"
+    sys.path.insert(0, SRC)
+    from webhook import WebhookSender, validate_url
+    results = []
+
+    # 0. Receivers on loopback, private or metadata addresses are refused unless allowlisted
+    refused = []
+    for url in ("http://127.0.0.1:8080/h", "http://localhost/h", "http://10.1.2.3/h", "http://169.254.169.254/latest",
+                "http://[::1]/h", "http://[::ffff:192.168.0.1]/h", "http://0.0.0.0/h", "ftp://example.com/h"):
+        try:
+            validate_url(url, allow_hosts=())
+        except ValueError:
+            refused.append(url)
+    results.append(check("non-public receivers refused", len(refused) == 8, f"{len(refused)}/8"))
+    results.append(check("allowlist", validate_url(base, allow_hosts=("127.0.0.0/8",)) == base
+                         and validate_url("http://localhost/h", allow_hosts=("localhost",)) == "http://localhost/h"))
+
+    done = []
+    sender = WebhookSender(secret=SECRET, max_attempts=3, timeout_s=2,
+                           backoff=lambda a: 0.3 * 2 ** (a - 1), on_done=done.append)
+
+    # 1. Two 503s, then delivered; retries back off
+    t0 = time.monotonic()
+    d = sender.send(base + "/flaky", {"event": "job.completed", "n": 1}, job_id="a")
+    queued_s = time.monotonic() - t0
+    wait_for(lambda: sender.get(d["id"])["status"] != "pending")
+    hits = [r for r in Receiver.received if r["id"] == d["id"]]
+    gaps = [round(b["at"] - a["at"], 2) for a, b in zip(hits, hits[1:])]
+    results.append(check("send does not block", queued_s < 0.05, f"{queued_s * 1000:.1f}ms"))
+    results.append(check("retried until delivered", sender.get(d["id"])["status"] == "delivered" and len(hits) == 3
+                         and gaps[0] >= 0.3 and gaps[1] >= 0.6, f"gaps={gaps}"))
+    results.append(check("signed", all(h["signed"] for h in hits)))
+
+    # 2. 410 is final, an unreachable receiver gives up after max_attempts
+    g = sender.send(base + "/gone", {"event": "job.failed"}, job_id="b")
+    u = sender.send("http://127.0.0.1:9/unreachable", {"event": "job.failed"}, job_id="c")
+    wait_for(lambda: len(done) == 3)
+    results.append(check("4xx not retried", sender.get(g["id"])["attempts"] == 1
+                         and sender.get(g["id"])["status"] == "failed"))
+    results.append(check("gives up after max attempts", sender.get(u["id"])["attempts"] == 3
+                         and sender.get(u["id"])["status"] == "failed", str(sender.get(u["id"])["last_error"])))
+    results.append(check("on_done per delivery", len(done) == 3, sender.summary()))
+
+    # 3. Handler: completed and failed WAN jobs post URL/metadata payloads, never base64
+    wan_home = os.path.join(tmp, "wan")
+    ckpt = os.path.join(tmp, "models", "Wan2.2-T2V-A14B")
+    for p in (wan_home, os.path.join(ckpt, "high_noise_model"), os.path.join(ckpt, "low_noise_model")):
+        os.makedirs(p)
+    for f in ("models_t5_umt5-xxl-enc-bf16.pth", "Wan2.1_VAE.pth"):
+        open(os.path.join(ckpt, f), "w").close()
+    with open(os.path.join(wan_home, "generate.py"), "w") as f:
+        f.write(STUB_GENERATE)
+    os.environ.update({
+        "WAN_HOME": wan_home, "WAN_CKPT_DIR": os.path.dirname(ckpt), "WAN_OUT_DIR": os.path.join(tmp, "out"),
+        "WAN_PERSISTENT_WORKER": "false", "JOB_DB_PATH": os.path.join(tmp, "jobs.sqlite3"),
+        "MODEL_CATALOG_PATH": os.path.join(tmp, "catalog.json"), "COST_MODEL_PATH": os.path.join(tmp, "cost.json"),
+        "MEMORY_PROFILE_PATH": os.path.join(tmp, "mem.json"), "JOB_LOG_DIR": os.path.join(tmp, "logs"),
+        "RESULT_CACHE_DIR": os.path.join(tmp, "cache"), "ADMISSION_POLICY": "off", "WEBHOOK_SECRET": SECRET,
+    })
+    import handler
+
+    Receiver.received.clear()
+    job = {"action": "generate", "webhook_url": base + "/hook",
+           "params": {"task": "t2v-A14B", "size": "832*480", "prompt": "ok", "use_cache": False}}
+    ok = handler.run_action({"id": "job-ok", "input": job})
+    # webhook_url inside params works too
+    bad = handler.run_action({"id": "job-bad", "input": {"action": "generate", "params": dict(
+        job["params"], prompt="fail", webhook_url=base + "/hook")}})
+    wait_for(lambda: len(Receiver.received) == 2)
+    by_job = {r["body"]["job_id"]: r["body"] for r in Receiver.received}
+    okb, badb = by_job.get("job-ok", {}), by_job.get("job-bad", {})
+    results.append(check("job.completed", okb.get("event") == "job.completed" and okb.get("request_id") == ok["request_id"]
+                         and "data" not in json.dumps(okb["output"].get("result", {})), json.dumps(okb)[:200]))
+    results.append(check("job.failed", badb.get("event") == "job.failed"
+                         and badb["output"]["status"]["status"] == "ERROR", json.dumps(badb)[:200]))
+    wait_for(lambda: (handler.JOBS.get(ok["request_id"]) or {}).get("webhook", {}).get("status") == "delivered")
+    results.append(check("status shows delivery", ok.get("webhook", {}).get("status") == "pending"
+                         and handler.JOBS[ok["request_id"]].get("webhook", {}).get("status") == "delivered"))
+    results.append(check("bad url rejected up front", "error" in handler.run_action({"input": dict(job, webhook_url="ftp://x")})))
+
+    server.shutdown()
+    if not all(results):
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# Input Asset Fetcher Module
+# Resolves media inputs (images, audio, pose videos) given as URL, base64 /
+# data URI or local path into local files. Downloads go through one pooled
+# HTTP session into a content-addressed on-disk cache, so a URL or payload
+# seen before is never fetched or written twice.
+
+import os
+import time
+import base64
+import hashlib
+import binascii
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+ASSET_CACHE_DIR = os.environ.get("ASSET_CACHE_DIR", "/workspace/ref")
+ASSET_CACHE_MAX_BYTES = int(float(os.environ.get("ASSET_CACHE_MAX_GB", "5")) * (1 << 30))
+ASSET_FETCH_WORKERS = int(os.environ.get("ASSET_FETCH_WORKERS", "4"))
+
+DEFAULT_EXT = {"image": ".png", "audio": ".wav", "video": ".mp4"}
+
+# Blobs used this recently are never evicted (they may belong to a running job)
+EVICT_GRACE_S = 600
+# An eviction pass frees down to this fraction of the budget
+EVICT_LOW_WATER = 0.9
+
+
+class AssetFetcher:
+    """Pooled, deduplicating fetcher with a byte-budgeted content cache."""
+
+    def __init__(self, root=ASSET_CACHE_DIR, max_bytes=ASSET_CACHE_MAX_BYTES, workers=ASSET_FETCH_WORKERS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers * 2, max_retries=2)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="asset-fetch")
+        self.lock = threading.Lock()
+        self.inflight = {}
+        # Blob bytes on disk, tracked per new blob; None until the first scan
+        self.total = None
+        self.stats = {"downloads": 0, "url_hits": 0, "blob_hits": 0, "bytes_downloaded": 0}
+
+    # -- layout -----------------------------------------------------------
+
+    def _blob_path(self, digest, ext):
+        return os.path.join(self.root, "blobs", digest[:2], digest + ext)
+
+    def _url_index(self, url):
+        return os.path.join(self.root, "urls", hashlib.sha256(url.encode("utf-8")).hexdigest())
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _store_bytes(self, data, ext):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest, ext)
+        if os.path.exists(path):
+            self.stats["blob_hits"] += 1
+            self._touch(path)
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp-{threading.get_ident()}"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self._added(len(data))
+        return path
+
+    # -- sources ----------------------------------------------------------
+
+    def _download(self, url, kind):
+        index = self._url_index(url)
+        try:
+            with open(index) as f:
+                cached = f.read().strip()
+            if os.path.exists(cached):
+                self.stats["url_hits"] += 1
+                self._touch(cached)
+                return cached
+        except OSError:
+            pass
+
+        ext = os.path.splitext(url.split("?")[0])[1].lower() or DEFAULT_EXT.get(kind, "")
+        if len(ext) > 6:
+            ext = DEFAULT_EXT.get(kind, "")
+        os.makedirs(os.path.join(self.root, "blobs"), exist_ok=True)
+        tmp = os.path.join(self.root, "blobs", f".dl-{threading.get_ident()}-{time.time_ns()}")
+        h = hashlib.sha256()
+        size = 0
+        try:
+            with self.session.get(url, stream=True, timeout=120) as r:
+                r.raise_for_status()
+                with open(tmp, "wb") as f:
+                    for chunk in r.iter_content(1 << 20):
+                        f.write(chunk)
+                        h.update(chunk)
+                        size += len(chunk)
+            path = self._blob_path(h.hexdigest(), ext)
+            added = not os.path.exists(path)
+            if not added:
+                self.stats["blob_hits"] += 1
+                os.unlink(tmp)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+        self.stats["downloads"] += 1
+        self.stats["bytes_downloaded"] += size
+        os.makedirs(os.path.dirname(index), exist_ok=True)
+        with open(index, "w") as f:
+            f.write(path)
+        if added:
+            self._added(size)
+        return path
+
+    def _download_once(self, url, kind):
+        """Concurrent requests for the same URL share one download."""
+        with self.lock:
+            fut = self.inflight.get(url)
+            owner = fut is None
+            if owner:
+                fut = self.inflight[url] = Future()
+        if not owner:
+            return fut.result()
+        try:
+            fut.set_result(self._download(url, kind))
+        except BaseException as e:
+            fut.set_exception(e)
+        finally:
+            with self.lock:
+                self.inflight.pop(url, None)
+        return fut.result()
+
+    def fetch(self, value, kind="image"):
+        """
+        Resolve one input to a local file path.
+
+        Args:
+            value: http(s) URL, data URI / raw base64, or existing local path
+            kind: "image", "audio" or "video" (default file extension)
+
+        Returns:
+            local path, or None if the value cannot be resolved
+        """
+        if not value:
+            return None
+        if isinstance(value, bytes):
+            return self._store_bytes(value, DEFAULT_EXT.get(kind, ""))
+        value = str(value)
+        if value.startswith(("http://", "https://")):
+            return self._download_once(value, kind)
+        if value.startswith("data:"):
+            return self._store_bytes(base64.b64decode(value.split(",", 1)[1]), DEFAULT_EXT.get(kind, ""))
+        if os.path.exists(value):
+            return value
+        try:
+            return self._store_bytes(base64.b64decode(value, validate=True), DEFAULT_EXT.get(kind, ""))
+        except (binascii.Error, ValueError):
+            return None
+
+    def fetch_many(self, specs):
+        """
+        Resolve several inputs concurrently.
+
+        Args:
+            specs: {name: (value, kind)}
+
+        Returns:
+            {name: local path or None}; fetch errors propagate
+        """
+        futures = {name: self.pool.submit(self.fetch, value, kind) for name, (value, kind) in specs.items()}
+        return {name: fut.result() for name, fut in futures.items()}
+
+    # -- eviction ---------------------------------------------------------
+
+    def _added(self, size):
+        """Count a new blob; the blob tree is scanned only once the total passes the budget."""
+        with self.lock:
+            if self.total is not None:
+                self.total += size
+                if self.total <= self.max_bytes:
+                    return
+        self._evict()
+
+    def _evict(self):
+        blobs_dir = os.path.join(self.root, "blobs")
+        entries, total = [], 0
+        for shard in os.scandir(blobs_dir):
+            if not shard.is_dir():
+                continue
+            for e in os.scandir(shard.path):
+                if ".tmp-" in e.name:
+                    continue
+                st = e.stat()
+                entries.append((st.st_mtime, st.st_size, e.path))
+                total += st.st_size
+        if total > self.max_bytes:
+            cutoff = time.time() - EVICT_GRACE_S
+            for mtime, size, path in sorted(entries):
+                if total <= self.max_bytes * EVICT_LOW_WATER or mtime > cutoff:
+                    break
+                try:
+                    os.unlink(path)
+                    total -= size
+                except OSError:
+                    pass
+        with self.lock:
+            self.total = total
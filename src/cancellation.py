@@ -0,0 +1,224 @@
+# Cancellation Module
+# Per-job cancel tokens with deadlines, a registry so the `cancel` action can
+# reach a running job by request id or RunPod job id, SIGINT -> SIGTERM ->
+# SIGKILL escalation on a child's process group, and a check that the killed
+# processes no longer hold the GPU before the next job starts.
+
+import os
+import time
+import signal
+import subprocess
+import threading
+
+# Wait between escalation steps (SIGINT, SIGTERM, SIGKILL)
+CANCEL_GRACE_S = float(os.environ.get("CANCEL_GRACE_S", "10"))
+# Longest a cancelled job waits for its processes to leave the GPU
+CANCEL_GPU_FREE_TIMEOUT_S = float(os.environ.get("CANCEL_GPU_FREE_TIMEOUT_S", "60"))
+# Default per-job deadline in seconds (0 = none; requests may set "deadline_s")
+JOB_DEADLINE_S = float(os.environ.get("JOB_DEADLINE_S", "0"))
+
+
+class JobControl:
+    """
+    Cancel token for one job.
+
+    Args:
+        deadline_s: seconds after start() after which the job counts as
+            cancelled with reason "deadline" (None/0 = no deadline)
+        start: start the deadline clock now (else on start())
+    """
+
+    def __init__(self, deadline_s=None, start=True):
+        self.event = threading.Event()
+        self.done = threading.Event()
+        self.reason = None
+        self.deadline_s = float(deadline_s) if deadline_s else None
+        self.deadline = None
+        self.created = time.monotonic()
+        self.started = None
+        self.ids = set()
+        self.info = {}
+        if start:
+            self.start()
+
+    def start(self):
+        """Start the deadline clock (once); returns seconds spent queued before it."""
+        if self.started is None:
+            self.started = time.monotonic()
+            if self.deadline_s:
+                self.deadline = self.started + self.deadline_s
+        return self.started - self.created
+
+    def cancel(self, reason="cancelled"):
+        if not self.event.is_set():
+            self.reason = reason
+            self.event.set()
+
+    def check(self):
+        """The cancel reason ("cancelled", "deadline") or None while the job may run."""
+        if not self.event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline")
+        return self.reason if self.event.is_set() else None
+
+    def wait(self, timeout):
+        """Block up to timeout (or until the deadline); returns check()."""
+        if self.deadline is not None:
+            timeout = max(0.0, min(timeout, self.deadline - time.monotonic()))
+        self.event.wait(timeout)
+        return self.check()
+
+    def remaining(self):
+        return None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+
+
+class ControlRegistry:
+    """Running jobs' cancel tokens, addressable by any of their ids."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.controls = {}
+
+    def register(self, ids=(), deadline_s=None, start=True):
+        control = JobControl(deadline_s, start=start)
+        for i in ids:
+            self.alias(control, i)
+        return control
+
+    def alias(self, control, job_id):
+        if job_id:
+            with self.lock:
+                control.ids.add(str(job_id))
+                self.controls[str(job_id)] = control
+
+    def get(self, job_id):
+        with self.lock:
+            return self.controls.get(str(job_id))
+
+    def finish(self, control):
+        control.done.set()
+        with self.lock:
+            for i in control.ids:
+                if self.controls.get(i) is control:
+                    del self.controls[i]
+
+    def running(self):
+        with self.lock:
+            return sorted(self.controls)
+
+
+def _group_pids(pgid):
+    """Live (non-zombie) pids of a process group (Linux /proc)."""
+    pids = set()
+    for name in os.listdir("/proc") if os.path.isdir("/proc") else ():
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                # pgrp is the 5th field, after the parenthesised command name
+                fields = f.read().rsplit(")", 1)[1].split()
+            if int(fields[2]) == pgid and fields[0] != "Z":
+                pids.add(int(name))
+        except (OSError, IndexError, ValueError):
+            continue
+    return pids
+
+
+def terminate_group(proc, grace_s=CANCEL_GRACE_S):
+    """
+    Escalate SIGINT -> SIGTERM -> SIGKILL on the process group of a Popen
+    started with start_new_session=True, waiting grace_s after each signal.
+
+    Returns:
+        {"signal": last signal sent or None, "pids": processes that were in the group}
+    """
+    pids = _group_pids(proc.pid) | {proc.pid}
+    sent = None
+    for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGKILL):
+        if proc.poll() is not None and not (_group_pids(proc.pid) - {proc.pid}):
+            break
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            break
+        except PermissionError:
+            proc.send_signal(sig)
+        sent = sig.name
+        try:
+            proc.wait(timeout=grace_s)
+        except subprocess.TimeoutExpired:
+            continue
+        # The leader exited; give the rest of the group the same grace period
+        deadline = time.monotonic() + grace_s
+        while _group_pids(proc.pid) - {proc.pid} and time.monotonic() < deadline:
+            time.sleep(0.2)
+        if not (_group_pids(proc.pid) - {proc.pid}):
+            break
+    return {"signal": sent, "pids": sorted(pids)}
+
+
+def gpu_compute_pids():
+    """Pids with a CUDA context according to nvidia-smi (None when unavailable)."""
+    try:
+        out = subprocess.run(["nvidia-smi", "--query-compute-apps=pid", "--format=csv,noheader"],
+                             capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if out.returncode != 0:
+        return None
+    return {int(x) for x in out.stdout.split() if x.strip().isdigit()}
+
+
+def wait_gpu_released(pids, timeout=CANCEL_GPU_FREE_TIMEOUT_S, interval_s=1.0):
+    """
+    Wait until none of pids holds a CUDA context.
+
+    Returns:
+        True when released, False on timeout, None when nvidia-smi is unavailable
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        held = gpu_compute_pids()
+        if held is None:
+            return None
+        if not held & set(pids):
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(interval_s)
+
+
+class Watchdog:
+    """Calls on_cancel(reason) from a background thread once control is cancelled
+    or past its deadline, unless the with-block finishes first. Leaving the
+    block waits for a started on_cancel (e.g. the GPU release check) to finish."""
+
+    def __init__(self, control, on_cancel, interval_s=0.5):
+        self.control = control
+        self.on_cancel = on_cancel
+        self.interval_s = interval_s
+        self.stop = threading.Event()
+        self.fired = threading.Event()
+        self.thread = None
+
+    def _run(self):
+        while not self.stop.is_set():
+            reason = self.control.wait(self.interval_s)
+            if reason and not self.stop.is_set():
+                self.fired.set()
+                try:
+                    self.on_cancel(reason)
+                except Exception as e:
+                    print(f"[cancellation] stopping job failed: {e}")
+                return
+
+    def __enter__(self):
+        if self.control is not None:
+            self.thread = threading.Thread(target=self._run, daemon=True, name="job-watchdog")
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        if self.fired.is_set():
+            self.thread.join()
+        return False
@@ -8,6 +8,7 @@ import base64
 import time
 import requests
 import websocket
+from contextlib import nullcontext
 from io import BytesIO
 from urllib.parse import urlencode
 
@@ -146,6 +147,43 @@ class ComfyUIClient:
             print(f"Get image failed: {e}")
             return None
     
+    def download_output(self, filename, dest, subfolder="", folder_type="output"):
+        """
+        Stream an output file from ComfyUI straight to disk
+        
+        Args:
+            filename: name of the file
+            dest: local path to write
+            subfolder: subfolder path
+            folder_type: "output", "input", or "temp"
+            
+        Returns:
+            number of bytes written, or None on failure
+        """
+        params = {
+            "filename": filename,
+            "subfolder": subfolder,
+            "type": folder_type
+        }
+        url = f"{self.url}/view?{urlencode(params)}"
+        tmp = dest + ".part"
+        
+        try:
+            size = 0
+            with requests.get(url, timeout=60, stream=True) as response:
+                response.raise_for_status()
+                with open(tmp, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=1 << 20):
+                        f.write(chunk)
+                        size += len(chunk)
+            os.replace(tmp, dest)
+            return size
+        except Exception as e:
+            print(f"Download output failed: {e}")
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            return None
+    
     def get_available_models(self):
         """Get list of available models from ComfyUI"""
         try:
@@ -167,7 +205,56 @@ class ComfyUIClient:
         except Exception as e:
             return {"error": f"Get models failed: {str(e)}"}
     
-    def wait_for_completion(self, prompt_id, timeout=600, check_interval=2):
+    def get_queue(self):
+        """
+        Get the running and pending prompt ids
+        
+        Returns:
+            dict with "running" and "pending" lists of prompt ids
+        """
+        try:
+            response = requests.get(f"{self.url}/queue", timeout=10)
+            response.raise_for_status()
+            data = response.json()
+            return {
+                "running": [item[1] for item in data.get("queue_running", [])],
+                "pending": [item[1] for item in data.get("queue_pending", [])]
+            }
+        except Exception as e:
+            return {"error": f"Get queue failed: {str(e)}"}
+    
+    def cancel_prompt(self, prompt_id, timeout=60):
+        """
+        Stop a prompt: interrupt it if it is executing, delete it from the
+        queue, then wait until ComfyUI no longer runs it
+        
+        Args:
+            prompt_id: ID of the queued prompt
+            timeout: maximum time to wait for the GPU to be released
+            
+        Returns:
+            dict with "interrupted" and "released" flags
+        """
+        queue = self.get_queue()
+        interrupted = False
+        try:
+            if prompt_id in queue.get("running", []):
+                # Newer ComfyUI only interrupts when the given prompt is the one running
+                requests.post(f"{self.url}/interrupt", json={"prompt_id": prompt_id}, timeout=10).raise_for_status()
+                interrupted = True
+            requests.post(f"{self.url}/queue", json={"delete": [prompt_id]}, timeout=10).raise_for_status()
+        except Exception as e:
+            return {"interrupted": interrupted, "released": False, "error": f"Cancel failed: {str(e)}"}
+        
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            queue = self.get_queue()
+            if "error" not in queue and prompt_id not in queue["running"] + queue["pending"]:
+                return {"interrupted": interrupted, "released": True}
+            time.sleep(0.5)
+        return {"interrupted": interrupted, "released": False}
+    
+    def wait_for_completion(self, prompt_id, timeout=600, check_interval=2, cancel=None):
         """
         Wait for a prompt to complete execution
         
@@ -175,6 +262,8 @@ class ComfyUIClient:
             prompt_id: ID of the queued prompt
             timeout: maximum time to wait in seconds
             check_interval: how often to check status in seconds
+            cancel: optional callable returning a reason once the job should
+                stop ("cancelled", "deadline"); the prompt is then interrupted
             
         Returns:
             dict with execution results
@@ -182,6 +271,16 @@ class ComfyUIClient:
         start_time = time.time()
         
         while time.time() - start_time < timeout:
+            reason = cancel() if cancel else None
+            if reason:
+                return {
+                    "status": "cancelled",
+                    "reason": reason,
+                    "error": f"Execution stopped ({reason})",
+                    "prompt_id": prompt_id,
+                    **self.cancel_prompt(prompt_id)
+                }
+            
             history = self.get_history(prompt_id)
             
             if "error" in history:
@@ -208,25 +307,35 @@ class ComfyUIClient:
             
             time.sleep(check_interval)
         
+        # Do not leave the prompt running on the GPU in front of the next job
         return {
             "status": "timeout",
             "error": f"Execution did not complete within {timeout}s",
-            "prompt_id": prompt_id
+            "prompt_id": prompt_id,
+            **self.cancel_prompt(prompt_id)
         }
     
-    def execute_workflow(self, workflow, timeout=600):
+    def execute_workflow(self, workflow, timeout=600, timer=None, output_dir=None, rename=None, cancel=None):
         """
         Execute a complete workflow and wait for results
         
         Args:
             workflow: ComfyUI workflow dict
             timeout: maximum time to wait
+            timer: optional timings.StageTimer (records queue/wait/fetch stages)
+            output_dir: if set, outputs are streamed to files here and returned
+                with "path" instead of base64 "data"
+            rename: optional callable(filename) -> local file name in output_dir
+            cancel: optional callable returning a reason once the job should stop
             
         Returns:
             dict with results and output files
         """
+        stage = timer.stage if timer is not None else (lambda name: nullcontext())
+        
         # Queue the workflow
-        queue_result = self.queue_prompt(workflow)
+        with stage("comfyui_queue"):
+            queue_result = self.queue_prompt(workflow)
         
         if "error" in queue_result:
             return queue_result
@@ -236,7 +345,8 @@ class ComfyUIClient:
             return {"error": "No prompt_id returned from queue"}
         
         # Wait for completion
-        result = self.wait_for_completion(prompt_id, timeout)
+        with stage("comfyui_wait"):
+            result = self.wait_for_completion(prompt_id, timeout, cancel=cancel)
         
         if result.get("status") != "completed":
             return result
@@ -250,8 +360,23 @@ class ComfyUIClient:
                     subfolder = img_info.get("subfolder", "")
                     file_type = img_info.get("type", "output")
                     
+                    if output_dir:
+                        name = os.path.basename(rename(filename) if rename else filename)
+                        dest = os.path.join(output_dir, name)
+                        with stage("comfyui_fetch_outputs"):
+                            size = self.download_output(filename, dest, subfolder, file_type)
+                        if size is not None:
+                            outputs.append({
+                                "filename": name,
+                                "path": dest,
+                                "size": size,
+                                "node_id": node_id
+                            })
+                        continue
+                    
                     # Download the file
-                    file_data = self.get_image(filename, subfolder, file_type)
+                    with stage("comfyui_fetch_outputs"):
+                        file_data = self.get_image(filename, subfolder, file_type)
                     
                     if file_data:
                         outputs.append({
@@ -0,0 +1,447 @@
+# Cost Model Module
+# Predicts runtime and peak VRAM of a WAN generation from recorded per-job
+# stage timings, grouped per GPU type and (task, offload flags), with size,
+# frame count and sampling steps as regressors. Used by the `plan` action and
+# by admission control, which rejects or downgrades jobs that would not
+# finish within their deadline or would not fit in GPU memory.
+#
+# The observation file is shared by every worker on the volume: writes hold
+# an flock and merge into the file's current content instead of replacing it.
+
+import os
+import json
+import math
+import time
+import fcntl
+import statistics
+import subprocess
+import threading
+
+_default_path = ("/runpod-volume/cache/cost_model.json" if os.path.isdir("/runpod-volume")
+                 else "/workspace/outputs/cost_model.json")
+COST_MODEL_PATH = os.environ.get("COST_MODEL_PATH", _default_path)
+# Observations kept per GPU type and group (oldest dropped first)
+COST_MODEL_MAX_OBS = int(os.environ.get("COST_MODEL_MAX_OBS", "200"))
+COST_VRAM_SAMPLE_S = float(os.environ.get("COST_VRAM_SAMPLE_S", "1.0"))
+
+# generate.py defaults per task prefix, and how the VAE + patchify shrink a frame
+# (A14B/S2V/Animate: VAE stride 8 x patch 2 = 16 px per token; TI2V-5B: 16 x 2)
+TASK_SHAPES = {
+    "t2v": {"frame_num": 81, "sample_steps": 40, "px_per_token": 16},
+    "i2v": {"frame_num": 81, "sample_steps": 40, "px_per_token": 16},
+    "ti2v": {"frame_num": 121, "sample_steps": 50, "px_per_token": 32},
+    "s2v": {"frame_num": 80, "sample_steps": 40, "px_per_token": 16},
+    "animate": {"frame_num": 77, "sample_steps": 20, "px_per_token": 16},
+}
+
+# Rough single-GPU (H100-class) priors used until a GPU type has its own data:
+# fixed_s = spawn + model load + text encode, step_s = step_coef * (tokens/1e4)^step_exp,
+# decode_s = decode_per_mpx * megapixel-frames, vram_mb = vram_base + vram_per_token * tokens
+PRIORS = {
+    "t2v": {"fixed_s": 180.0, "step_coef": 2.4, "step_exp": 1.5, "decode_per_mpx": 0.8,
+            "vram_base": {True: 24000, False: 58000}, "vram_per_token": 0.15},
+    "i2v": {"fixed_s": 180.0, "step_coef": 2.4, "step_exp": 1.5, "decode_per_mpx": 0.8,
+            "vram_base": {True: 24000, False: 58000}, "vram_per_token": 0.15},
+    "ti2v": {"fixed_s": 60.0, "step_coef": 2.2, "step_exp": 1.5, "decode_per_mpx": 0.5,
+             "vram_base": {True: 12000, False: 22000}, "vram_per_token": 0.4},
+    "s2v": {"fixed_s": 200.0, "step_coef": 2.6, "step_exp": 1.5, "decode_per_mpx": 0.8,
+            "vram_base": {True: 28000, False: 60000}, "vram_per_token": 0.15},
+    "animate": {"fixed_s": 200.0, "step_coef": 2.6, "step_exp": 1.5, "decode_per_mpx": 0.8,
+                "vram_base": {True: 28000, False: 60000}, "vram_per_token": 0.15},
+}
+
+# Timing stages (timings.StageTimer names) that make up each cost component
+FIXED_STAGES = ("spawn", "model_load", "text_encode", "generate_other")
+DECODE_STAGES = ("vae_decode", "save_video")
+
+
+def _flag(v, default=True):
+    if v is None or v == "":
+        return default
+    return str(v).lower() in ("1", "true", "yes")
+
+
+def features(params):
+    """
+    Cost-relevant features of WAN job params (generate.py defaults filled in).
+
+    Returns:
+        dict with task, group, width, height, frame_num, sample_steps, tokens, mpx
+    """
+    task = str(params.get("task", "i2v-A14B")).strip() or "i2v-A14B"
+    prefix = task.lower().split("-", 1)[0]
+    shape = TASK_SHAPES.get(prefix, TASK_SHAPES["i2v"])
+    try:
+        w, h = (int(x) for x in str(params.get("size", "1280*720")).lower().replace("x", "*").split("*"))
+    except ValueError:
+        raise ValueError(f"Invalid size '{params.get('size')}', expected W*H")
+    frames = params.get("frame_num", params.get("num_frames", params.get("infer_frames")))
+    frames = int(frames) if frames not in (None, "") else shape["frame_num"]
+    steps = params.get("sample_steps")
+    steps = int(steps) if steps not in (None, "") else shape["sample_steps"]
+    offload = _flag(params.get("offload_model"))
+    t5_cpu = _flag(params.get("t5_cpu"))
+    nproc = int(params.get("nproc") or 1)
+    px = shape["px_per_token"]
+    tokens = ((max(1, frames) - 1) // 4 + 1) * math.ceil(h / px) * math.ceil(w / px)
+    return {
+        "task": task,
+        "prefix": prefix,
+        # Multi-GPU runs are timed separately; single-GPU groups keep their old names
+        "group": f"{task}|offload={offload}|t5_cpu={t5_cpu}" + (f"|gpus={nproc}" if nproc > 1 else ""),
+        "offload_model": offload,
+        "t5_cpu": t5_cpu,
+        "width": w,
+        "height": h,
+        "frame_num": frames,
+        "sample_steps": steps,
+        "tokens": tokens,
+        "mpx": w * h * frames / 1e6,
+    }
+
+
+_gpu = None
+
+
+def gpu_info():
+    """{"name", "total_mb"} of the first GPU via nvidia-smi (cached; name "unknown" without one)."""
+    global _gpu
+    if _gpu is None:
+        info = {"name": os.environ.get("COST_GPU_NAME") or "unknown", "total_mb": None}
+        try:
+            out = subprocess.run(["nvidia-smi", "--query-gpu=name,memory.total", "--format=csv,noheader,nounits"],
+                                 capture_output=True, text=True, timeout=10).stdout.strip().splitlines()
+            if out:
+                name, total = [x.strip() for x in out[0].split(",")[:2]]
+                info = {"name": os.environ.get("COST_GPU_NAME") or name, "total_mb": int(float(total))}
+        except (OSError, ValueError, subprocess.SubprocessError):
+            pass
+        _gpu = info
+    return _gpu
+
+
+def _gpu_used_mb():
+    try:
+        out = subprocess.run(["nvidia-smi", "--query-gpu=memory.used", "--format=csv,noheader,nounits"],
+                             capture_output=True, text=True, timeout=5).stdout.split()
+        # A multi-GPU job's peak is the fullest device
+        return max(int(float(x)) for x in out) if out else None
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+
+class VramMonitor:
+    """Samples GPU memory in use while a job runs; .peak_mb is the maximum seen (None without nvidia-smi)."""
+
+    def __init__(self, interval_s=COST_VRAM_SAMPLE_S, sample=_gpu_used_mb):
+        self.interval_s = interval_s
+        self.sample = sample
+        self.peak_mb = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _poll(self):
+        while True:
+            used = self.sample()
+            if used is not None:
+                self.peak_mb = max(self.peak_mb or 0, used)
+            if self._stop.wait(self.interval_s):
+                return
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._poll, daemon=True, name="vram-monitor")
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join(timeout=self.interval_s + 5)
+        return False
+
+
+def update_json(path, change):
+    """
+    Read-modify-write a JSON object file that several workers update.
+
+    Holds an flock on <path>.lock while the file is re-read, change(data) is
+    applied and the result atomically replaces it, so concurrent writers
+    merge instead of the last one winning.
+
+    Returns:
+        the updated data
+    Raises:
+        OSError when the file or its lock cannot be written
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        data = {}
+        if os.path.isfile(path):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except ValueError as e:
+                print(f"[cost_model] {path} is not valid JSON, rewriting it: {e}")
+        change(data)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    return data
+
+
+def _fit_line(xs, ys):
+    """Least-squares (intercept, slope); None with fewer than two distinct xs."""
+    if len(set(xs)) < 2:
+        return None
+    mx, my = statistics.fmean(xs), statistics.fmean(ys)
+    sxx = sum((x - mx) ** 2 for x in xs)
+    slope = sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / sxx
+    return my - slope * mx, slope
+
+
+class CostModel:
+    """
+    Runtime / peak-VRAM predictor fed by recorded job timings.
+
+    Args:
+        path: JSON file with observations per GPU type (None keeps them in memory)
+        max_obs: observations kept per GPU type and group
+    """
+
+    def __init__(self, path=COST_MODEL_PATH, max_obs=COST_MODEL_MAX_OBS):
+        self.path = path
+        self.max_obs = max_obs
+        self.lock = threading.Lock()
+        self.data = self._load()
+
+    def _load(self):
+        if not self.path or not os.path.isfile(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[cost_model] Could not read {self.path}: {e}")
+            return {}
+
+    def reload(self):
+        """Pick up observations other workers wrote since this one loaded the file."""
+        with self.lock:
+            self.data = self._load()
+
+    def _update(self, change):
+        # Caller holds self.lock; the file's current content wins over our copy
+        if self.path:
+            try:
+                self.data = update_json(self.path, change)
+                return
+            except OSError as e:
+                print(f"[cost_model] Could not write {self.path}: {e}")
+        change(self.data)
+
+    def record(self, params, stages, vram_mb=None, gpu=None, source="job"):
+        """
+        Add one finished generation.
+
+        Args:
+            params: the job's WAN params
+            stages: timings.StageTimer stages of the run (needs a "sampling" stage)
+            vram_mb: peak GPU memory in use during the run
+            source: "job" or "calibration"
+
+        Returns:
+            the stored observation, or None when the run has no sampling time
+        """
+        if not stages.get("sampling"):
+            return None
+        f = features(params)
+        obs = {
+            "t": time.time(),
+            "source": source,
+            "tokens": f["tokens"],
+            "mpx": f["mpx"],
+            "sample_steps": f["sample_steps"],
+            "fixed_s": round(sum(stages.get(s, 0.0) for s in FIXED_STAGES), 3),
+            "step_s": round(stages["sampling"] / max(1, f["sample_steps"]), 4),
+            "decode_s": round(sum(stages.get(s, 0.0) for s in DECODE_STAGES), 3),
+            "vram_mb": vram_mb,
+        }
+        gpu = gpu or gpu_info()["name"]
+
+        def add(data):
+            rows = data.setdefault(gpu, {}).setdefault(f["group"], [])
+            rows.append(obs)
+            del rows[:-self.max_obs]
+
+        with self.lock:
+            self._update(add)
+        return obs
+
+    def has_data(self, gpu=None):
+        gpu = gpu or gpu_info()["name"]
+        return any(self.data.get(gpu, {}).values())
+
+    def _prior(self, f):
+        p = PRIORS.get(f["prefix"], PRIORS["i2v"])
+        return {
+            "fixed_s": p["fixed_s"],
+            "step_s": p["step_coef"] * (f["tokens"] / 1e4) ** p["step_exp"],
+            "decode_s": p["decode_per_mpx"] * f["mpx"],
+            "vram_mb": p["vram_base"][f["offload_model"]] + p["vram_per_token"] * f["tokens"],
+        }
+
+    def _speed_factor(self, gpu):
+        """Geometric mean of observed/prior step time over all groups on this GPU."""
+        ratios = []
+        for group, rows in self.data.get(gpu, {}).items():
+            prefix = group.split("|", 1)[0].lower().split("-", 1)[0]
+            for o in rows[-20:]:
+                prior = self._prior({"prefix": prefix, "tokens": o["tokens"], "mpx": o["mpx"], "offload_model": True})
+                if o["step_s"] > 0 and prior["step_s"] > 0:
+                    ratios.append(math.log(o["step_s"] / prior["step_s"]))
+        return math.exp(statistics.fmean(ratios)) if ratios else None
+
+    def predict(self, params, gpu=None, count=1):
+        """
+        Estimated runtime and peak VRAM of a job (count > 1: a batch sharing one model load).
+
+        Returns:
+            {"runtime_s", "fixed_s", "sampling_s", "decode_s", "vram_mb", "source", "observations", "gpu"}
+            where source is "measured" (this GPU and group), "scaled" (priors scaled by this
+            GPU's measured speed) or "prior"
+        """
+        f = features(params)
+        gpu = gpu or gpu_info()["name"]
+        prior = self._prior(f)
+        with self.lock:
+            rows = list(self.data.get(gpu, {}).get(f["group"], []))
+            factor = self._speed_factor(gpu)
+
+        if rows:
+            source = "measured"
+            recent = rows[-50:]
+            fixed_s = statistics.median(o["fixed_s"] for o in recent)
+            logs = [(math.log(o["tokens"]), math.log(o["step_s"])) for o in recent if o["step_s"] > 0]
+            fit = _fit_line([x for x, _ in logs], [y for _, y in logs]) if logs else None
+            exp = PRIORS.get(f["prefix"], PRIORS["i2v"])["step_exp"]
+            if fit and 0.8 <= fit[1] <= 2.5:
+                step_s = math.exp(fit[0] + fit[1] * math.log(f["tokens"]))
+            elif logs:
+                a = statistics.fmean(y - exp * x for x, y in logs)
+                step_s = math.exp(a + exp * math.log(f["tokens"]))
+            else:
+                step_s = prior["step_s"] * (factor or 1.0)
+            per_mpx = [o["decode_s"] / o["mpx"] for o in recent if o["mpx"] > 0]
+            decode_s = statistics.median(per_mpx) * f["mpx"] if per_mpx else prior["decode_s"]
+            vram = [(o["tokens"], o["vram_mb"]) for o in recent if o.get("vram_mb")]
+            vfit = _fit_line([t for t, _ in vram], [v for _, v in vram]) if vram else None
+            if vfit and vfit[1] >= 0:
+                vram_mb = vfit[0] + vfit[1] * f["tokens"]
+            elif vram:
+                per_token = PRIORS.get(f["prefix"], PRIORS["i2v"])["vram_per_token"]
+                vram_mb = max(v for _, v in vram) + per_token * (f["tokens"] - max(t for t, _ in vram))
+            else:
+                vram_mb = prior["vram_mb"]
+        else:
+            source = "scaled" if factor else "prior"
+            factor = factor or 1.0
+            fixed_s = prior["fixed_s"] * factor
+            step_s = prior["step_s"] * factor
+            decode_s = prior["decode_s"] * factor
+            vram_mb = prior["vram_mb"]
+
+        sampling_s = step_s * f["sample_steps"]
+        runtime_s = fixed_s + count * (sampling_s + decode_s)
+        return {
+            "runtime_s": round(runtime_s, 1),
+            "fixed_s": round(fixed_s, 1),
+            "sampling_s": round(sampling_s, 1),
+            "step_s": round(step_s, 3),
+            "decode_s": round(decode_s, 1),
+            "vram_mb": int(vram_mb),
+            "tokens": f["tokens"],
+            "count": count,
+            "source": source,
+            "observations": len(rows),
+            "gpu": gpu,
+        }
+
+    def admit(self, params, deadline_s, policy="reject", count=1, gpu=None, margin=1.1, min_fraction=0.5):
+        """
+        Admission decision for a job against its deadline and GPU memory.
+
+        Args:
+            policy: "reject" fails jobs that do not fit, "downgrade" first lowers
+                sample_steps, then frame_num (down to min_fraction of the request)
+                and turns on model offload when VRAM is short, "off" only estimates
+            gpu: {"name", "total_mb"} (defaults to gpu_info())
+            margin: safety factor applied to the predicted runtime
+
+        Returns:
+            {"decision": "accept"|"downgrade"|"reject", "estimate", "deadline_s",
+             "changes": {param: new value}, "reason"}
+        """
+        gpu = gpu or gpu_info()
+        vram_total_mb = gpu["total_mb"]
+        gpu = gpu["name"]
+
+        def fits(est):
+            slow = deadline_s and est["runtime_s"] * margin > deadline_s
+            big = vram_total_mb and est["vram_mb"] > vram_total_mb * 0.95
+            return not slow and not big, slow, big
+
+        est = self.predict(params, gpu, count)
+        ok, slow, big = fits(est)
+        out = {"decision": "accept", "estimate": est, "deadline_s": deadline_s, "changes": {}, "reason": None}
+        if ok or policy == "off":
+            return out
+        reason = (f"predicted {est['runtime_s']:g}s x{margin:g} exceeds deadline {deadline_s:g}s" if slow
+                  else f"predicted peak VRAM {est['vram_mb']} MB exceeds GPU memory {vram_total_mb} MB")
+        # Priors alone are too rough to turn jobs away; only act on measured data
+        if est["source"] == "prior":
+            out["reason"] = f"{reason} (unmeasured GPU, accepted)"
+            return out
+        if policy == "downgrade":
+            f = features(params)
+            trial = dict(params, sample_steps=f["sample_steps"], frame_num=f["frame_num"])
+            trial.pop("num_frames", None)
+            if big and not f["offload_model"]:
+                trial["offload_model"] = True
+                trial["t5_cpu"] = True
+            min_steps = max(1, math.ceil(f["sample_steps"] * min_fraction))
+            min_frames = max(5, int(f["frame_num"] * min_fraction))
+            while True:
+                est = self.predict(trial, gpu, count)
+                ok, slow, big = fits(est)
+                if ok:
+                    changes = {k: trial[k] for k in ("sample_steps", "frame_num", "offload_model", "t5_cpu")
+                               if k in trial and features(trial)[k] != f[k]}
+                    return {"decision": "downgrade", "estimate": est, "deadline_s": deadline_s,
+                            "changes": changes, "reason": reason}
+                if trial["sample_steps"] > min_steps:
+                    trial["sample_steps"] = max(min_steps, int(trial["sample_steps"] * 0.9))
+                elif trial["frame_num"] - 4 >= min_frames:
+                    trial["frame_num"] -= 4  # generate.py wants 4n+1 frames
+                else:
+                    break
+        out.update(decision="reject", reason=reason)
+        return out
+
+    def summary(self, gpu=None):
+        """Per-group observation counts and current predictions at the group's last job."""
+        gpu = gpu or gpu_info()["name"]
+        out = {"gpu": gpu_info(), "speed_factor": None, "groups": {}}
+        factor = self._speed_factor(gpu)
+        out["speed_factor"] = round(factor, 3) if factor else None
+        for group, rows in self.data.get(gpu, {}).items():
+            if not rows:
+                continue
+            last = rows[-1]
+            out["groups"][group] = {
+                "observations": len(rows),
+                "calibration": sum(1 for o in rows if o.get("source") == "calibration"),
+                "last": {k: last.get(k) for k in ("tokens", "sample_steps", "fixed_s", "step_s", "decode_s", "vram_mb")},
+            }
+        out["other_gpus"] = sorted(g for g in self.data if g != gpu)
+        return out
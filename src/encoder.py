@@ -0,0 +1,130 @@
+# Output Encoding Module
+# Optional post-generation ffmpeg stage: faststart remux (moov atom first, no
+# re-encode) or re-encode to H.264/H.265/AV1/WebM at quality or bitrate
+# presets. Runs ffmpeg as a subprocess and replaces the output atomically.
+
+import os
+import time
+import shutil
+import subprocess
+
+FFMPEG = os.environ.get("FFMPEG_BIN", "ffmpeg")
+ENCODE_TIMEOUT_S = int(os.environ.get("ENCODE_TIMEOUT_S", "900"))
+# Applied when a request has no "encode" option: "" (off), "faststart" or a codec name
+DEFAULT_ENCODE = os.environ.get("WAN_DEFAULT_ENCODE", "").strip().lower()
+
+VIDEO_EXTS = (".mp4", ".mov", ".mkv", ".webm")
+
+CODECS = {
+    "copy": {"args": ["-c", "copy"], "ext": None},
+    "h264": {"args": ["-c:v", "libx264", "-pix_fmt", "yuv420p"], "ext": ".mp4", "preset": True},
+    "h265": {"args": ["-c:v", "libx265", "-pix_fmt", "yuv420p", "-tag:v", "hvc1"], "ext": ".mp4", "preset": True},
+    "av1": {"args": ["-c:v", "libsvtav1", "-pix_fmt", "yuv420p"], "ext": ".mp4"},
+    "webm": {"args": ["-c:v", "libvpx-vp9", "-pix_fmt", "yuv420p", "-row-mt", "1"], "ext": ".webm",
+             "audio": ["-c:a", "libopus"]},
+}
+CODEC_ALIASES = {"faststart": "copy", "remux": "copy", "x264": "h264", "avc": "h264",
+                 "x265": "h265", "hevc": "h265", "vp9": "webm"}
+
+# CRF per quality preset; scales differ per encoder
+QUALITY_CRF = {
+    "h264": {"high": 18, "medium": 23, "low": 28},
+    "h265": {"high": 22, "medium": 28, "low": 32},
+    "av1": {"high": 28, "medium": 35, "low": 42},
+    "webm": {"high": 24, "medium": 32, "low": 40},
+}
+
+
+def encode_spec(params):
+    """
+    Normalize a request's "encode" option.
+
+    Accepts a codec/preset string ("faststart", "h264", ...) or a dict with
+    codec, quality (high|medium|low), crf, bitrate (e.g. "4M") and preset.
+    Returns a canonical dict (part of the result cache key) or None.
+    """
+    raw = params.get("encode", DEFAULT_ENCODE) if params else DEFAULT_ENCODE
+    if not raw:
+        return None
+    if isinstance(raw, str):
+        raw = {"codec": raw}
+    if not isinstance(raw, dict):
+        raise ValueError("'encode' must be a codec name or an object")
+    codec = str(raw.get("codec", "h264")).lower()
+    codec = CODEC_ALIASES.get(codec, codec)
+    if codec not in CODECS:
+        raise ValueError(f"Unsupported encode codec '{codec}' (use {', '.join(sorted(CODECS))})")
+    spec = {"codec": codec}
+    if codec == "copy":
+        return spec
+    if raw.get("bitrate"):
+        spec["bitrate"] = str(raw["bitrate"])
+    else:
+        quality = str(raw.get("quality", "medium")).lower()
+        if quality not in QUALITY_CRF[codec]:
+            raise ValueError(f"Unsupported quality '{quality}' (use high, medium or low)")
+        spec["crf"] = int(raw.get("crf", QUALITY_CRF[codec][quality]))
+    if CODECS[codec].get("preset"):
+        spec["preset"] = str(raw.get("preset", "medium"))
+    return spec
+
+
+def output_path_for(src, spec):
+    ext = CODECS[spec["codec"]]["ext"] or os.path.splitext(src)[1]
+    return os.path.splitext(src)[0] + ext
+
+
+def build_ffmpeg_cmd(src, dst, spec):
+    """ffmpeg argv for one encode spec (pure; no I/O)."""
+    codec = CODECS[spec["codec"]]
+    cmd = [FFMPEG, "-hide_banner", "-loglevel", "error", "-y", "-i", src] + list(codec["args"])
+    if "crf" in spec:
+        cmd += ["-crf", str(spec["crf"])]
+        if spec["codec"] == "webm":
+            cmd += ["-b:v", "0"]
+    if "bitrate" in spec:
+        cmd += ["-b:v", spec["bitrate"]]
+    if "preset" in spec:
+        cmd += ["-preset", spec["preset"]]
+    if spec["codec"] != "copy":
+        cmd += codec.get("audio", ["-c:a", "aac"])
+    if codec["ext"] != ".webm" and os.path.splitext(dst)[1] in (".mp4", ".mov"):
+        cmd += ["-movflags", "+faststart"]
+    return cmd + [dst]
+
+
+def encode(src, spec, timeout=ENCODE_TIMEOUT_S):
+    """
+    Encode src per spec, replacing it on success.
+
+    Returns:
+        dict with path (may change extension), codec, byte counts, saved
+        bytes and seconds; on failure the original is kept and "error" is set
+    """
+    t0 = time.monotonic()
+    dst = output_path_for(src, spec)
+    base, ext = os.path.splitext(dst)
+    tmp = f"{base}.encoding{ext}"
+    bytes_in = os.path.getsize(src)
+    info = {"path": src, "codec": spec["codec"], "bytes_in": bytes_in}
+    if shutil.which(FFMPEG) is None and not os.path.exists(FFMPEG):
+        info["error"] = f"{FFMPEG} not found"
+        return info
+    try:
+        proc = subprocess.run(build_ffmpeg_cmd(src, tmp, spec), capture_output=True, text=True, timeout=timeout)
+        if proc.returncode != 0 or not os.path.exists(tmp):
+            info["error"] = (proc.stderr or "ffmpeg failed")[-2000:]
+            return info
+        os.replace(tmp, dst)
+        if dst != src:
+            os.unlink(src)
+    except subprocess.TimeoutExpired:
+        info["error"] = f"ffmpeg timed out after {timeout}s"
+        return info
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+    bytes_out = os.path.getsize(dst)
+    info.update({"path": dst, "bytes_out": bytes_out, "saved_bytes": bytes_in - bytes_out,
+                 "seconds": round(time.monotonic() - t0, 3)})
+    return info
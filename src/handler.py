@@ -1,5 +1,24 @@
-import os, io, json, time, base64, shutil, subprocess, uuid, requests, runpod, threading
-from comfyui_client import ComfyUIClient, create_i2v_workflow, create_s2v_workflow
+import time
+_IMPORT_STARTED = time.time()
+import os, sys, shutil, subprocess, uuid, hashlib, asyncio, threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from progress import ProgressTracker
+from result_cache import ResultCache, cache_key, file_digest
+from job_registry import JobRegistry
+from timings import StageTimer, TimingStats
+import encoder
+import prewarm
+import payload
+from encoder import VIDEO_EXTS
+from model_catalog import ModelCatalog
+from model_cache import ModelCache
+from startup import Readiness
+from cost_model import CostModel, VramMonitor, features, gpu_info
+from job_log import JobLog, read_log, parse_range
+from cancellation import ControlRegistry, JobControl, Watchdog, terminate_group, wait_gpu_released, JOB_DEADLINE_S
+from memory_profiles import MemoryProfiles, PROFILES, PROFILE_FLAGS, MEMORY_OOM_RETRIES, classify_error
+from launcher import plan_launch, wrap_command, is_distributed, strip_rank_prefix, visible_devices
 
 WAN_HOME = os.environ.get("WAN_HOME","/workspace/Wan2.2")
 WAN_CKPT_DIR = os.environ.get("WAN_CKPT_DIR","/workspace/models")
@@ -12,35 +31,146 @@ if not os.path.isdir(WAN_CKPT_DIR) and os.path.isdir("/runpod-volume"):
     WAN_CKPT_DIR = "/runpod-volume"
 OUT_DIR = os.environ.get("WAN_OUT_DIR","/workspace/outputs")
 os.makedirs(OUT_DIR, exist_ok=True)
+# Jobs the worker accepts at once. Only one GPU-bound job runs at a time (GPU_SLOT);
+# the other slots let status/health/stats/comfyui_models answer while it renders.
+HANDLER_CONCURRENCY = int(os.environ.get("RUNPOD_MAX_CONCURRENCY","4"))
+GPU_SLOT = threading.Semaphore(1)
+# Keep WAN pipelines resident in wan_worker.py instead of spawning generate.py per job
+WAN_PERSISTENT_WORKER = os.environ.get("WAN_PERSISTENT_WORKER","true").lower() in ("1","true","yes")
+# Minimum seconds between progress updates within one generation phase
+PROGRESS_INTERVAL_S = float(os.environ.get("WAN_PROGRESS_INTERVAL_S","2"))
+# runpod (serverless queue) or http (standalone API server, see http_server.py)
+WORKER_MODE = os.environ.get("WORKER_MODE","runpod").lower()
+# Stop the bootstrap page-cache prewarm once a GPU job needs the volume bandwidth
+PREWARM_CANCEL_ON_JOB = os.environ.get("PREWARM_CANCEL_ON_JOB","true").lower() in ("1","true","yes")
 
-# Initialize ComfyUI client
-comfyui_client = ComfyUIClient(f"http://{COMFYUI_HOST}:{COMFYUI_PORT}")
+# Component readiness and startup timeline; actions wait only for what they use
+STARTUP = Readiness()
+# Present while bootstrap.sh downloads WAN models in the background
+WAN_DOWNLOAD_PENDING = os.environ.get("WAN_DOWNLOAD_PENDING_FILE","/tmp/wan_download.pending")
+COMFYUI_PID_FILE = os.environ.get("COMFYUI_PID_FILE","/tmp/comfyui.pid")
 
-def _download_ref_image(inputs):
-    os.makedirs("/workspace/ref", exist_ok=True)
-    url = inputs.get("reference_image_url") or inputs.get("image_url")
-    if url:
-        import os as _os
-        ext = ".png"
-        try: ext = _os.path.splitext(url.split("?")[0])[1] or ".png"
-        except: pass
-        path = f"/workspace/ref/{uuid.uuid4().hex}{ext}"
-        with requests.get(url, stream=True, timeout=120) as r:
-            r.raise_for_status()
-            with open(path,"wb") as f:
-                for chunk in r.iter_content(8192): f.write(chunk)
-        return path
-    b64 = inputs.get("reference_image_base64") or inputs.get("image_base64")
-    if b64:
-        if "," in b64: b64 = b64.split(",",1)[1]
-        data = base64.b64decode(b64)
-        path = f"/workspace/ref/{uuid.uuid4().hex}.png"
-        open(path,"wb").write(data); return path
+# Model folders/files indexed at startup in the background (manifest cached on the volume)
+MODELS = ModelCatalog(WAN_CKPT_DIR, [os.path.join(COMFYUI_ROOT, "extra_model_paths.yaml")], COMFYUI_ROOT)
+
+# Local-disk copy of hot model folders/files in front of the network volume
+model_cache = ModelCache()
+
+# Runtime/VRAM predictions from recorded job timings, per GPU type
+COST = CostModel()
+# reject | downgrade | off (requests may override with "admission")
+ADMISSION_POLICY = os.environ.get("ADMISSION_POLICY","reject").lower()
+ADMISSION_MARGIN = float(os.environ.get("ADMISSION_MARGIN","1.1"))
+# auto: calibrate at startup only on a GPU type without recorded jobs; always | off
+COST_CALIBRATE = os.environ.get("COST_CALIBRATE","auto").lower()
+COST_CALIBRATE_TASK = os.environ.get("COST_CALIBRATE_TASK","")
+
+# Named offload/dtype profiles, OOM retry ladder and per-shape outcome records
+MEMORY = MemoryProfiles()
+
+# Cancel tokens of running GPU jobs, by request id and RunPod job id
+CONTROLS = ControlRegistry()
+_job_ctx = threading.local()
+
+def _current_control():
+    """Cancel token of the GPU job running on this thread (a never-cancelled one otherwise)."""
+    return getattr(_job_ctx, "control", None) or JobControl()
+
+# Job status when a job is stopped, by cancel reason
+STOPPED_STATUS = {"cancelled":"CANCELLED", "deadline":"TIMEOUT"}
+
+# Backend modules (ComfyUI client, HTTP fetcher, S3, WAN worker IPC) are imported
+# on first use so the handler's own import stays within its cold-start budget
+# (scripts/check_import_time.py)
+_comfyui_client = None
+_asset_fetcher = None
+_output_store = None
+_webhooks = None
+
+def _get_comfyui_client():
+    global _comfyui_client
+    if _comfyui_client is None:
+        from comfyui_client import ComfyUIClient
+        _comfyui_client = ComfyUIClient(f"http://{COMFYUI_HOST}:{COMFYUI_PORT}")
+    return _comfyui_client
+
+# Content-addressed cache of finished outputs (shared by WAN CLI and ComfyUI paths)
+result_cache = ResultCache()
+
+def _get_asset_fetcher():
+    """Pooled, content-addressed fetcher for reference images, audio and pose videos."""
+    global _asset_fetcher
+    if _asset_fetcher is None:
+        from asset_fetcher import AssetFetcher
+        _asset_fetcher = AssetFetcher()
+    return _asset_fetcher
+
+def _get_output_store():
+    """S3-compatible output backend; large results go out as presigned URLs."""
+    global _output_store
+    if _output_store is None:
+        from output_store import OutputStore
+        _output_store = OutputStore()
+    return _output_store
+
+def _get_webhooks():
+    """Background sender for completion webhooks (webhook_url)."""
+    global _webhooks
+    if _webhooks is None:
+        from webhook import WebhookSender
+        _webhooks = WebhookSender(on_done=_webhook_done)
+    return _webhooks
+
+def _webhook_done(delivery):
+    # Delivery outcome lands on the job record, so status shows it too
+    if delivery.get("job_id") and delivery["job_id"] in JOBS:
+        JOBS.update(delivery["job_id"], {"webhook":{k: delivery.get(k) for k in ("id","url","status","attempts","last_error")}})
+
+# Media inputs forwarded to generate.py as local paths, with the kind used for file extensions
+MEDIA_INPUT_KINDS = {"audio":"audio","tts_prompt_audio":"audio","pose_video":"video"}
+
+# Request keys that only locate the reference image; its content hash replaces them in cache keys
+IMAGE_INPUT_KEYS = ("reference_image_url","image_url","reference_image_base64","image_base64","reference_image_path","image_path")
+
+def _image_source(inputs):
+    """Reference image as URL/base64 (fetched), or an existing local path."""
+    v = (inputs.get("reference_image_url") or inputs.get("image_url")
+         or inputs.get("reference_image_base64") or inputs.get("image_base64"))
+    if v: return v
     p = inputs.get("reference_image_path") or inputs.get("image_path")
     if p and os.path.exists(p): return p
     return None
 
+def _download_ref_image(inputs):
+    return _get_asset_fetcher().fetch(_image_source(inputs), "image")
+
+def _fetch_inputs(params, need_image):
+    """Fetch the reference image and all media inputs of a job concurrently.
+    Each media key accepts a URL, data URI or local path, plus <key>_url / <key>_base64.
+    Returns (image_path, params with media inputs replaced by local paths).
+    """
+    specs = {}
+    if need_image:
+        specs["image"] = (_image_source(params), "image")
+    for k, kind in MEDIA_INPUT_KINDS.items():
+        v = params.get(f"{k}_url") or params.get(f"{k}_base64")
+        if not v and isinstance(params.get(k), str) and (
+                params[k].startswith(("http://","https://","data:")) or os.path.exists(params[k])):
+            v = params[k]
+        if v: specs[k] = (v, kind)
+    paths = _get_asset_fetcher().fetch_many(specs) if specs else {}
+    params = dict(params)
+    for k in MEDIA_INPUT_KINDS:
+        params.pop(f"{k}_url", None); params.pop(f"{k}_base64", None)
+        if k in specs:
+            if not paths.get(k):
+                raise ValueError(f"Could not resolve '{k}' input")
+            params[k] = paths[k]
+    return paths.get("image"), params
+
 def _build_cmd(args, image_path):
+    # Multi-GPU options resolve to a process count; retries may have reset t5_cpu
+    args = plan_launch(args)
     # Support selecting WAN task: default i2v-A14B; allow s2v-* from request
     task = str(args.get("task", "i2v-A14B")).strip() or "i2v-A14B"
     size = args.get("size","1280*720")
@@ -49,30 +179,9 @@ def _build_cmd(args, image_path):
     offload = str(args.get("offload_model","True"))
     t5_cpu = str(args.get("t5_cpu","True"))
 
-    # Determine the correct model directory based on task
-    # WAN expects ckpt_dir to point to the specific model folder (e.g., Wan2.2-T2V-A14B)
-    task_upper = task.upper()
-    if "T2V" in task_upper:
-        model_name = "Wan2.2-T2V-A14B"
-    elif "I2V" in task_upper:
-        model_name = "Wan2.2-I2V-A14B"
-    elif "S2V" in task_upper:
-        model_name = "Wan2.2-S2V-14B"
-    elif "TI2V" in task_upper:
-        model_name = "Wan2.2-TI2V-5B"
-    elif "ANIMATE" in task_upper:
-        model_name = "Wan2.2-Animate-14B"
-    else:
-        # Default to task name with capitalization
-        model_name = f"Wan2.2-{task}"
-    
-    # Construct full checkpoint directory path
-    model_ckpt_dir = os.path.join(WAN_CKPT_DIR, model_name)
-    
-    # If the model directory doesn't exist, try without the prefix
-    # (in case user already has it in the exact format)
-    if not os.path.isdir(model_ckpt_dir):
-        model_ckpt_dir = WAN_CKPT_DIR
+    # WAN expects ckpt_dir to point to the specific model folder (e.g., Wan2.2-T2V-A14B);
+    # raises ModelNotFoundError when no installed folder serves the task
+    model_ckpt_dir = model_cache.wan_path(MODELS.resolve(task)["path"])
 
     cmd = [
         "python3", f"{WAN_HOME}/generate.py",
@@ -160,10 +269,20 @@ def _build_cmd(args, image_path):
         # Guardrail: limit to 50 tokens to avoid abuse
         cmd += tokens[:50]
 
-    return cmd
+    return wrap_command(cmd, args["nproc"])
 
 def _progress(percent: int, status: str):
-    """Best-effort progress update across possible RunPod SDK shapes."""
+    """Best-effort progress update across possible RunPod SDK shapes, or to the
+    job's progress sink when run_action was given one (HTTP server mode)."""
+    sink = getattr(_job_ctx, "progress", None)
+    if sink is not None:
+        _emit_progress(sink, {"percent": percent, "message": status})
+        return
+    # The SDK is imported only by the serverless entry point (its import alone
+    # takes over a second); without it there is no RunPod job to report to
+    runpod = sys.modules.get("runpod")
+    if runpod is None:
+        return
     try:
         # Common signature in newer SDKs
         if hasattr(runpod.serverless, "progress_update"):
@@ -185,10 +304,51 @@ def _progress(percent: int, status: str):
         pass
 
 
-def _run_streaming(cmd, heartbeat_s: float = 5.0):
-    """Run command, stream stdout, and emit periodic progress heartbeats.
-    Returns (returncode, captured_stdout, captured_stderr).
+def _emit_progress(sink, snap):
+    try:
+        sink(snap)
+    except Exception:
+        # Never fail the job because of progress issues
+        pass
+
+
+def _new_tracker(job=None):
+    """ProgressTracker that reports via _progress and mirrors state into job."""
+    # Looked up now: the tracker emits from the output reader threads
+    sink = getattr(_job_ctx, "progress", None)
+
+    def emit(snap):
+        if sink is not None:
+            _emit_progress(sink, snap)
+        else:
+            _progress(snap["percent"], snap["message"])
+        if job is not None:
+            job["progress"] = snap
+    return ProgressTracker(emit=emit, min_interval_s=PROGRESS_INTERVAL_S)
+
+
+def _on_cancel(control, log, kill):
+    """Watchdog callback: stop the job's processes and wait until they leave the GPU."""
+    def stop(reason):
+        log.note(f"{reason}: stopping job")
+        info = kill() or {}
+        if info.get("pids"):
+            info["gpu_released"] = wait_gpu_released(info["pids"])
+        control.info.update(info)
+        log.note(f"stopped: {info}")
+    return stop
+
+
+def _run_streaming(cmd, heartbeat_s: float = 5.0, tracker=None, log=None, control=None):
+    """Run command, stream stdout/stderr into the progress tracker and the job
+    log, and emit periodic heartbeats while the process is silent. When control
+    is cancelled or passes its deadline, the process group is stopped.
+    Returns (returncode, stdout tail, stderr tail); the full output is in the log.
     """
+    tracker = tracker or _new_tracker()
+    log = log or JobLog()
+    # torchrun forwards rank 0's lines with a "[default0]:" prefix
+    distributed = is_distributed(cmd)
     p = subprocess.Popen(
         cmd,
         stdout=subprocess.PIPE,
@@ -197,129 +357,552 @@ def _run_streaming(cmd, heartbeat_s: float = 5.0):
         cwd=WAN_HOME,
         bufsize=1,
         universal_newlines=True,
+        # Own process group so cancellation reaches generate.py and its children
+        start_new_session=True,
     )
 
-    captured_out = []
-    captured_err = []
-    last_hb = time.time()
-    percent = 10
+    done = threading.Event()
 
     def read_stderr():
+        # tqdm writes its step bars here; universal newlines turns "\r" into lines
         try:
             for line in iter(p.stderr.readline, ""):
                 if not line:
                     break
-                captured_err.append(line)
+                if distributed:
+                    line = strip_rank_prefix(line)
+                log.write("stderr", line)
+                tracker.feed(line, "stderr")
         except Exception:
             pass
 
+    def heartbeat():
+        while not done.wait(heartbeat_s):
+            tracker.heartbeat()
+            log.flush()
+
     t_err = threading.Thread(target=read_stderr, daemon=True)
     t_err.start()
+    threading.Thread(target=heartbeat, daemon=True).start()
 
-    try:
-        for line in iter(p.stdout.readline, ""):
-            if not line:
-                if p.poll() is not None:
-                    break
-                continue
-            captured_out.append(line)
-
-            # Try to parse crude percent patterns like "xx%"
+    with Watchdog(control, _on_cancel(control, log, lambda: terminate_group(p))):
+        try:
+            for line in iter(p.stdout.readline, ""):
+                if not line:
+                    if p.poll() is not None:
+                        break
+                    continue
+                if distributed:
+                    line = strip_rank_prefix(line)
+                log.write("stdout", line)
+                tracker.feed(line, "stdout")
+        finally:
             try:
-                if "%" in line:
-                    # find last percentage number in line
-                    for tok in line.strip().split():
-                        if tok.endswith("%") and tok[:-1].isdigit():
-                            percent = max(percent, min(95, int(tok[:-1])))
-                            break
+                p.wait(timeout=600)
             except Exception:
                 pass
+            t_err.join(timeout=5)
+            done.set()
 
-            # Heartbeat
-            if time.time() - last_hb >= heartbeat_s:
-                _progress(percent, "Generating video...")
-                percent = min(95, percent + 3)
-                last_hb = time.time()
+    return p.returncode, log.tail("stdout"), log.tail("stderr")
 
-        # Ensure one last heartbeat if it took long without output
-        if time.time() - last_hb >= heartbeat_s:
-            _progress(percent, "Finalizing...")
-    finally:
+_wan_worker = None
+
+def _get_wan_worker():
+    global _wan_worker
+    if _wan_worker is None:
+        from wan_worker import WorkerClient
+        _wan_worker = WorkerClient()
+    return _wan_worker
+
+
+def _run_in_worker(cmd, heartbeat_s: float = 5.0, tracker=None, log=None, control=None):
+    """Run a generate.py command inside the persistent worker (stopped, and
+    restarted on the next job, when control is cancelled).
+    Returns (returncode, stdout tail, stderr tail), or None when the
+    worker declines the job and the caller should spawn generate.py instead.
+    """
+    tracker = tracker or _new_tracker()
+    log = log or JobLog()
+
+    def on_line(stream, line):
+        log.write(stream, line)
+        tracker.feed(line, stream)
+
+    def on_idle():
+        tracker.heartbeat()
+        log.flush()
+
+    worker = _get_wan_worker()
+    with Watchdog(control, _on_cancel(control, log, worker.kill)):
+        reply = worker.generate(cmd[2:], on_line=on_line, poll_s=heartbeat_s, on_idle=on_idle)
+    if reply.get("unsupported"):
+        return None
+    if reply.get("error"):
+        log.write("stderr", reply["error"] + "\n")
+    return reply.get("returncode", 1), log.tail("stdout"), log.tail("stderr")
+
+
+def _run_generate(cmd, heartbeat_s: float = 5.0, tracker=None, log=None, control=None, worker=True):
+    """Run a generate.py command, preferring the persistent worker unless worker=False."""
+    from wan_worker import can_serve
+    log = log or JobLog()
+    if worker and WAN_PERSISTENT_WORKER and not is_distributed(cmd) and can_serve(cmd[2:]):
         try:
-            p.wait(timeout=600)
-        except Exception:
-            pass
+            res = _run_in_worker(cmd, heartbeat_s, tracker, log, control)
+            if res is not None:
+                return res
+        except Exception as e:
+            # A cancelled job killed the worker on purpose; do not rerun it
+            if control is not None and control.check():
+                return -1, log.tail("stdout"), log.tail("stderr")
+            print(f"[handler] wan_worker unavailable, spawning generate.py: {e}")
+    return _run_streaming(cmd, heartbeat_s, tracker, log, control)
 
-    return p.returncode, "".join(captured_out), "".join(captured_err)
+def _job_dir(rid):
+    """Isolated scratch directory for one WAN job (never shared across jobs)."""
+    path = os.path.join(OUT_DIR, ".jobs", rid)
+    os.makedirs(path, exist_ok=True)
+    return path
 
-def _find_latest_mp4(base_dir):
+def _find_job_output(expected, job_dir):
+    """Locate the job's video by direct path, else the newest mp4 directly in job_dir."""
+    if expected and os.path.exists(expected):
+        return expected
     best, bestm = None, -1.0
-    for r,_,fs in os.walk(base_dir):
-        for f in fs:
-            if f.lower().endswith(".mp4"):
-                p = os.path.join(r,f); m=os.path.getmtime(p)
-                if m>bestm: best,bestm=p,m
+    try:
+        with os.scandir(job_dir) as it:
+            for e in it:
+                if e.is_file() and e.name.lower().endswith(".mp4"):
+                    m = e.stat().st_mtime
+                    if m > bestm: best, bestm = e.path, m
+    except FileNotFoundError:
+        pass
     return best
 
-JOBS = {}
+def _place_output(src, dst, keep_src=False):
+    """Put src at dst without copying file contents: rename, or hardlink when
+    the caller's own save_file must stay in place. Copies only across devices."""
+    if os.path.abspath(src) == os.path.abspath(dst):
+        return dst
+    if os.path.exists(dst):
+        os.unlink(dst)
+    if keep_src:
+        try:
+            os.link(src, dst)
+            return dst
+        except OSError:
+            shutil.copy2(src, dst)
+            return dst
+    try:
+        os.replace(src, dst)
+    except OSError:
+        shutil.move(src, dst)
+    return dst
+
+def _use_cache(params, seed_key="seed"):
+    """Only seeded requests are reproducible, so only those are cached."""
+    if str(params.get("use_cache", True)).lower() in ("0","false","no"):
+        return False
+    try:
+        return params.get(seed_key) is not None and int(params.get(seed_key)) >= 0
+    except (TypeError, ValueError):
+        return False
+
+def _wan_cache_key(params, img, spec=None):
+    if not _use_cache(params):
+        return None
+    norm = dict(params)
+    norm["task"] = str(norm.get("task","i2v-A14B")).strip() or "i2v-A14B"
+    norm.setdefault("size", "1280*720")
+    norm["encode"] = spec
+    assets = {}
+    if img:
+        assets["image"] = file_digest(img)
+    for k in ("audio","pose_video","tts_prompt_audio"):
+        if norm.get(k) and os.path.isfile(str(norm[k])):
+            assets[k] = file_digest(str(norm.pop(k)))
+    return cache_key("wan", norm, assets, drop=IMAGE_INPUT_KEYS)
+
+def _finish_timings(rid, timer, kind):
+    """Close out a job's stage timer: record it on the job and in worker aggregates."""
+    result = timer.result()
+    STAGE_STATS.record(result, kind)
+    JOBS.update(rid, {"timings": result})
+    return result
+
+def _video_mime(path):
+    return "video/webm" if path.lower().endswith(".webm") else "video/mp4"
+
+def _encode_outputs(paths, spec, timer):
+    """Run the optional ffmpeg stage over video outputs. Returns (paths, encoding report);
+    the report carries "error" when any file kept its original encoding."""
+    if not spec:
+        return paths, None
+    out, reports = [], []
+    with timer.stage("encode"):
+        for p in paths:
+            if not p.lower().endswith(VIDEO_EXTS):
+                out.append(p)
+                continue
+            info = encoder.encode(p, spec)
+            reports.append(info)
+            out.append(info["path"])
+    report = {"spec": spec, "files": reports,
+              "saved_bytes": sum(r.get("saved_bytes", 0) for r in reports)}
+    errors = [f"{os.path.basename(r['path'])}: {r['error']}" for r in reports if r.get("error")]
+    if errors:
+        report["error"] = "; ".join(errors)
+    return out, report
+
+def _start_uploads(rid, delivery, paths, inline):
+    """Begin background uploads when a result goes out as URLs.
+    delivery is "auto" (URLs once inline base64 would exceed the response limit),
+    "url" or "inline"; results that would not be inlined upload only on "url".
+    Returns {path: Future} or None for inline/path delivery.
+    """
+    if not inline and str(delivery or "").lower() != "url":
+        return None
+    from output_store import want_url
+    store = _get_output_store()
+    total = sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+    if not want_url(delivery, total, store):
+        return None
+    return {p: store.upload_async(p, store.object_key(rid, p)) for p in paths}
+
+def _finish_uploads(rid, uploads, timer):
+    """Wait for background uploads; returns ({path: url entry}, error or None)."""
+    urls = {}
+    with timer.stage("upload"):
+        try:
+            for p, fut in uploads.items():
+                urls[p] = _get_output_store().describe(fut.result(), p)
+        except Exception as e:
+            return None, f"Upload failed: {e}"
+    JOBS.update(rid, {"objects":{p: u["key"] for p, u in urls.items()}})
+    return urls, None
+
+def _wan_response(event, rid, dst, cache, timer, encoding=None, uploads=None):
+    res = {"request_id":rid,"status":JOBS[rid],"cache":cache}
+    if encoding:
+        res["encoding"] = encoding
+        if encoding.get("error"):
+            res["encode_error"] = encoding["error"]
+    urls = None
+    if uploads:
+        urls, error = _finish_uploads(rid, uploads, timer)
+        if error:
+            res["delivery_error"] = error
+    if urls:
+        res["result"] = urls[dst]
+    elif event.get("return_video", True):
+        with timer.stage("encode_base64"):
+            res["result"] = {"filename":os.path.basename(dst),"data":payload.data_uri(dst, _video_mime(dst))}
+    else:
+        res["result_path"] = dst
+    res["timings"] = _finish_timings(rid, timer, "wan")
+    return res
+
+# Job status index: bounded in memory, persisted to SQLite on the volume
+JOBS = JobRegistry()
+
+# Per-stage timing aggregates over all jobs handled by this worker
+STAGE_STATS = TimingStats()
+
+def _admit(event, params, count=1):
+    """Admission control against the job deadline and GPU memory.
+    Returns (params with any downgrade applied, admission report).
+    Raises ValueError for params the cost model cannot read (e.g. a bad size).
+    """
+    params = dict(params)
+    # Scheduling knobs never reach the command line or the cache key
+    policy, deadline = params.pop("admission", None), params.pop("deadline_s", None)
+    policy = str(event.get("admission") or policy or ADMISSION_POLICY).lower()
+    # Same deadline the watchdog enforces (_job_deadline); without one every job is admitted
+    deadline = float(event.get("deadline_s") or deadline or JOB_DEADLINE_S)
+    if not deadline:
+        policy = "off"
+    report = COST.admit(params, deadline, policy, count=count, margin=ADMISSION_MARGIN)
+    report["policy"] = policy
+    if report["decision"] == "downgrade":
+        params.pop("num_frames", None)
+        params.update(report["changes"])
+        if any(k in report["changes"] for k in PROFILE_FLAGS):
+            params = MEMORY.apply(params, "custom")
+    return params, report
+
+def _memory_profile(params):
+    """Params with the job's starting memory profile and GPU count applied
+    (see memory_profiles.py and launcher.py)."""
+    return plan_launch(MEMORY.apply(params, MEMORY.choose(params)))
 
 def handle_request(event):
     rid = str(uuid.uuid4())
+    timer = StageTimer()
     params = event.get("params") or event.get("inputs") or {}
     task = str(params.get("task","i2v-A14B")).strip() or "i2v-A14B"
-    img = None
-    if task.lower().startswith("i2v"):
-        img = _download_ref_image(params)
-        if not img:
-            return {"error":"Missing reference image (url/base64/path) for i2v task."}
-    JOBS[rid] = {"status":"RUNNING","started":time.time()}
-    _progress(5, "Starting generation...")
-    # Prefer directing WAN to save into our outputs dir
     try:
-        os.makedirs(OUT_DIR, exist_ok=True)
-    except Exception:
-        pass
+        MODELS.resolve(task)
+        params, admission = _admit(event, _memory_profile(params))
+    except ValueError as e:
+        return {"error":str(e)}
+    if admission["decision"] == "reject":
+        return {"error":f"Rejected by admission control: {admission['reason']}", "admission":admission}
+    try:
+        with timer.stage("input_fetch"):
+            img, params = _fetch_inputs(params, task.lower().startswith("i2v"))
+    except Exception as e:
+        return {"error":f"Input fetch failed: {e}"}
+    if task.lower().startswith("i2v") and not img:
+        return {"error":"Missing reference image (url/base64/path) for i2v task."}
+    res = _generate_one(event, rid, task, params, img, timer)
+    res["admission"] = admission
+    return res
+
+def _delivery(event, params):
+    """Requested result delivery mode (auto|url|inline), top level or in params."""
+    return event.get("delivery") or params.get("delivery") or "auto"
+
+def _generate_one(event, rid, task, params, img, timer):
+    """Run one WAN generation with already-fetched inputs and build its response."""
     dst = os.path.join(OUT_DIR, f"{rid}.mp4")
-    # do not override if user explicitly set save_file
+    try:
+        spec = encoder.encode_spec(params)
+    except ValueError as e:
+        return {"error":str(e)}
+    with timer.stage("cache_lookup"):
+        key = _wan_cache_key(params, img, spec)
+        hit = key and result_cache.get(key, OUT_DIR, rename=lambda n: rid + os.path.splitext(n)[1])
+    if hit:
+        dst = hit[0]
+        now = time.time()
+        JOBS.put(rid, {"status":"COMPLETED","started":now,"completed_at":now,"params_hash":key,"outputs":[dst]})
+        _progress(100, "Completed (cached)")
+        uploads = _start_uploads(rid, _delivery(event, params), [dst], event.get("return_video", True))
+        return _wan_response(event, rid, dst, result_cache.stats(key, True), timer, uploads=uploads)
+    JOBS.put(rid, {"status":"RUNNING","started":time.time(),"task":task,"params_hash":cache_key("wan", params, drop=IMAGE_INPUT_KEYS)})
+    _progress(5, "Starting generation...")
+    # Each job writes into its own directory so outputs never mix across jobs
+    job_dir = _job_dir(rid)
+    # do not override if user explicitly set save_file (relative paths stay in the job dir)
     params = dict(params)
-    params.setdefault("save_file", dst)
-    code,out,err = _run_streaming(_build_cmd(params, img))
+    user_save = params.get("save_file")
+    if user_save and not os.path.isabs(str(user_save)):
+        params["save_file"] = os.path.join(job_dir, str(user_save))
+    params.setdefault("save_file", os.path.join(job_dir, f"{rid}.mp4"))
+    # Full output goes to a compressed per-job log (see the "log" action); only tails stay in memory
+    log = JobLog(rid)
+    control = _current_control()
+    CONTROLS.alias(control, rid)
+    # CUDA OOM retries with the next, more aggressive memory profile
+    attempts = []
+    requested_frames = features(params)["frame_num"]
+    while True:
+        if control.check():
+            code, err, error_class = -1, log.tail("stderr"), control.check()
+            break
+        tracker = _new_tracker(JOBS[rid])
+        run = StageTimer()
+        log.note(f"attempt {len(attempts) + 1}, memory profile {params.get('memory_profile')}")
+        with VramMonitor() as vram, run.stage("generate"):
+            # extra_args are passed to generate.py as-is; only the real CLI runs them
+            code,out,err = _run_generate(_build_cmd(params, img), tracker=tracker, log=log, control=control,
+                                         worker=not params.get("extra_args"))
+        throughput = tracker.summary()
+        run.add_phases(throughput, within="generate")
+        for name, seconds in run.stages.items():
+            timer.add(name, seconds)
+        error_class = (code != 0 and control.check()) or classify_error(code, err)
+        attempts.append({"profile":params.get("memory_profile"), "returncode":code, "error_class":error_class,
+                         "peak_vram_mb":vram.peak_mb})
+        JOBS.update(rid, {"throughput":throughput, "memory":{"profile":params.get("memory_profile"), "attempts":attempts}})
+        if code==0:
+            COST.record(params, run.stages, vram.peak_mb)
+            MEMORY.record(params, ok=True)
+            break
+        if error_class != "oom":
+            break
+        MEMORY.record(params, ok=False)
+        nxt = MEMORY.next_profile(params)
+        if nxt is None or len(attempts) > MEMORY_OOM_RETRIES:
+            break
+        print(f"[handler] {rid}: CUDA OOM with memory profile {params.get('memory_profile')}, retrying with {nxt}")
+        _progress(5, f"Out of GPU memory, retrying with memory profile {nxt}...")
+        params = plan_launch(MEMORY.apply(params, nxt))
+    log.close()
+    JOBS.update(rid, {"log":log.summary()})
     if code!=0:
-        JOBS[rid].update({"status":"ERROR","completed_at":time.time(),"error":err[-4000:]})
-        return {"request_id":rid, "status":JOBS[rid]}
-    mp4 = dst if os.path.exists(dst) else _find_latest_mp4(WAN_HOME)
+        shutil.rmtree(job_dir, ignore_errors=True)
+        status = STOPPED_STATUS.get(error_class, "ERROR")
+        JOBS.update(rid, {"status":status,"completed_at":time.time(),"error":err[-4000:],"error_class":error_class})
+        if status != "ERROR":
+            JOBS.update(rid, {"cancel":dict(control.info, reason=error_class)})
+        return {"request_id":rid, "status":JOBS[rid], "cache":result_cache.stats(key), "timings":_finish_timings(rid, timer, "wan")}
+    mp4 = _find_job_output(params["save_file"], job_dir)
     if mp4:
-        os.makedirs(OUT_DIR, exist_ok=True)
-        dst = os.path.join(OUT_DIR, f"{rid}.mp4")
-        shutil.copy2(mp4, dst)
-        JOBS[rid].update({"status":"COMPLETED","completed_at":time.time(),"outputs":[dst]})
-        _progress(100, "Completed")
-        if event.get("return_video", True):
-            b64 = base64.b64encode(open(dst,"rb").read()).decode("utf-8")
-            return {"request_id":rid,"status":JOBS[rid],"result":{"filename":os.path.basename(dst),"data":"data:video/mp4;base64,"+b64}}
-        return {"request_id":rid,"status":JOBS[rid],"result_path":dst}
-    JOBS[rid].update({"status":"NO_OUTPUT","completed_at":time.time()})
-    return {"request_id":rid,"status":JOBS[rid]}
+        with timer.stage("output_place"):
+            _place_output(mp4, dst, keep_src=bool(user_save) and os.path.isabs(str(user_save)))
+            shutil.rmtree(job_dir, ignore_errors=True)
+        (dst,), encoding = _encode_outputs([dst], spec, timer)
+        # Upload runs in the background while the job is finalized and cached
+        uploads = _start_uploads(rid, _delivery(event, params), [dst], event.get("return_video", True))
+        JOBS.update(rid, {"status":"COMPLETED","completed_at":time.time(),"outputs":[dst]})
+        # A profile that shortened the clip, or a failed encode, does not produce what the key describes
+        if not PROFILES.get(params.get("memory_profile"), {}).get("frame_scale") and not (encoding or {}).get("error"):
+            with timer.stage("cache_store"):
+                result_cache.put(key, [dst], {"task":task})
+        # Final snapshot: 100%, ETA 0, mirrored into the job record
+        tracker.finish()
+        res = _wan_response(event, rid, dst, result_cache.stats(key), timer, encoding, uploads)
+        if PROFILES.get(params.get("memory_profile"), {}).get("frame_scale"):
+            res["frames_reduced"] = {"requested": requested_frames, "frame_num": params["frame_num"],
+                                     "memory_profile": params["memory_profile"]}
+        return res
+    shutil.rmtree(job_dir, ignore_errors=True)
+    JOBS.update(rid, {"status":"NO_OUTPUT","completed_at":time.time()})
+    return {"request_id":rid,"status":JOBS[rid],"cache":result_cache.stats(key),"timings":_finish_timings(rid, timer, "wan")}
+
+# Per-item keys a batch may vary; everything else (task, size, sampler settings) is shared
+BATCH_ITEM_KEYS = {"prompt","seed","save_file"} | set(IMAGE_INPUT_KEYS) | {
+    f"{k}{suffix}" for k in MEDIA_INPUT_KINDS for suffix in ("","_url","_base64")}
+BATCH_MAX_ITEMS = int(os.environ.get("WAN_BATCH_MAX_ITEMS","32"))
+
+def handle_batch(event):
+    """Generate several prompt/seed/image variants that share task, size and
+    sampler settings. Items run back to back on the persistent worker, so the
+    pipeline is loaded once for the whole batch; inputs are fetched up front.
+    """
+    batch_id = str(uuid.uuid4())
+    params = dict(event.get("params") or event.get("inputs") or {})
+    items = params.pop("items", None)
+    if not isinstance(items, list) or not items:
+        return {"error":"Missing 'items' list for batch"}
+    if len(items) > BATCH_MAX_ITEMS:
+        return {"error":f"Too many items ({len(items)} > {BATCH_MAX_ITEMS})"}
+    task = str(params.get("task","i2v-A14B")).strip() or "i2v-A14B"
+    params["task"] = task
+    try:
+        MODELS.resolve(task)
+        params, admission = _admit(event, _memory_profile(params), count=len(items))
+    except ValueError as e:
+        return {"error":str(e)}
+    if admission["decision"] == "reject":
+        return {"error":f"Rejected by admission control: {admission['reason']}", "admission":admission}
+
+    def prepare(item):
+        if not isinstance(item, dict):
+            raise ValueError("Batch item must be an object")
+        extra = set(item) - BATCH_ITEM_KEYS
+        if extra:
+            raise ValueError(f"Batch items may only set {sorted(BATCH_ITEM_KEYS)}; got {sorted(extra)}")
+        img, merged = _fetch_inputs({**params, **item}, task.lower().startswith("i2v"))
+        if task.lower().startswith("i2v") and not img:
+            raise ValueError("Missing reference image (url/base64/path) for i2v task.")
+        return img, merged
+
+    t_fetch = StageTimer()
+    with t_fetch.stage("input_fetch"), ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(prepare, item) for item in items]
+        prepared = []
+        for fut in futures:
+            try:
+                prepared.append(fut.result())
+            except Exception as e:
+                prepared.append(e)
+
+    # Inline videos for a whole batch get large; return paths unless asked
+    item_event = {"return_video": event.get("return_video", False), "delivery": _delivery(event, params)}
+    results = []
+    control = _current_control()
+    for i, prep in enumerate(prepared):
+        _progress(int(100 * i / len(items)), f"Batch item {i + 1}/{len(items)}")
+        if control.check():
+            results.append({"index":i, "error":f"Batch stopped ({control.check()})"})
+            continue
+        if isinstance(prep, Exception):
+            results.append({"index":i, "error":str(prep)})
+            continue
+        rid = str(uuid.uuid4())
+        timer = StageTimer()
+        timer.add("input_fetch", t_fetch.stages["input_fetch"] / len(items))
+        try:
+            res = _generate_one(item_event, rid, task, prep[1], prep[0], timer)
+        except Exception as e:
+            res = {"request_id":rid, "error":f"{type(e).__name__}: {e}"}
+        res["index"] = i
+        results.append(res)
+    failed = sum(1 for r in results if r.get("error") or (isinstance(r.get("status"), dict) and r["status"].get("status") != "COMPLETED"))
+    return {"batch_id":batch_id, "count":len(items), "failed":failed, "results":results, "admission":admission}
+
+def _plain_rid(rid):
+    """True for an id that is a single file name, safe to build OUT_DIR paths from."""
+    return bool(rid) and os.path.basename(rid) == rid and rid not in (".","..") and "\0" not in rid
+
+def _lookup_jobs(rids):
+    """Registry lookup; outputs written before the index existed are still found
+    (reported, not added to the registry)."""
+    found = JOBS.get_many(rids)
+    for rid, st in found.items():
+        if st is None and _plain_rid(rid):
+            p = os.path.join(OUT_DIR, f"{rid}.mp4")
+            if os.path.isfile(p):
+                found[rid] = {"status":"COMPLETED","started":None,"completed_at":os.path.getmtime(p),"outputs":[p]}
+    return found
+
+# Most ids one batched status call may ask for
+STATUS_MAX_IDS = 1000
 
 def handle_status(event):
+    # Batched form: {"request_ids": [...]} -> one index query, no video payloads
+    rids = event.get("request_ids")
+    if isinstance(rids, list):
+        if len(rids) > STATUS_MAX_IDS:
+            return {"error":f"Too many request_ids ({len(rids)} > {STATUS_MAX_IDS}); split the call"}
+        found = _lookup_jobs([str(r) for r in rids])
+        return {"statuses": found, "unknown": [r for r, st in found.items() if st is None]}
     rid = event.get("request_id") or event.get("id")
     if not rid: return {"error":"Missing request_id"}
-    st = JOBS.get(rid)
+    st = _lookup_jobs([rid])[rid]
     if not st:
-        p = os.path.join(OUT_DIR, f"{rid}.mp4")
-        if os.path.exists(p):
-            st = {"status":"COMPLETED","started":time.time(),"completed_at":os.path.getmtime(p),"outputs":[p]}
-            JOBS[rid]=st
-        else:
-            return {"error":f"Unknown request_id: {rid}"}
+        return {"error":f"Unknown request_id: {rid}"}
     res = {"request_id":rid,"status":st}
     if event.get("return_video", False) and st.get("outputs"):
         p = st["outputs"][0]
+        key = (st.get("objects") or {}).get(p)
+        if key and _get_output_store().enabled and str(event.get("delivery","auto")).lower() != "inline":
+            # Already uploaded: just sign a fresh URL
+            res["result"] = _get_output_store().describe(key, p)
+            return res
+        uploads = _start_uploads(rid, event.get("delivery"), [p], True) if os.path.exists(p) else None
+        if uploads:
+            if rid not in JOBS:
+                JOBS.put(rid, st)  # pre-index output: its record keeps the uploaded object key
+            urls, error = _finish_uploads(rid, uploads, StageTimer())
+            if urls:
+                res["result"] = urls[p]
+                return res
+            res["delivery_error"] = error
         if os.path.exists(p):
-            b64 = base64.b64encode(open(p,"rb").read()).decode("utf-8")
-            res["result"] = {"filename":os.path.basename(p),"data":"data:video/mp4;base64,"+b64}
+            res["result"] = {"filename":os.path.basename(p),"data":payload.data_uri(p, _video_mime(p))}
     return res
 
+def _touch_comfyui_models(names):
+    """Count ComfyUI model file uses so hot files get copied to the local tier."""
+    if not model_cache.enabled:
+        return
+    names = set(names)
+    for cat, files in MODELS.comfyui.items():
+        for name in names & set(files):
+            model_cache.touch(files[name]["path"], "comfyui", cat, name)
+
+def _workflow_strings(workflow):
+    """String inputs of an API-format workflow (model file names among them)."""
+    for node in (workflow or {}).values():
+        if isinstance(node, dict):
+            for v in (node.get("inputs") or {}).values():
+                if isinstance(v, str):
+                    yield v
+
 def _normalize_event(event):
     try:
         if isinstance(event, dict) and isinstance(event.get("input"), dict):
@@ -331,103 +914,201 @@ def _normalize_event(event):
 
 # ComfyUI Handlers
 
+def _comfyui_failed_status(result):
+    """Job status for a ComfyUI run that did not complete."""
+    if result.get("status") == "timeout":
+        return "TIMEOUT"
+    if result.get("status") == "cancelled":
+        return STOPPED_STATUS.get(result.get("reason"), "CANCELLED")
+    return "ERROR"
+
+def _asset_digest(data):
+    """Content hash of an inline asset (file path, base64/data URI string or bytes)."""
+    if isinstance(data, str) and not data.startswith("data:") and os.path.isfile(data):
+        return file_digest(data)
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data or b"").hexdigest()
+
+
 def handle_comfyui_workflow(event):
     """Execute a ComfyUI workflow"""
     rid = str(uuid.uuid4())
+    timer = StageTimer()
     params = event.get("params") or event.get("inputs") or {}
     
     # Get workflow from params
     workflow = params.get("workflow")
     if not workflow:
         return {"error": "Missing 'workflow' parameter"}
+    try:
+        spec = encoder.encode_spec(params)
+    except ValueError as e:
+        return {"error": str(e)}
     
     _progress(5, "Preparing ComfyUI workflow...")
+    JOBS.put(rid, {"status":"RUNNING","started":time.time(),"action":"comfyui_workflow"})
+    images = params.get("images", [])
+    job_out = os.path.join(OUT_DIR, rid)
+    
+    # API-format workflows carry concrete seeds, so the workflow JSON plus the
+    # uploaded image contents fully determine the outputs
+    key = None
+    with timer.stage("cache_lookup"):
+        if str(params.get("use_cache", True)).lower() not in ("0","false","no"):
+            assets = {img.get("name", "input.png"): _asset_digest(img.get("data") or img.get("image")) for img in images}
+            key = cache_key("comfyui_workflow", {"encode": spec}, assets, workflow=workflow)
+        cached = result_cache.get(key, job_out) if key else None
+    if cached:
+        outputs = [{"filename": os.path.basename(p), "path": p, "size": os.path.getsize(p)} for p in cached]
+        uploads = _start_uploads(rid, _delivery(event, params), cached, params.get("return_base64", False))
+        return _comfyui_workflow_response(rid, params, outputs, result_cache.stats(key, True), timer, uploads=uploads)
     
     # Handle image uploads if present
-    images = params.get("images", [])
     for img in images:
         img_name = img.get("name", "input.png")
         img_data = img.get("data") or img.get("image")
         
         if img_data:
-            result = comfyui_client.upload_image(img_data, img_name)
+            with timer.stage("image_upload"):
+                result = _get_comfyui_client().upload_image(img_data, img_name)
             if "error" in result:
+                JOBS.update(rid, {"status":"ERROR","completed_at":time.time(),"error":result["error"]})
                 return {"error": f"Image upload failed: {result['error']}"}
     
     _progress(20, "Executing workflow...")
+    _touch_comfyui_models(_workflow_strings(workflow))
     
     # Execute the workflow
     timeout = params.get("timeout", 600)
-    result = comfyui_client.execute_workflow(workflow, timeout)
+    # Outputs stream from ComfyUI into a per-job directory so same-named files never collide
+    os.makedirs(job_out, exist_ok=True)
+    control = _current_control()
+    CONTROLS.alias(control, rid)
+    result = _get_comfyui_client().execute_workflow(workflow, timeout, timer=timer, output_dir=job_out,
+                                                    cancel=control.check)
     
     if result.get("status") != "completed":
-        return {"request_id": rid, "error": result.get("error", "Workflow execution failed"), "result": result}
+        JOBS.update(rid, {"status":_comfyui_failed_status(result),"completed_at":time.time(),"error":str(result.get("error"))[-4000:]})
+        return {"request_id": rid, "error": result.get("error", "Workflow execution failed"), "result": result,
+                "timings": _finish_timings(rid, timer, "comfyui_workflow")}
     
     _progress(90, "Collecting outputs...")
     
-    # Save outputs
-    outputs = []
-    for output in result.get("outputs", []):
-        filename = output.get("filename", f"{rid}_output.png")
-        output_path = os.path.join(OUT_DIR, filename)
-        
-        # Save the file
-        file_data = base64.b64decode(output.get("data", ""))
-        with open(output_path, "wb") as f:
-            f.write(file_data)
-        
-        outputs.append({
-            "filename": filename,
-            "path": output_path,
-            "size": len(file_data)
-        })
+    outputs = [{"filename": o["filename"], "path": o["path"], "size": o["size"]} for o in result.get("outputs", [])]
+    
+    paths, encoding = _encode_outputs([o["path"] for o in outputs], spec, timer)
+    if encoding:
+        outputs = [{"filename": os.path.basename(p), "path": p, "size": os.path.getsize(p)} for p in paths]
     
+    uploads = _start_uploads(rid, _delivery(event, params), [o["path"] for o in outputs], params.get("return_base64", False))
+    # The key includes the encode spec, so originals kept by a failed encode are not stored
+    if not (encoding or {}).get("error"):
+        with timer.stage("cache_store"):
+            result_cache.put(key, [o["path"] for o in outputs], {"action": "comfyui_workflow"})
+    return _comfyui_workflow_response(rid, params, outputs, result_cache.stats(key), timer, encoding, uploads)
+
+
+def _comfyui_workflow_response(rid, params, outputs, cache, timer, encoding=None, uploads=None):
+    JOBS.update(rid, {"status":"COMPLETED","completed_at":time.time(),"outputs":[o["path"] for o in outputs]})
     _progress(100, "Completed")
     
+    urls, error = _finish_uploads(rid, uploads, timer) if uploads else (None, None)
+    
     # Return results
-    if params.get("return_base64", False):
-        return {
+    if urls:
+        res = {
             "request_id": rid,
             "status": "completed",
-            "outputs": [
+            "cache": cache,
+            "outputs": [urls[o["path"]] for o in outputs]
+        }
+    elif params.get("return_base64", False):
+        with timer.stage("encode_base64"):
+            encoded = [
                 {
                     "filename": o["filename"],
-                    "data": base64.b64encode(open(o["path"], "rb").read()).decode("utf-8"),
+                    "data": payload.b64_file(o["path"]),
                     "size": o["size"]
                 }
                 for o in outputs
             ]
+        res = {
+            "request_id": rid,
+            "status": "completed",
+            "cache": cache,
+            "outputs": encoded
         }
     else:
-        return {
+        res = {
             "request_id": rid,
             "status": "completed",
+            "cache": cache,
             "outputs": outputs
         }
+    if error:
+        res["delivery_error"] = error
+    if encoding:
+        res["encoding"] = encoding
+        if encoding.get("error"):
+            res["encode_error"] = encoding["error"]
+    res["timings"] = _finish_timings(rid, timer, "comfyui_workflow")
+    return res
 
 
 def handle_comfyui_i2v(event):
     """Handle Image-to-Video via ComfyUI"""
     rid = str(uuid.uuid4())
+    timer = StageTimer()
     params = event.get("params") or event.get("inputs") or {}
     
+    # Fail fast on model files the catalog knows are absent
+    for cat, key, default in (("diffusion_models", "diffusion_model", "wan2.2_i2v_high_noise_14B_fp8_scaled.safetensors"),
+                              ("vae", "vae_model", "wan_2.1_vae.safetensors")):
+        name = params.get(key, default)
+        if MODELS.has_comfyui_model(cat, name) is False:
+            return {"error": f"ComfyUI model '{name}' not found in {cat}"}
+    
     # Download/get input image
-    image_path = _download_ref_image(params)
+    with timer.stage("input_fetch"):
+        image_path = _download_ref_image(params)
     if not image_path:
         return {"error": "Missing reference image (url/base64/path) for I2V task"}
     
+    try:
+        spec = encoder.encode_spec(params)
+    except ValueError as e:
+        return {"error": str(e)}
+    
+    JOBS.put(rid, {"status":"RUNNING","started":time.time(),"action":"comfyui_i2v",
+                   "models":[params.get("diffusion_model", "wan2.2_i2v_high_noise_14B_fp8_scaled.safetensors"),
+                             params.get("vae_model", "wan_2.1_vae.safetensors")]})
+    
+    # Seeded requests with the same image and settings reuse a stored result
+    key = None
+    with timer.stage("cache_lookup"):
+        if _use_cache(params):
+            key = cache_key("comfyui_i2v", dict(params, encode=spec), {"image": file_digest(image_path)}, drop=IMAGE_INPUT_KEYS)
+        cached = result_cache.get(key, OUT_DIR, rename=lambda n: f"{rid}_i2v_output" + os.path.splitext(n)[1]) if key else None
+    if cached:
+        uploads = _start_uploads(rid, _delivery(event, params), cached[:1], params.get("return_video", True))
+        return _comfyui_i2v_response(rid, params, cached, result_cache.stats(key, True), timer, uploads=uploads)
+    
     _progress(5, "Uploading image to ComfyUI...")
     
     # Upload image to ComfyUI
     image_name = f"{rid}_input.png"
-    upload_result = comfyui_client.upload_image(image_path, image_name)
+    with timer.stage("image_upload"):
+        upload_result = _get_comfyui_client().upload_image(image_path, image_name)
     
     if "error" in upload_result:
+        JOBS.update(rid, {"status":"ERROR","completed_at":time.time(),"error":upload_result["error"]})
         return {"error": f"Image upload failed: {upload_result['error']}"}
     
     _progress(15, "Creating I2V workflow...")
     
     # Create workflow
+    from comfyui_client import create_i2v_workflow
     workflow = create_i2v_workflow(
         image_filename=image_name,
         diffusion_model=params.get("diffusion_model", "wan2.2_i2v_high_noise_14B_fp8_scaled.safetensors"),
@@ -442,96 +1123,480 @@ def handle_comfyui_i2v(event):
     )
     
     _progress(25, "Executing I2V generation...")
+    _touch_comfyui_models(_workflow_strings(workflow))
     
     # Execute workflow
     timeout = params.get("timeout", 600)
-    result = comfyui_client.execute_workflow(workflow, timeout)
+    control = _current_control()
+    CONTROLS.alias(control, rid)
+    result = _get_comfyui_client().execute_workflow(workflow, timeout, timer=timer, output_dir=OUT_DIR,
+                                             rename=lambda n: f"{rid}_i2v_output.mp4", cancel=control.check)
     
     if result.get("status") != "completed":
-        return {"request_id": rid, "error": result.get("error", "I2V generation failed"), "result": result}
+        JOBS.update(rid, {"status":_comfyui_failed_status(result),"completed_at":time.time(),"error":str(result.get("error"))[-4000:]})
+        return {"request_id": rid, "error": result.get("error", "I2V generation failed"), "result": result,
+                "timings": _finish_timings(rid, timer, "comfyui_i2v")}
     
     _progress(95, "Saving outputs...")
     
-    # Save outputs
-    outputs = []
-    for output in result.get("outputs", []):
-        filename = f"{rid}_i2v_output.mp4"
-        output_path = os.path.join(OUT_DIR, filename)
-        
-        file_data = base64.b64decode(output.get("data", ""))
-        with open(output_path, "wb") as f:
-            f.write(file_data)
-        
-        outputs.append(output_path)
+    outputs = [o["path"] for o in result.get("outputs", [])]
+    outputs, encoding = _encode_outputs(list(dict.fromkeys(outputs)), spec, timer)
     
+    uploads = _start_uploads(rid, _delivery(event, params), outputs[:1], params.get("return_video", True))
+    if not (encoding or {}).get("error"):
+        with timer.stage("cache_store"):
+            result_cache.put(key, outputs, {"action": "comfyui_i2v"})
+    return _comfyui_i2v_response(rid, params, outputs, result_cache.stats(key), timer, encoding, uploads)
+
+
+def _comfyui_i2v_response(rid, params, outputs, cache, timer, encoding=None, uploads=None):
+    JOBS.update(rid, {"status":"COMPLETED","completed_at":time.time(),"outputs":list(dict.fromkeys(outputs))})
     _progress(100, "Completed")
     
-    if params.get("return_video", True) and outputs:
-        video_data = open(outputs[0], "rb").read()
-        return {
+    urls, error = _finish_uploads(rid, uploads, timer) if uploads else (None, None)
+    
+    if urls:
+        res = {
+            "request_id": rid,
+            "status": "completed",
+            "cache": cache,
+            "result": urls[outputs[0]]
+        }
+    elif params.get("return_video", True) and outputs:
+        with timer.stage("encode_base64"):
+            data = payload.data_uri(outputs[0], _video_mime(outputs[0]))
+        res = {
             "request_id": rid,
             "status": "completed",
+            "cache": cache,
             "result": {
                 "filename": os.path.basename(outputs[0]),
-                "data": "data:video/mp4;base64," + base64.b64encode(video_data).decode("utf-8")
+                "data": data
             }
         }
     else:
-        return {
+        res = {
             "request_id": rid,
             "status": "completed",
+            "cache": cache,
             "outputs": outputs
         }
+    if error:
+        res["delivery_error"] = error
+    if encoding:
+        res["encoding"] = encoding
+        if encoding.get("error"):
+            res["encode_error"] = encoding["error"]
+    res["timings"] = _finish_timings(rid, timer, "comfyui_i2v")
+    return res
 
 
 def handle_comfyui_models(event):
     """List available models in ComfyUI"""
-    models = comfyui_client.get_available_models()
+    models = _get_comfyui_client().get_available_models()
     return {
         "status": "success",
         "models": models
     }
 
 
-def handler(event):
-    # Unwrap RunPod job wrapper shape: { id, input: { ... } }
-    event = _normalize_event(event)
-    
+def handle_models(event):
+    """Model catalog: WAN model folders and ComfyUI model files (refresh=true rescans)"""
+    if event.get("refresh"):
+        MODELS.load(force=str(event.get("refresh")).lower() == "force")
+    return MODELS.summary()
+
+
+def handle_plan(event):
+    """Predicted runtime/peak VRAM and the admission decision for a request or batch, without running it"""
+    params = dict(event.get("params") or event.get("inputs") or {})
+    items = params.pop("items", None)
+    try:
+        params, admission = _admit(event, _memory_profile(params), count=len(items) if isinstance(items, list) and items else 1)
+    except ValueError as e:
+        return {"error":str(e)}
+    admission["params"] = {k: v for k, v in features(params).items() if k not in ("prefix","group")}
+    admission["params"]["memory_profile"] = params["memory_profile"]
+    return admission
+
+
+def handle_log(event):
+    """Byte range of a WAN job's captured generate.py output.
+    Select with range="bytes=START-END" (HTTP style, END inclusive; "bytes=-N" is the
+    last N bytes) or offset/length; without either the first chunk is returned.
+    """
+    rid = str(event.get("request_id") or event.get("id") or "")
+    if not rid:
+        return {"error":"Missing request_id"}
+    try:
+        res = read_log(rid, 0, 0)
+        if res is None:
+            return {"error":f"No log for request_id {rid}"}
+        total = res[3]
+        if event.get("range"):
+            start, end = parse_range(event["range"], total)
+        else:
+            start = int(event.get("offset", 0))
+            end = start + int(event["length"]) if event.get("length") is not None else None
+        data, start, end, total = read_log(rid, start, end)
+    except ValueError as e:
+        return {"error":str(e)}
+    st = JOBS.get(rid) or {}
+    return {"request_id":rid, "start":start, "end":end, "size":total,
+            "complete":st.get("status") not in ("RUNNING","QUEUED"),
+            "data":data.decode("utf-8","replace")}
+
+
+def _job_output(rid, index=0):
+    """(path, None) of a finished job's output still on this worker, else (None, error)."""
+    st = _lookup_jobs([rid])[rid]
+    if not st:
+        return None, f"Unknown request_id: {rid}"
+    outputs = st.get("outputs") or []
+    if not 0 <= index < len(outputs):
+        return None, f"No output {index} for {rid} ({len(outputs)} outputs, status {st.get('status')})"
+    if not os.path.exists(outputs[index]):
+        return None, f"Output {os.path.basename(outputs[index])} is no longer on this worker; use status with delivery=url"
+    return outputs[index], None
+
+
+def handle_fetch(event):
+    """Byte range of a finished job's output, for parallel and resumable downloads.
+    Select with range="bytes=START-END" or offset/length (default FETCH_CHUNK_MB from 0,
+    at most FETCH_MAX_CHUNK_MB); "output" picks one of several outputs. Pass the etag
+    of earlier chunks to detect a replaced file; manifest=true adds every chunk's sha256.
+    """
+    rid = str(event.get("request_id") or event.get("id") or "")
+    if not rid:
+        return {"error":"Missing request_id"}
+    try:
+        index = int(event.get("output", 0))
+    except ValueError:
+        return {"error":f"Invalid output index '{event.get('output')}'"}
+    path, error = _job_output(rid, index)
+    if error:
+        return {"error":error}
+    etag = payload.file_etag(path)
+    if event.get("etag") and event["etag"] != etag:
+        return {"error":"Output changed since the given etag; restart the download", "etag":etag}
+    size = os.path.getsize(path)
+    try:
+        if event.get("range"):
+            start, end = parse_range(event["range"], size)
+        else:
+            start = int(event.get("offset", 0))
+            end = start + int(event.get("length") or payload.FETCH_CHUNK_BYTES)
+            if start < 0 or start > size:
+                raise ValueError(f"Offset {start} outside output ({size} bytes)")
+        end = min(end, size, start + payload.FETCH_MAX_CHUNK_BYTES)
+        chunk_bytes = int(event.get("chunk_bytes") or payload.FETCH_CHUNK_BYTES)
+        if chunk_bytes <= 0:
+            raise ValueError("chunk_bytes must be positive")
+    except ValueError as e:
+        return {"error":str(e)}
+    data, digest = payload.read_range(path, start, end)
+    res = {"request_id":rid, "output":index, "filename":os.path.basename(path), "size":size, "etag":etag,
+           "start":start, "end":end, "complete":end >= size, "sha256":digest, "encoding":"base64", "data":data}
+    if str(event.get("manifest", "")).lower() in ("1","true","yes"):
+        res["manifest"] = payload.manifest(path, chunk_bytes)
+    return res
+
+
+def handle_cancel(event):
+    """Cancel a running GPU job by request_id or RunPod job id; waits up to wait_s for it to stop"""
+    job_id = str(event.get("request_id") or event.get("job_id") or event.get("id") or "")
+    if not job_id:
+        return {"error":"Missing request_id"}
+    control = CONTROLS.get(job_id)
+    if control is None:
+        st = JOBS.get(job_id)
+        if st is None:
+            return {"error":f"Unknown or finished job {job_id}"}
+        return {"request_id":job_id, "cancelled":False, "status":st}
+    control.cancel("cancelled")
+    stopped = control.done.wait(float(event.get("wait_s", 30)))
+    rids = [i for i in sorted(control.ids) if i in JOBS]
+    return {"request_id":job_id, "cancelled":True, "stopped":stopped, "cancel":control.info,
+            "statuses":{rid: JOBS[rid] for rid in rids}}
+
+
+def handle_stats(event):
+    """Worker-wide aggregates: per-stage timings, result cache and asset fetcher counters"""
+    return {
+        "stages": STAGE_STATS.summary(),
+        "result_cache": result_cache.stats(),
+        "assets": dict(_asset_fetcher.stats) if _asset_fetcher else {},
+        "prewarm": prewarm.read_status(),
+        "model_cache": model_cache.summary(),
+        "cost_model": COST.summary(),
+        "memory_profiles": MEMORY.summary(),
+        "webhooks": _webhooks.summary() if _webhooks else {},
+    }
+
+
+def handle_health(event):
+    wan_ok = os.path.isdir(WAN_HOME) and os.path.isdir(WAN_CKPT_DIR)
+    comfyui_ok = _get_comfyui_client().health_check()
+    return {
+        "ok": wan_ok and comfyui_ok,
+        "wan_home": WAN_HOME,
+        "ckpt_dir": WAN_CKPT_DIR,
+        "comfyui_url": _get_comfyui_client().url,
+        "comfyui_status": "online" if comfyui_ok else "offline",
+        "gpus": visible_devices(),
+        "wan_models": {name: ("incomplete" if e["missing"] else "ok") for name, e in MODELS.wan.items()},
+        "startup": {"components": STARTUP.status(), "timeline": STARTUP.timeline()}
+    }
+
+
+def _route(event):
+    """Map an event to (handler function, needs_gpu)."""
     # Health check
     if event.get("health"):
-        wan_ok = os.path.isdir(WAN_HOME) and os.path.isdir(WAN_CKPT_DIR)
-        comfyui_ok = comfyui_client.health_check()
-        return {
-            "ok": wan_ok and comfyui_ok,
-            "wan_home": WAN_HOME,
-            "ckpt_dir": WAN_CKPT_DIR,
-            "comfyui_url": comfyui_client.url,
-            "comfyui_status": "online" if comfyui_ok else "offline"
-        }
+        return handle_health, False
     
     action = (event.get("action") or "").lower()
     
     # ComfyUI actions
     if action == "comfyui_workflow":
-        return handle_comfyui_workflow(event)
+        return handle_comfyui_workflow, True
     if action == "comfyui_i2v":
-        return handle_comfyui_i2v(event)
+        return handle_comfyui_i2v, True
     if action == "comfyui_models":
-        return handle_comfyui_models(event)
+        return handle_comfyui_models, False
     
     # WAN actions
     if action in ("request","generate","create"):
-        return handle_request(event)
+        return handle_request, True
+    if action == "batch":
+        return handle_batch, True
     if action in ("status","get","result"):
-        return handle_status(event)
+        return handle_status, False
+    if action == "stats":
+        return handle_stats, False
+    if action == "models":
+        return handle_models, False
+    if action == "plan":
+        return handle_plan, False
+    if action in ("log","logs"):
+        return handle_log, False
+    if action == "cancel":
+        return handle_cancel, False
+    if action == "fetch":
+        return handle_fetch, False
     
     # Auto-detect action
     if "workflow" in event:
-        return handle_comfyui_workflow(event)
+        return handle_comfyui_workflow, True
     if "inputs" in event or "params" in event:
         event["action"]="request"
-        return handle_request(event)
+        return handle_request, True
     
-    return {"error": "Unsupported event. Use action=request|status|comfyui_workflow|comfyui_i2v|comfyui_models"}
+    return None, False
+
+
+# Startup components each action waits for (everything else is served immediately)
+ACTION_REQUIRES = {
+    handle_request: ("models", "wan_models"),
+    handle_batch: ("models", "wan_models"),
+    handle_models: ("models",),
+    handle_plan: (),
+    handle_comfyui_workflow: ("models", "comfyui"),
+    handle_comfyui_i2v: ("models", "comfyui"),
+    handle_comfyui_models: ("comfyui",),
+}
+
+
+def _webhook_url(event):
+    """webhook_url from the event or its params (removed from params so it never reaches cache keys)."""
+    url = event.get("webhook_url")
+    for key in ("params", "inputs"):
+        params = event.get(key)
+        if isinstance(params, dict) and "webhook_url" in params:
+            params = dict(params)
+            url = url or params.pop("webhook_url")
+            event[key] = params
+    if url:
+        from webhook import validate_url
+        return validate_url(url)
+    return None
+
+
+def _without_inline(obj):
+    """Response without base64 payloads; webhooks carry URLs, paths and metadata only."""
+    if isinstance(obj, dict):
+        return {k: _without_inline(v) for k, v in obj.items() if not (k == "data" and isinstance(v, str))}
+    if isinstance(obj, list):
+        return [_without_inline(v) for v in obj]
+    return obj
+
+
+def _notify(url, job_id, event, res):
+    """Queue the completion webhook for a GPU action's response; returns the delivery record."""
+    status = res.get("status")
+    status = status.get("status") if isinstance(status, dict) else status
+    ok = not res.get("error") and not res.get("failed") and str(status or "completed").lower() == "completed"
+    rid = res.get("request_id") or res.get("batch_id")
+    body = {"event": "job.completed" if ok else "job.failed", "job_id": job_id, "request_id": rid,
+            "action": event.get("action"), "sent_at": time.time(), "output": _without_inline(res)}
+    delivery = _get_webhooks().send(url, body, job_id=rid)
+    return {k: delivery[k] for k in ("id","url","status")}
+
+
+def _job_deadline(event):
+    """Seconds a GPU job may run once it holds the GPU (deadline_s, else JOB_DEADLINE_S); None = unlimited."""
+    params = event.get("params") or event.get("inputs") or {}
+    deadline = event.get("deadline_s") or (params.get("deadline_s") if isinstance(params, dict) else None) or JOB_DEADLINE_S
+    return float(deadline) or None
+
+
+def run_action(event, progress=None):
+    """Synchronous dispatch; GPU-bound actions hold the single GPU slot.
+    progress(snapshot) receives the job's progress instead of RunPod (HTTP server mode).
+    """
+    job_id = event.get("id") if isinstance(event, dict) else None
+    # Unwrap RunPod job wrapper shape: { id, input: { ... } }
+    event = _normalize_event(event)
+    fn, gpu = _route(event)
+    if fn is None:
+        return {"error": "Unsupported event. Use action=request|batch|plan|status|fetch|log|cancel|stats|models|comfyui_workflow|comfyui_i2v|comfyui_models"}
+    error = STARTUP.wait(ACTION_REQUIRES.get(fn, ()))
+    if error:
+        return {"error": f"Worker not ready: {error}"}
+    if not gpu:
+        return fn(event)
+    try:
+        webhook_url = _webhook_url(event)
+    except ValueError as e:
+        return {"error": str(e)}
+    # Registered before waiting for the GPU so queued jobs can be cancelled too;
+    # the deadline clock starts once the job holds the GPU slot
+    control = CONTROLS.register([job_id], _job_deadline(event), start=False)
+    _job_ctx.control = control
+    _job_ctx.progress = progress
+    try:
+        with _gpu_slot():
+            queue_s = control.start()
+            reason = control.check()
+            if reason:
+                res = {"error":f"Job stopped before it started ({reason})", "status":STOPPED_STATUS[reason]}
+            else:
+                res = fn(event)
+    except Exception as e:
+        if webhook_url:
+            _notify(webhook_url, job_id, event, {"error":f"{type(e).__name__}: {e}"})
+        raise
+    finally:
+        _job_ctx.control = None
+        _job_ctx.progress = None
+        CONTROLS.finish(control)
+    res["queue_s"] = round(queue_s, 3)
+    if webhook_url:
+        res["webhook"] = _notify(webhook_url, job_id, event, res)
+    return res
+
+
+@contextmanager
+def _gpu_slot():
+    """Hold the single GPU slot; background volume readers back off meanwhile."""
+    with GPU_SLOT:
+        if PREWARM_CANCEL_ON_JOB and (prewarm.read_status() or {}).get("state") == "running":
+            prewarm.cancel()
+        # Local model copies wait while the job loads from the volume
+        model_cache.pause()
+        try:
+            yield
+        finally:
+            model_cache.resume()
+
+
+# Short text-only runs (two clip lengths) that seed the cost model on a new GPU type
+CALIBRATION_RUNS = {
+    "ti2v": [{"size":"1280*704","frame_num":9,"sample_steps":4}, {"size":"1280*704","frame_num":33,"sample_steps":4}],
+    "t2v": [{"size":"832*480","frame_num":9,"sample_steps":4}, {"size":"832*480","frame_num":33,"sample_steps":4}],
+}
+
+def _calibrate():
+    """Startup self-calibration: time a few small generations when this GPU type has no data."""
+    if COST_CALIBRATE == "off" or (COST_CALIBRATE == "auto" and COST.has_data()):
+        return
+    if gpu_info()["total_mb"] is None:
+        print("[calibrate] No GPU visible, skipping")
+        return
+    error = STARTUP.wait(("models", "wan_models"))
+    if error:
+        raise RuntimeError(error)
+    # Another worker of this GPU type may have calibrated while the models downloaded
+    COST.reload()
+    if COST_CALIBRATE == "auto" and COST.has_data():
+        print("[calibrate] Records for this GPU type appeared, skipping")
+        return
+    tasks = [COST_CALIBRATE_TASK] if COST_CALIBRATE_TASK else ["ti2v-5B", "t2v-A14B"]
+    task = next((t for t in tasks if t.lower().split("-")[0] in CALIBRATION_RUNS
+                 and (MODELS.by_task.get(t.lower()) or {}).get("missing") == []), None)
+    if task is None:
+        print(f"[calibrate] No text-to-video model installed among {tasks}, skipping")
+        return
+    for run in CALIBRATION_RUNS[task.lower().split("-")[0]]:
+        params = {"task":task, "prompt":"a calibration clip of waves on a beach", "seed":0, **run}
+        job_dir = _job_dir(f"calibration-{uuid.uuid4()}")
+        params["save_file"] = os.path.join(job_dir, "calibration.mp4")
+        timer, tracker = StageTimer(), _new_tracker()
+        try:
+            with _gpu_slot(), VramMonitor() as vram, timer.stage("generate"):
+                code,out,err = _run_generate(_build_cmd(params, None), tracker=tracker)
+        finally:
+            shutil.rmtree(job_dir, ignore_errors=True)
+        if code != 0:
+            raise RuntimeError(f"calibration run failed: {err[-500:]}")
+        timer.add_phases(tracker.summary(), within="generate")
+        obs = COST.record(params, timer.stages, vram.peak_mb, source="calibration")
+        print(f"[calibrate] {task} {run}: {obs}")
+
 
-runpod.serverless.start({"handler": handler})
+async def handler(event):
+    # Runs in a thread so status/health/models calls are served while a GPU job renders
+    return await asyncio.to_thread(run_action, event)
+
+
+def concurrency_modifier(current_concurrency):
+    return HANDLER_CONCURRENCY
+
+
+def _comfyui_exited():
+    """Error once the ComfyUI process started by bootstrap.sh has died."""
+    try:
+        with open(COMFYUI_PID_FILE) as f:
+            os.kill(int(f.read().strip()), 0)
+    except (OSError, ValueError) as e:
+        if isinstance(e, ProcessLookupError):
+            return "ComfyUI process exited (see /tmp/comfyui.log)"
+    return None
+
+
+def _wan_download_exited():
+    """Error once the background model download died without clearing its marker (which holds its pid)."""
+    try:
+        with open(WAN_DOWNLOAD_PENDING) as f:
+            os.kill(int(f.read().strip()), 0)
+    except (OSError, ValueError) as e:
+        if isinstance(e, ProcessLookupError) and os.path.exists(WAN_DOWNLOAD_PENDING):
+            return "WAN model download exited before finishing (see /tmp/wan_download.log)"
+    return None
+
+
+if __name__ == "__main__":
+    STARTUP.mark("handler_import", start=_IMPORT_STARTED)
+    STARTUP.start("models", MODELS.load)
+    STARTUP.poll("comfyui", lambda: _get_comfyui_client().health_check(), interval_s=1.0, failed=_comfyui_exited)
+    # A 14B download takes far longer than the usual readiness timeout; WAN jobs
+    # wait for it as long as the download process is alive
+    STARTUP.poll("wan_models", lambda: not os.path.exists(WAN_DOWNLOAD_PENDING), interval_s=2.0,
+                 failed=_wan_download_exited, timeout=None)
+    STARTUP.start("calibration", _calibrate)
+    if WORKER_MODE == "http":
+        from http_server import HttpApi, serve
+        serve(HttpApi(run_action, _job_output))
+    else:
+        import runpod
+        runpod.serverless.start({"handler": handler, "concurrency_modifier": concurrency_modifier})
@@ -0,0 +1,403 @@
+# HTTP Server Module
+# Standalone HTTP API for running the worker outside RunPod, e.g. on our own
+# GPU boxes behind a load balancer. Built on asyncio streams: one process
+# keeps accepting connections while a GPU job renders on a worker thread.
+# Exposes the handler's actions as REST endpoints, RunPod-style async jobs
+# with progress as Server-Sent Events, and outputs with HTTP range requests.
+
+import os
+import hmac
+import json
+import time
+import uuid
+import asyncio
+import mimetypes
+import threading
+import ipaddress
+import urllib.parse
+from http import HTTPStatus
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from job_log import parse_range
+from payload import file_etag
+
+# Loopback by default; any other address needs HTTP_API_KEY
+HTTP_HOST = os.environ.get("HTTP_HOST", "127.0.0.1")
+HTTP_PORT = int(os.environ.get("HTTP_PORT", "8000"))
+# Bearer token required on every route except /health (empty = no auth)
+HTTP_API_KEY = os.environ.get("HTTP_API_KEY", "")
+# Threads for async jobs, and separately for direct action calls, so status,
+# cancel and fetch keep answering while jobs wait for the GPU
+HTTP_THREADS = int(os.environ.get("HTTP_THREADS", "8"))
+HTTP_MAX_BODY_BYTES = int(float(os.environ.get("HTTP_MAX_BODY_MB", "64")) * (1 << 20))
+# Finished async jobs kept for GET /v1/jobs/{id}
+HTTP_JOB_HISTORY = int(os.environ.get("HTTP_JOB_HISTORY", "1000"))
+HTTP_SSE_KEEPALIVE_S = float(os.environ.get("HTTP_SSE_KEEPALIVE_S", "15"))
+
+FINAL_STATUSES = ("COMPLETED", "FAILED", "CANCELLED", "TIMEOUT")
+
+
+def is_loopback(host):
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return host == "localhost"
+
+
+def job_outcome(output):
+    """RunPod-style final status of an action's response."""
+    status = output.get("status")
+    status = status.get("status") if isinstance(status, dict) else status
+    if str(status).upper() in ("CANCELLED", "TIMEOUT"):
+        return str(status).upper()
+    if output.get("error") or output.get("failed") or str(status or "completed").lower() != "completed":
+        return "FAILED"
+    return "COMPLETED"
+
+
+class HttpJob:
+    """One async job: status, output and the event history replayed to SSE clients."""
+
+    def __init__(self, job_id, event):
+        self.id = job_id
+        self.event = event
+        self.status = "IN_QUEUE"
+        self.output = None
+        self.created_at = time.time()
+        self.started_at = self.finished_at = None
+        self.progress = None
+        self.events = deque(maxlen=256)
+        self.seq = 0
+        self.subscribers = set()
+        # Guards the IN_QUEUE -> IN_PROGRESS / CANCELLED hand-off between the loop and the job thread
+        self.lock = threading.Lock()
+
+    def publish(self, kind, data):
+        """Record an event and hand it to connected SSE clients (event loop thread only)."""
+        self.seq += 1
+        ev = (self.seq, kind, data)
+        self.events.append(ev)
+        for q in self.subscribers:
+            q.put_nowait(ev)
+
+    def describe(self):
+        out = {"id": self.id, "status": self.status, "created_at": self.created_at,
+               "started_at": self.started_at, "finished_at": self.finished_at, "progress": self.progress}
+        if self.status in FINAL_STATUSES:
+            out["output"] = self.output
+        return out
+
+
+class HttpApi:
+    """
+    HTTP front end over the handler's action dispatch.
+
+    Args:
+        run_action: callable(event, progress=callback) -> response dict, as in handler.py
+        output_path: callable(request_id, index) -> (path, error) of a finished job's output
+        api_key: bearer token (empty = no auth)
+    """
+
+    def __init__(self, run_action, output_path, api_key=HTTP_API_KEY, threads=HTTP_THREADS,
+                 max_body=HTTP_MAX_BODY_BYTES, history=HTTP_JOB_HISTORY, keepalive_s=HTTP_SSE_KEEPALIVE_S):
+        self.run_action = run_action
+        self.output_path = output_path
+        self.api_key = api_key
+        self.max_body = max_body
+        self.history = history
+        self.keepalive_s = keepalive_s
+        self.job_pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="http-job")
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="http-action")
+        self.jobs = OrderedDict()
+        self.loop = None
+        self.port = None
+
+    async def serve(self, host=HTTP_HOST, port=HTTP_PORT, ready=None):
+        """
+        Serve until cancelled; ready() is called once the socket is listening.
+
+        Raises:
+            ValueError: a non-loopback host without an API key
+        """
+        if not self.api_key and not is_loopback(host):
+            raise ValueError(f"Refusing to serve on {host} without HTTP_API_KEY; "
+                             "set a key or bind HTTP_HOST=127.0.0.1")
+        self.loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self._connection, host, port, limit=1 << 16)
+        self.port = server.sockets[0].getsockname()[1]
+        print(f"[http] Listening on {host}:{self.port}")
+        if ready:
+            ready()
+        async with server:
+            await server.serve_forever()
+
+    # --- connection and response plumbing ---
+
+    async def _connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    await self._send(writer, 400, {"error": "Malformed request line"}, keep=False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        k, v = line.split(":", 1)
+                        headers[k.strip().lower()] = v.strip()
+                if "chunked" in headers.get("transfer-encoding", "").lower():
+                    await self._send(writer, 411, {"error": "Chunked request bodies are not supported"}, keep=False)
+                    break
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    await self._send(writer, 400, {"error": "Invalid Content-Length"}, keep=False)
+                    break
+                if length > self.max_body:
+                    await self._send(writer, 413, {"error": f"Body larger than {self.max_body} bytes"}, keep=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                keep = version.upper() == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                try:
+                    keep = await self._dispatch(method.upper(), target, headers, body, writer, keep)
+                except ConnectionError:
+                    raise
+                except Exception as e:
+                    print(f"[http] {method} {target} failed: {type(e).__name__}: {e}")
+                    await self._send(writer, 500, {"error": f"{type(e).__name__}: {e}"}, keep=False)
+                    keep = False
+                if not keep:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    def _head(self, writer, code, headers):
+        lines = [f"HTTP/1.1 {code} {HTTPStatus(code).phrase}"] + [f"{k}: {v}" for k, v in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+    async def _send(self, writer, code, body, keep=True, headers=None):
+        data = body if isinstance(body, bytes) else json.dumps(body, default=str).encode()
+        h = {"Content-Type": "application/json", "Content-Length": str(len(data)),
+             "Connection": "keep-alive" if keep else "close"}
+        h.update(headers or {})
+        self._head(writer, code, h)
+        writer.write(data)
+        await writer.drain()
+        return keep
+
+    async def _call(self, pool, fn, *args):
+        return await self.loop.run_in_executor(pool, fn, *args)
+
+    # --- routing ---
+
+    async def _dispatch(self, method, target, headers, body, writer, keep):
+        url = urllib.parse.urlsplit(target)
+        parts = [urllib.parse.unquote(p) for p in url.path.split("/") if p]
+        # Ids are used as file names downstream; an encoded "/" or ".." must not become a path
+        if any("/" in p or "\\" in p or "\0" in p or p in (".", "..") for p in parts):
+            return await self._send(writer, 400, {"error": "Invalid path segment"}, keep)
+        if parts == ["health"]:
+            res = await self._call(self.pool, self.run_action, {"input": {"health": True}})
+            return await self._send(writer, 200 if res.get("ok") else 503, res, keep)
+        if self.api_key and not hmac.compare_digest(headers.get("authorization", ""), f"Bearer {self.api_key}"):
+            return await self._send(writer, 401, {"error": "Missing or invalid bearer token"}, keep,
+                                    headers={"WWW-Authenticate": "Bearer"})
+        if len(parts) < 2 or parts[0] != "v1":
+            return await self._send(writer, 404, {"error": f"No route for {url.path}"}, keep)
+
+        if parts[1] == "jobs":
+            if len(parts) == 2:
+                if method != "POST":
+                    return await self._send(writer, 405, {"error": "Use POST"}, keep)
+                return await self._submit(writer, body, keep)
+            job = self.jobs.get(parts[2])
+            if job is None:
+                return await self._send(writer, 404, {"error": f"Unknown job {parts[2]}"}, keep)
+            if len(parts) == 3 and method == "GET":
+                return await self._send(writer, 200, job.describe(), keep)
+            if parts[3:] == ["events"] and method == "GET":
+                return await self._events(writer, job, int(headers.get("last-event-id") or 0))
+            if parts[3:] == ["cancel"] and method == "POST":
+                return await self._cancel(writer, job, body, keep)
+            return await self._send(writer, 404, {"error": f"No route for {method} {url.path}"}, keep)
+
+        if parts[1] == "outputs" and len(parts) in (3, 4):
+            if method not in ("GET", "HEAD"):
+                return await self._send(writer, 405, {"error": "Use GET or HEAD"}, keep)
+            return await self._output(writer, method, headers, parts[2], parts[3] if len(parts) == 4 else 0, keep)
+
+        if len(parts) == 2:
+            # Any handler action: GET takes query parameters, POST a JSON object
+            if method == "GET":
+                event = {k: v[-1] for k, v in urllib.parse.parse_qs(url.query).items()}
+            elif method == "POST":
+                event = self._json(body)
+                if event is None:
+                    return await self._send(writer, 400, {"error": "Body must be a JSON object"}, keep)
+            else:
+                return await self._send(writer, 405, {"error": "Use GET or POST"}, keep)
+            res = await self._call(self.pool, self.run_action, {"input": dict(event, action=parts[1])})
+            return await self._send(writer, 200, res, keep)
+        return await self._send(writer, 404, {"error": f"No route for {url.path}"}, keep)
+
+    @staticmethod
+    def _json(body):
+        try:
+            data = json.loads(body or b"{}")
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+
+    # --- async jobs ---
+
+    async def _submit(self, writer, body, keep):
+        data = self._json(body)
+        event = data.get("input", data) if data is not None else None
+        if not isinstance(event, dict):
+            return await self._send(writer, 400, {"error": "Body must be {\"input\": {...}}"}, keep)
+        job = HttpJob(str(uuid.uuid4()), event)
+        self.jobs[job.id] = job
+        self._prune()
+        job.publish("status", {"status": job.status})
+        self.loop.run_in_executor(self.job_pool, self._run_job, job)
+        return await self._send(writer, 202, {"id": job.id, "status": job.status}, keep)
+
+    def _run_job(self, job):
+        """Worker thread: run the job's action, feeding progress back to the event loop."""
+        call = self.loop.call_soon_threadsafe
+        with job.lock:
+            if job.status != "IN_QUEUE":
+                return  # cancelled while queued
+            job.status, job.started_at = "IN_PROGRESS", time.time()
+        call(job.publish, "status", {"status": "IN_PROGRESS"})
+        try:
+            out = self.run_action({"id": job.id, "input": job.event}, progress=lambda snap: call(self._progress, job, snap))
+        except Exception as e:
+            out = {"error": f"{type(e).__name__}: {e}"}
+        call(self._finish, job, job_outcome(out), out)
+
+    def _progress(self, job, snap):
+        job.progress = snap
+        job.publish("progress", snap)
+
+    def _finish(self, job, status, output):
+        job.status, job.output, job.finished_at = status, output, time.time()
+        job.publish("done", job.describe())
+
+    def _prune(self):
+        finished = [k for k, j in self.jobs.items() if j.status in FINAL_STATUSES]
+        for k in finished[:max(0, len(self.jobs) - self.history)]:
+            del self.jobs[k]
+
+    async def _cancel(self, writer, job, body, keep):
+        if job.status in FINAL_STATUSES:
+            return await self._send(writer, 200, job.describe(), keep)
+        with job.lock:
+            queued = job.status == "IN_QUEUE"
+            if queued:
+                # Not handed to the handler yet; its thread will skip it
+                job.status = "CANCELLED"
+        if queued:
+            self._finish(job, "CANCELLED", {"error": "Job cancelled before it started"})
+            return await self._send(writer, 200, job.describe(), keep)
+        wait_s = (self._json(body) or {}).get("wait_s", 30)
+        res = await self._call(self.pool, self.run_action,
+                               {"input": {"action": "cancel", "job_id": job.id, "wait_s": wait_s}})
+        return await self._send(writer, 200, res, keep)
+
+    async def _events(self, writer, job, last_id):
+        """Server-Sent Events: replay history after Last-Event-ID, then stream until the job is done."""
+        q = asyncio.Queue()
+        job.subscribers.add(q)
+        try:
+            self._head(writer, 200, {"Content-Type": "text/event-stream", "Cache-Control": "no-cache",
+                                     "Connection": "close", "X-Accel-Buffering": "no"})
+            pending = [ev for ev in job.events if ev[0] > last_id]
+            if not pending and job.status in FINAL_STATUSES:
+                # Reconnect after the end: repeat the final event
+                pending = [ev for ev in job.events if ev[1] == "done"]
+            while True:
+                for seq, kind, data in pending:
+                    writer.write(f"id: {seq}\nevent: {kind}\ndata: {json.dumps(data, default=str)}\n\n".encode())
+                    last_id = seq
+                    if kind == "done":
+                        await writer.drain()
+                        return False
+                await writer.drain()
+                try:
+                    ev = await asyncio.wait_for(q.get(), self.keepalive_s)
+                    pending = [ev] if ev[0] > last_id else []
+                except asyncio.TimeoutError:
+                    writer.write(b": keepalive\n\n")
+                    pending = []
+        finally:
+            job.subscribers.discard(q)
+
+    # --- outputs ---
+
+    def _open_output(self, rid, index, method):
+        """Worker thread: (path, size, etag, open file for GET) of an output, or (None, error)."""
+        path, error = self.output_path(rid, index)
+        if error:
+            return None, error
+        try:
+            f = open(path, "rb") if method == "GET" else None
+            size = os.fstat(f.fileno()).st_size if f else os.path.getsize(path)
+            return (path, size, f'"{file_etag(path)}"', f), None
+        except OSError as e:
+            return None, f"Output {os.path.basename(path)} is not readable: {e.strerror}"
+
+    async def _output(self, writer, method, headers, rid, index, keep):
+        try:
+            index = int(index)
+        except ValueError:
+            return await self._send(writer, 400, {"error": f"Invalid output index '{index}'"}, keep)
+        # Path lookup, stat, etag and open can all touch the volume; keep them off the loop
+        found, error = await self._call(self.pool, self._open_output, rid, index, method)
+        if error:
+            return await self._send(writer, 404, {"error": error}, keep)
+        path, size, etag, f = found
+        try:
+            h = {"Content-Type": mimetypes.guess_type(path)[0] or "application/octet-stream",
+                 "Accept-Ranges": "bytes", "ETag": etag,
+                 "Content-Disposition": f'inline; filename="{os.path.basename(path)}"',
+                 "Connection": "keep-alive" if keep else "close"}
+            code, start, end = 200, 0, size
+            rng = headers.get("range")
+            # Multi-range requests and a stale If-Range get the whole file
+            if rng and "," not in rng and headers.get("if-range", etag) == etag:
+                try:
+                    start, end = parse_range(rng, size)
+                except ValueError:
+                    return await self._send(writer, 416, {"error": f"Range '{rng}' not satisfiable"}, keep,
+                                            headers={"Content-Range": f"bytes */{size}"})
+                code = 206
+                h["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+            h["Content-Length"] = str(end - start)
+            self._head(writer, code, h)
+            await writer.drain()
+            if f and end > start:
+                # os.sendfile where the transport allows it, else chunked reads
+                await self.loop.sendfile(writer.transport, f, start, end - start)
+            return keep
+        finally:
+            if f:
+                f.close()
+
+
+def serve(api, host=HTTP_HOST, port=HTTP_PORT):
+    """Run the HTTP API in the foreground."""
+    asyncio.run(api.serve(host, port))
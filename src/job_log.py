@@ -0,0 +1,255 @@
+# Job Log Module
+# Bounded capture of generate.py / wan_worker output. The last few KB of each
+# stream stay in memory (for error messages and progress), while the full
+# interleaved log is streamed to a per-job gzip file on disk. The file is a
+# series of independently compressed gzip members plus a small offset index,
+# so any byte range can be served without decompressing the whole log, and
+# the file stays a valid .gz for `zcat`.
+
+import os
+import re
+import time
+import zlib
+import threading
+from collections import deque
+
+_default_dir = "/runpod-volume/cache/logs" if os.path.isdir("/runpod-volume") else "/workspace/outputs/logs"
+JOB_LOG_DIR = os.environ.get("JOB_LOG_DIR", _default_dir)
+# In-memory tail kept per stream (stdout / stderr)
+JOB_LOG_TAIL_BYTES = int(os.environ.get("JOB_LOG_TAIL_KB", "64")) * 1024
+# Uncompressed bytes per gzip member; a pending member is also flushed after JOB_LOG_FLUSH_S
+JOB_LOG_CHUNK_BYTES = int(os.environ.get("JOB_LOG_CHUNK_KB", "256")) * 1024
+JOB_LOG_FLUSH_S = float(os.environ.get("JOB_LOG_FLUSH_S", "5"))
+# Largest range one log request returns
+JOB_LOG_MAX_READ = int(os.environ.get("JOB_LOG_MAX_READ_KB", "1024")) * 1024
+JOB_LOG_TTL_S = float(os.environ.get("JOB_LOG_TTL_DAYS", "7")) * 86400
+
+_SAFE_ID = re.compile(r"^[A-Za-z0-9._-]+$")
+
+
+def log_paths(rid, log_dir=JOB_LOG_DIR):
+    """(gzip file, offset index) for a job id."""
+    if not _SAFE_ID.match(str(rid)):
+        raise ValueError(f"Invalid request_id '{rid}'")
+    base = os.path.join(log_dir, str(rid))
+    return base + ".log.gz", base + ".log.idx"
+
+
+class RingBuffer:
+    """Most recent lines up to max_bytes (a single longer line is truncated to its tail)."""
+
+    def __init__(self, max_bytes=JOB_LOG_TAIL_BYTES):
+        self.max_bytes = max_bytes
+        self.lines = deque()
+        self.size = 0
+        self.dropped = 0
+
+    def append(self, line):
+        if len(line) > self.max_bytes:
+            line = line[-self.max_bytes:]
+        self.lines.append(line)
+        self.size += len(line)
+        while self.size > self.max_bytes:
+            old = self.lines.popleft()
+            self.size -= len(old)
+            self.dropped += len(old)
+
+    def text(self):
+        return "".join(self.lines)
+
+
+class JobLog:
+    """
+    Output capture for one job: per-stream ring buffers plus an optional
+    compressed on-disk log of everything.
+
+    Args:
+        rid: job id (None keeps the capture memory-only)
+        log_dir: directory for <rid>.log.gz and <rid>.log.idx
+    """
+
+    def __init__(self, rid=None, log_dir=JOB_LOG_DIR, tail_bytes=JOB_LOG_TAIL_BYTES,
+                 chunk_bytes=JOB_LOG_CHUNK_BYTES, flush_s=JOB_LOG_FLUSH_S):
+        self.rid = rid
+        self.chunk_bytes = chunk_bytes
+        self.flush_s = flush_s
+        self.tails = {"stdout": RingBuffer(tail_bytes), "stderr": RingBuffer(tail_bytes)}
+        self.lock = threading.Lock()
+        self.pending = []
+        self.pending_bytes = 0
+        self.last_flush = time.monotonic()
+        self.bytes = 0
+        self.compressed = 0
+        self.gz = self.idx = None
+        if rid is not None:
+            _maybe_prune(log_dir)
+            try:
+                os.makedirs(log_dir, exist_ok=True)
+                path, idx = log_paths(rid, log_dir)
+                self.gz = open(path, "ab")
+                self.idx = open(idx, "a")
+                self.compressed = self.gz.tell()
+                self.bytes = _index_total(idx)
+            except (OSError, ValueError) as e:
+                print(f"[job_log] Log file unavailable for {rid}: {e}")
+                self.gz = self.idx = None
+
+    def write(self, stream, line):
+        """Record one output line from stdout or stderr."""
+        with self.lock:
+            self.tails[stream].append(line)
+            if self.gz is None:
+                return
+            data = line.encode("utf-8", "replace")
+            self.pending.append(data)
+            self.pending_bytes += len(data)
+            if self.pending_bytes >= self.chunk_bytes or time.monotonic() - self.last_flush >= self.flush_s:
+                self._flush()
+
+    def note(self, text):
+        """Add a handler-side marker line to the on-disk log (not to the tails)."""
+        with self.lock:
+            if self.gz is not None:
+                data = f"[handler] {text}\n".encode("utf-8")
+                self.pending.append(data)
+                self.pending_bytes += len(data)
+
+    def _flush(self):
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return
+        raw = b"".join(self.pending)
+        self.pending, self.pending_bytes = [], 0
+        c = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: one gzip member
+        member = c.compress(raw) + c.flush()
+        try:
+            self.gz.write(member)
+            self.gz.flush()
+            # uncompressed offset, compressed offset, compressed length, uncompressed length
+            self.idx.write(f"{self.bytes} {self.compressed} {len(member)} {len(raw)}\n")
+            self.idx.flush()
+        except OSError as e:
+            print(f"[job_log] Write failed for {self.rid}: {e}")
+            return
+        self.bytes += len(raw)
+        self.compressed += len(member)
+
+    def flush(self):
+        with self.lock:
+            if self.gz is not None:
+                self._flush()
+
+    def tail(self, stream):
+        """In-memory tail of one stream."""
+        with self.lock:
+            return self.tails[stream].text()
+
+    def close(self):
+        with self.lock:
+            if self.gz is None:
+                return
+            self._flush()
+            self.gz.close()
+            self.idx.close()
+            self.gz = self.idx = None
+
+    def summary(self):
+        with self.lock:
+            return {"bytes": self.bytes + self.pending_bytes, "compressed_bytes": self.compressed,
+                    "tail_dropped": {s: t.dropped for s, t in self.tails.items()}}
+
+
+def _read_index(idx_path):
+    rows = []
+    with open(idx_path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 4:
+                rows.append(tuple(int(x) for x in parts))
+    return rows
+
+
+def _index_total(idx_path):
+    if not os.path.exists(idx_path):
+        return 0
+    rows = _read_index(idx_path)
+    return rows[-1][0] + rows[-1][3] if rows else 0
+
+
+def parse_range(spec, size):
+    """
+    HTTP-style byte range ("bytes=0-99", "bytes=100-", "bytes=-500") -> (start, end exclusive).
+
+    Raises:
+        ValueError: malformed or unsatisfiable range
+    """
+    m = re.match(r"^\s*(?:bytes=)?(\d*)-(\d*)\s*$", str(spec))
+    if not m or (m.group(1) == "" and m.group(2) == ""):
+        raise ValueError(f"Invalid range '{spec}'")
+    if m.group(1) == "":
+        return max(0, size - int(m.group(2))), size
+    start = int(m.group(1))
+    end = min(size, int(m.group(2)) + 1) if m.group(2) else size
+    if start >= size and size > 0 or end < start:
+        raise ValueError(f"Range '{spec}' not satisfiable (log is {size} bytes)")
+    return start, end
+
+
+def read_log(rid, start=0, end=None, log_dir=JOB_LOG_DIR, max_read=JOB_LOG_MAX_READ):
+    """
+    Bytes [start, end) of a job's uncompressed log, decompressing only the
+    gzip members that overlap the range.
+
+    Returns:
+        (data bytes, start, end, total size), or None when the job has no log
+    """
+    path, idx_path = log_paths(rid, log_dir)
+    if not os.path.exists(idx_path) or not os.path.exists(path):
+        return None
+    rows = _read_index(idx_path)
+    total = rows[-1][0] + rows[-1][3] if rows else 0
+    end = total if end is None else min(end, total)
+    start = max(0, min(start, end))
+    end = min(end, start + max_read)
+    out = []
+    with open(path, "rb") as f:
+        for uoff, coff, clen, ulen in rows:
+            if uoff + ulen <= start or uoff >= end:
+                continue
+            f.seek(coff)
+            raw = zlib.decompress(f.read(clen), 31)
+            out.append(raw[max(0, start - uoff):end - uoff])
+    return b"".join(out), start, end, total
+
+
+def prune(log_dir=JOB_LOG_DIR, ttl_s=JOB_LOG_TTL_S):
+    """Delete logs older than the TTL. Returns the number of jobs removed."""
+    if not os.path.isdir(log_dir):
+        return 0
+    cutoff = time.time() - ttl_s
+    removed = 0
+    for name in os.listdir(log_dir):
+        if not name.endswith(".log.gz"):
+            continue
+        path = os.path.join(log_dir, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.unlink(path)
+                idx = path[:-len(".gz")] + ".idx"
+                if os.path.exists(idx):
+                    os.unlink(idx)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+_last_prune = 0.0
+
+
+def _maybe_prune(log_dir, every_s=3600):
+    global _last_prune
+    if time.monotonic() - _last_prune < every_s and _last_prune:
+        return
+    _last_prune = time.monotonic()
+    prune(log_dir)
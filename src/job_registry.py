@@ -0,0 +1,283 @@
+# Job Registry Module
+# Bounded in-memory view of recent jobs backed by an SQLite index on the
+# volume, so job status survives worker restarts and memory stays flat on
+# long-lived workers. Running jobs are always kept in memory (their records
+# are mutated in place by progress tracking); finished ones are evicted LRU
+# from memory and expire from the index after a TTL.
+#
+# Every row records the worker and process that last wrote it. Workers refresh
+# their active rows on a heartbeat; active rows whose process is gone (same
+# worker) or whose heartbeat lapsed (other workers) are marked LOST, so jobs
+# of a crashed or scaled-down worker do not stay RUNNING forever.
+#
+# SQLite locking is not reliable on network file systems: keep a single
+# writer per database file. With several workers on one shared volume, put
+# "{worker}" in JOB_DB_PATH to give each worker its own file.
+
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Identifies this worker in job rows (RunPod pod id, else the host name)
+WORKER_ID = os.environ.get("RUNPOD_POD_ID") or socket.gethostname()
+
+_default_db = "/runpod-volume/cache/jobs.sqlite3" if os.path.isdir("/runpod-volume") else "/workspace/outputs/jobs.sqlite3"
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH", _default_db).replace("{worker}", WORKER_ID)
+JOB_REGISTRY_MAX_MEMORY = int(os.environ.get("JOB_REGISTRY_MAX_MEMORY", "1000"))
+JOB_REGISTRY_TTL_S = float(os.environ.get("JOB_REGISTRY_TTL_DAYS", "7")) * 86400
+# Active rows of other workers not refreshed for this long are marked LOST
+JOB_REGISTRY_LEASE_S = float(os.environ.get("JOB_REGISTRY_LEASE_S", "600"))
+
+# Statuses of jobs that can still change
+ACTIVE_STATUSES = ("QUEUED", "RUNNING")
+# Status of an active job whose worker went away
+LOST_STATUS = "LOST"
+
+# Keys that live only in memory (high-frequency, meaningless after a restart)
+TRANSIENT_KEYS = ("progress",)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    request_id   TEXT PRIMARY KEY,
+    status       TEXT,
+    started      REAL,
+    completed_at REAL,
+    params_hash  TEXT,
+    outputs      TEXT,
+    record       TEXT,
+    updated      REAL,
+    worker       TEXT,
+    pid          INTEGER,
+    owner        TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_completed_at ON jobs(completed_at);
+"""
+
+# Columns added after the first schema; older index files get them on open
+OWNER_COLUMNS = (("worker", "TEXT"), ("pid", "INTEGER"), ("owner", "TEXT"))
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError, TypeError):
+        return True
+    return True
+
+
+class JobRegistry:
+    """
+    Job status store: dict-like reads, explicit writes.
+
+    Args:
+        db_path: SQLite file (None keeps the registry memory-only)
+        max_memory: finished jobs kept in memory
+        ttl_s: seconds after completion before a job is pruned from the index
+        lease_s: heartbeat lease of active rows (0 disables heartbeats and
+            lapsed-lease recovery; dead local processes are still detected)
+    """
+
+    def __init__(self, db_path=JOB_DB_PATH, max_memory=JOB_REGISTRY_MAX_MEMORY, ttl_s=JOB_REGISTRY_TTL_S,
+                 lease_s=JOB_REGISTRY_LEASE_S):
+        self.max_memory = max_memory
+        self.ttl_s = ttl_s
+        self.lease_s = lease_s
+        self.mem = OrderedDict()
+        self.lock = threading.RLock()
+        self.db = None
+        self._last_prune = 0.0
+        # pid alone is ambiguous: a restarted container often reuses it
+        self.worker, self.pid, self.owner = WORKER_ID, os.getpid(), uuid.uuid4().hex
+        if db_path:
+            try:
+                os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+                self.db = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+                self.db.executescript(SCHEMA)
+                columns = {row[1] for row in self.db.execute("PRAGMA table_info(jobs)")}
+                for name, kind in OWNER_COLUMNS:
+                    if name not in columns:
+                        self.db.execute(f"ALTER TABLE jobs ADD COLUMN {name} {kind}")
+                self.db.commit()
+            except sqlite3.Error as e:
+                print(f"[job_registry] index unavailable at {db_path}, memory only: {e}")
+                self.db = None
+        if self.db is not None:
+            lost = self.recover_lost()
+            if lost:
+                print(f"[job_registry] marked {len(lost)} job(s) of exited workers {LOST_STATUS}")
+            if self.lease_s > 0:
+                threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True).start()
+
+    # -- writes -----------------------------------------------------------
+
+    def put(self, rid, record):
+        """Register a job record (replaces any previous one)."""
+        with self.lock:
+            self.mem[rid] = record
+            self.mem.move_to_end(rid)
+            self._persist(rid, record)
+            self._evict()
+        return record
+
+    def update(self, rid, fields):
+        """Merge fields into a job record and persist it; returns the record."""
+        with self.lock:
+            record = self.get(rid)
+            if record is None:
+                record = {}
+            record.update(fields)
+            self.mem[rid] = record
+            self.mem.move_to_end(rid)
+            self._persist(rid, record)
+            self._evict()
+        return record
+
+    def _persist(self, rid, record):
+        if self.db is None:
+            return
+        stored = {k: v for k, v in record.items() if k not in TRANSIENT_KEYS}
+        try:
+            self.db.execute(
+                "INSERT OR REPLACE INTO jobs (request_id, status, started, completed_at, params_hash, outputs,"
+                " record, updated, worker, pid, owner) VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+                (rid, stored.get("status"), stored.get("started"), stored.get("completed_at"),
+                 stored.get("params_hash"), json.dumps(stored.get("outputs") or []),
+                 json.dumps(stored, default=str), time.time(), self.worker, self.pid, self.owner),
+            )
+            self.db.commit()
+        except sqlite3.Error as e:
+            print(f"[job_registry] persist failed for {rid}: {e}")
+        self._maybe_prune()
+
+    def _evict(self):
+        if len(self.mem) <= self.max_memory:
+            return
+        for rid in list(self.mem.keys()):
+            if len(self.mem) <= self.max_memory:
+                break
+            if self.mem[rid].get("status") not in ACTIVE_STATUSES:
+                del self.mem[rid]
+
+    def _maybe_prune(self, every_s=3600):
+        now = time.time()
+        if now - self._last_prune < every_s:
+            return
+        self._last_prune = now
+        try:
+            self.db.execute("DELETE FROM jobs WHERE completed_at IS NOT NULL AND completed_at < ?",
+                            (now - self.ttl_s,))
+            self.db.commit()
+        except sqlite3.Error:
+            pass
+        self.recover_lost()
+
+    # -- ownership --------------------------------------------------------
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(max(self.lease_s / 4, 1.0))
+            self.heartbeat()
+
+    def heartbeat(self):
+        """Refresh the lease of this process's active rows."""
+        with self.lock:
+            try:
+                self.db.execute(
+                    f"UPDATE jobs SET updated = ? WHERE owner = ? AND status IN ({','.join('?' * len(ACTIVE_STATUSES))})",
+                    (time.time(), self.owner, *ACTIVE_STATUSES),
+                )
+                self.db.commit()
+            except sqlite3.Error as e:
+                print(f"[job_registry] heartbeat failed: {e}")
+
+    def _owner_gone(self, worker, pid, owner, updated, now):
+        if owner == self.owner:
+            return False
+        if worker == self.worker:
+            # Same machine: an earlier process with this pid, or one that exited
+            return pid is None or pid == self.pid or not _pid_alive(pid)
+        return self.lease_s > 0 and (updated or 0) < now - self.lease_s
+
+    def recover_lost(self):
+        """Mark active rows whose worker process is gone as LOST.
+
+        Returns:
+            list of request ids marked LOST
+        """
+        if self.db is None:
+            return []
+        now = time.time()
+        lost = []
+        with self.lock:
+            try:
+                rows = self.db.execute(
+                    "SELECT request_id, record, worker, pid, owner, updated FROM jobs"
+                    f" WHERE status IN ({','.join('?' * len(ACTIVE_STATUSES))})",
+                    ACTIVE_STATUSES,
+                ).fetchall()
+                for rid, record, worker, pid, owner, updated in rows:
+                    if rid in self.mem or not self._owner_gone(worker, pid, owner, updated, now):
+                        continue
+                    record = json.loads(record or "{}")
+                    record.update({"status": LOST_STATUS, "completed_at": now,
+                                   "error": f"Worker {worker or 'unknown'} (pid {pid}) exited before the job finished"})
+                    self.db.execute("UPDATE jobs SET status = ?, completed_at = ?, record = ?, updated = ? WHERE request_id = ?",
+                                    (LOST_STATUS, now, json.dumps(record, default=str), now, rid))
+                    lost.append(rid)
+                self.db.commit()
+            except sqlite3.Error as e:
+                print(f"[job_registry] recovery failed: {e}")
+        return lost
+
+    # -- reads ------------------------------------------------------------
+
+    def get(self, rid, default=None):
+        with self.lock:
+            if rid in self.mem:
+                return self.mem[rid]
+        found = self.get_many([rid]).get(rid)
+        return found if found is not None else default
+
+    def __getitem__(self, rid):
+        record = self.get(rid)
+        if record is None:
+            raise KeyError(rid)
+        return record
+
+    def __contains__(self, rid):
+        return self.get(rid) is not None
+
+    def get_many(self, rids):
+        """Look up many jobs with one index query; unknown ids map to None."""
+        out, missing = {}, []
+        with self.lock:
+            for rid in rids:
+                if rid in self.mem:
+                    out[rid] = self.mem[rid]
+                else:
+                    missing.append(rid)
+            if missing and self.db is not None:
+                try:
+                    for i in range(0, len(missing), 500):
+                        chunk = missing[i:i + 500]
+                        rows = self.db.execute(
+                            f"SELECT request_id, record FROM jobs WHERE request_id IN ({','.join('?' * len(chunk))})",
+                            chunk,
+                        ).fetchall()
+                        for rid, record in rows:
+                            out[rid] = json.loads(record)
+                except sqlite3.Error as e:
+                    print(f"[job_registry] lookup failed: {e}")
+        for rid in rids:
+            out.setdefault(rid, None)
+        return out
+
+    def __len__(self):
+        return len(self.mem)
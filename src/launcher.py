@@ -0,0 +1,142 @@
+# Launcher Module
+# Multi-GPU launch for generate.py. Works out how many processes a WAN job
+# runs on from the visible GPUs and its ulysses/FSDP options, checks that the
+# options fit the devices and the model's attention heads, and wraps the
+# command in torchrun so only rank 0's output reaches the streaming path.
+
+import os
+import re
+import subprocess
+
+# auto | single | torchrun (torchrun = every job uses all visible GPUs)
+WAN_LAUNCHER = os.environ.get("WAN_LAUNCHER", "auto").lower()
+# Processes per distributed job (0 = all visible GPUs)
+WAN_NPROC = int(os.environ.get("WAN_NPROC", "0"))
+# Stream every rank's output instead of rank 0 only
+WAN_TORCHRUN_ALL_RANKS = os.environ.get("WAN_TORCHRUN_ALL_RANKS", "false").lower() in ("1", "true", "yes")
+
+# Attention heads per WAN 2.2 DiT; sequence parallelism splits them across ranks
+MODEL_HEADS = {"t2v": 40, "i2v": 40, "ti2v": 24, "s2v": 40, "animate": 40}
+
+# torchrun's --tee prefix on each forwarded line, e.g. "[default0]:"
+RANK_PREFIX = re.compile(r"^\[[A-Za-z_]*\d+\]:")
+
+_devices = None
+
+
+def _flag(v):
+    return str(v).lower() in ("1", "true", "yes")
+
+
+def visible_devices():
+    """GPUs this worker may use: CUDA_VISIBLE_DEVICES if set, else `nvidia-smi -L` (cached; 0 without GPUs)."""
+    global _devices
+    if _devices is None:
+        env = os.environ.get("CUDA_VISIBLE_DEVICES")
+        if env is not None:
+            ids = [d.strip() for d in env.split(",") if d.strip()]
+            # CUDA stops enumerating at the first invalid id, e.g. "-1"
+            _devices = next((i for i, d in enumerate(ids) if d.startswith("-")), len(ids))
+        else:
+            try:
+                out = subprocess.run(["nvidia-smi", "-L"], capture_output=True, text=True, timeout=10)
+                _devices = sum(1 for line in out.stdout.splitlines() if line.startswith("GPU ")) \
+                    if out.returncode == 0 else 0
+            except (OSError, subprocess.SubprocessError):
+                _devices = 0
+    return _devices
+
+
+def plan_launch(params, devices=None, mode=WAN_LAUNCHER, nproc=WAN_NPROC):
+    """
+    Resolve the process count and parallel options of a WAN job.
+
+    A job runs distributed when it sets ulysses_size > 1, t5_fsdp or
+    dit_fsdp, asks for "multi_gpu": true, or WAN_LAUNCHER is torchrun.
+    "multi_gpu" without explicit options gets the upstream multi-GPU recipe:
+    sequence parallelism over all processes with both models sharded.
+    Calling it again on its own result returns the same params.
+
+    Args:
+        params: WAN job params
+        devices: visible GPU count (default: visible_devices())
+        mode: auto | single | torchrun
+        nproc: processes per distributed job (0 = all visible GPUs)
+
+    Returns:
+        params with "nproc" set (1 for a plain generate.py run)
+
+    Raises:
+        ValueError: options that do not fit the GPUs or the model
+    """
+    devices = visible_devices() if devices is None else devices
+    out = dict(params)
+    ulysses = int(out.get("ulysses_size") or 1)
+    fsdp = _flag(out.get("t5_fsdp")) or _flag(out.get("dit_fsdp"))
+    multi = _flag(out.get("multi_gpu")) or mode == "torchrun"
+    if mode == "single":
+        if ulysses > 1 or fsdp or _flag(out.get("multi_gpu")):
+            raise ValueError("Multi-GPU options (ulysses_size, t5_fsdp, dit_fsdp, multi_gpu) "
+                             "are disabled on this worker (WAN_LAUNCHER=single)")
+        out["nproc"] = 1
+        return out
+    if not (multi or ulysses > 1 or fsdp):
+        out["nproc"] = 1
+        return out
+
+    task = str(out.get("task") or "i2v-A14B").strip() or "i2v-A14B"
+    heads = MODEL_HEADS.get(task.lower().split("-", 1)[0])
+    n = int(out.get("nproc") or 0) or (ulysses if ulysses > 1 else nproc or devices)
+    if not out.get("nproc") and ulysses == 1 and not fsdp and heads:
+        # Largest process count the heads split evenly over
+        while n > 1 and heads % n:
+            n -= 1
+    if n > devices:
+        raise ValueError(f"Job needs {n} GPUs but {devices} are visible")
+    if n < 2:
+        if mode == "torchrun" and not (ulysses > 1 or fsdp):
+            # Nothing to distribute over; run the job as a single process
+            out["nproc"] = 1
+            return out
+        raise ValueError(f"Multi-GPU options need at least 2 GPUs ({devices} visible)")
+    if ulysses == 1 and not fsdp:
+        ulysses = n
+        out.update({"t5_fsdp": True, "dit_fsdp": True})
+    if ulysses > 1 and ulysses != n:
+        raise ValueError(f"ulysses_size {ulysses} must equal the number of processes ({n})")
+    if ulysses > 1 and heads and heads % ulysses:
+        raise ValueError(f"ulysses_size {ulysses} does not divide the {heads} attention heads of {task}")
+    if ulysses > 1:
+        out["ulysses_size"] = ulysses
+    if _flag(out.get("t5_fsdp")):
+        # generate.py rejects --t5_cpu with --t5_fsdp; sharding replaces the CPU offload
+        out["t5_cpu"] = False
+    out["nproc"] = n
+    return out
+
+
+def wrap_command(cmd, nproc, all_ranks=WAN_TORCHRUN_ALL_RANKS):
+    """
+    Wrap a ["python3", "generate.py", ...] command in torchrun on this node.
+
+    Returns:
+        the command unchanged for nproc <= 1, else the torchrun command
+        (showing rank 0's output only unless all_ranks)
+    """
+    if nproc <= 1:
+        return list(cmd)
+    launch = [cmd[0], "-m", "torch.distributed.run", "--standalone", "--nnodes", "1",
+              "--nproc_per_node", str(nproc)]
+    if not all_ranks:
+        launch += ["--tee", "3", "--local-ranks-filter", "0"]
+    return launch + list(cmd[1:])
+
+
+def is_distributed(cmd):
+    """True for a command built by wrap_command with more than one process."""
+    return "torch.distributed.run" in cmd[:3]
+
+
+def strip_rank_prefix(line):
+    """A forwarded torchrun output line without its "[default0]:" prefix."""
+    return RANK_PREFIX.sub("", line, count=1)
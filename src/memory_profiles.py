@@ -0,0 +1,191 @@
+# Memory Profiles Module
+# Named WAN memory profiles (offload_model / t5_cpu / convert_model_dtype and,
+# as an opt-in last resort, fewer frames), an error classifier over generate.py
+# stderr, and per-GPU outcome records. A job that dies with CUDA OOM is
+# retried with the next, more aggressive profile, and outcomes decide which
+# profile new jobs of a given task and latent size start with.
+
+import os
+import re
+import json
+import threading
+from collections import OrderedDict
+
+from cost_model import features, gpu_info, update_json
+
+_default_path = ("/runpod-volume/cache/memory_profiles.json" if os.path.isdir("/runpod-volume")
+                 else "/workspace/outputs/memory_profiles.json")
+MEMORY_PROFILE_PATH = os.environ.get("MEMORY_PROFILE_PATH", _default_path)
+# Profile for shapes without recorded outcomes (the handler's historical defaults)
+MEMORY_DEFAULT_PROFILE = os.environ.get("MEMORY_DEFAULT_PROFILE", "lowmem")
+# OOM retries per job, each with the next profile
+MEMORY_OOM_RETRIES = int(os.environ.get("MEMORY_OOM_RETRIES", "1"))
+# Whether an OOM retry may shorten the clip (per request: allow_frame_reduction)
+MEMORY_ALLOW_FRAME_REDUCTION = os.environ.get("MEMORY_ALLOW_FRAME_REDUCTION", "false")
+
+# Least to most aggressive; frame_scale < 1 changes the output and is only an opt-in last resort
+PROFILES = OrderedDict([
+    ("performance", {"offload_model": False, "t5_cpu": False, "convert_model_dtype": False}),
+    ("balanced", {"offload_model": True, "t5_cpu": False, "convert_model_dtype": True}),
+    ("lowmem", {"offload_model": True, "t5_cpu": True, "convert_model_dtype": True}),
+    ("ultralowmem", {"offload_model": True, "t5_cpu": True, "convert_model_dtype": True, "frame_scale": 0.5}),
+])
+PROFILE_FLAGS = ("offload_model", "t5_cpu", "convert_model_dtype")
+
+# (class, pattern) checked in order against the tail of stderr
+ERROR_PATTERNS = (
+    ("oom", re.compile(r"CUDA out of memory|OutOfMemoryError|CUBLAS_STATUS_ALLOC_FAILED|"
+                       r"cudaErrorMemoryAllocation|CUDNN_STATUS_(?:ALLOC_FAILED|NOT_INITIALIZED)", re.I)),
+    ("host_oom", re.compile(r"^Killed$|Cannot allocate memory|std::bad_alloc", re.I | re.M)),
+    ("missing_model", re.compile(r"(?:FileNotFoundError|No such file or directory).*\.(?:pth|safetensors|bin|json)", re.I)),
+    ("cuda", re.compile(r"CUDA error|NCCL error|device-side assert|no CUDA GPUs", re.I)),
+)
+
+
+def classify_error(returncode, stderr):
+    """
+    Classify a failed generate.py run.
+
+    Returns:
+        "oom", "host_oom", "missing_model", "cuda" or "other" (None when it succeeded)
+    """
+    if returncode == 0:
+        return None
+    tail = (stderr or "")[-20000:]
+    for name, pattern in ERROR_PATTERNS:
+        if pattern.search(tail):
+            return name
+    # SIGKILL with no message is almost always the kernel OOM killer
+    if returncode in (-9, 137):
+        return "host_oom"
+    return "other"
+
+
+def _flag(v):
+    return str(v).lower() in ("1", "true", "yes")
+
+
+class MemoryProfiles:
+    """
+    Profile choice, application and outcome records per GPU type.
+
+    Args:
+        path: JSON outcome file (None keeps outcomes in memory)
+        default: profile for shapes without recorded outcomes
+    """
+
+    def __init__(self, path=MEMORY_PROFILE_PATH, default=MEMORY_DEFAULT_PROFILE):
+        self.path = path
+        self.default = default if default in PROFILES and not PROFILES[default].get("frame_scale") else "lowmem"
+        self.lock = threading.Lock()
+        self.data = {}
+        if path and os.path.isfile(path):
+            try:
+                with open(path) as f:
+                    self.data = json.load(f)
+            except Exception as e:
+                print(f"[memory_profiles] Could not read {path}: {e}")
+
+    def _update(self, change):
+        # Caller holds self.lock; other workers' outcomes are merged, not overwritten
+        if self.path:
+            try:
+                self.data = update_json(self.path, change)
+                return
+            except OSError as e:
+                print(f"[memory_profiles] Could not write {self.path}: {e}")
+        change(self.data)
+
+    def _outcomes(self, task):
+        return self.data.get(gpu_info()["name"], {}).get(task, {})
+
+    def choose(self, params):
+        """
+        Profile a job starts with: the requested one, "custom" when the request
+        sets memory flags itself, else the least aggressive profile known to
+        work at this task and latent size (falling back to the default, moved
+        past profiles that ran out of memory at this size or smaller).
+        """
+        name = str(params.get("memory_profile") or "auto").lower()
+        if name != "auto":
+            if name not in PROFILES:
+                raise ValueError(f"Unknown memory_profile '{name}'. Use auto|{'|'.join(PROFILES)}")
+            return name
+        if any(params.get(k) not in (None, "") for k in PROFILE_FLAGS):
+            return "custom"
+        f = features(params)
+        with self.lock:
+            seen = self._outcomes(f["task"])
+            # Profiles that shorten the clip are never picked automatically
+            names = [n for n, p in PROFILES.items() if not p.get("frame_scale")]
+            for name in names:
+                o = seen.get(name, {})
+                if o.get("ok_tokens", 0) >= f["tokens"] and (o.get("oom_tokens") or float("inf")) > f["tokens"]:
+                    return name
+            i = names.index(self.default)
+            while i < len(names) - 1 and (seen.get(names[i], {}).get("oom_tokens") or float("inf")) <= f["tokens"]:
+                i += 1
+            return names[i]
+
+    def apply(self, params, name):
+        """Params with the profile's settings; records the profile as params["memory_profile"]."""
+        out = dict(params)
+        if name == "custom":
+            flags = {k: _flag(out.get(k, True)) for k in PROFILE_FLAGS}
+            # Explicit flags that match a named profile count as that profile
+            name = next((n for n, p in PROFILES.items() if "frame_scale" not in p
+                         and all(p[k] == flags[k] for k in PROFILE_FLAGS)), "custom")
+        else:
+            profile = PROFILES[name]
+            out.update({k: profile[k] for k in PROFILE_FLAGS})
+            if profile.get("frame_scale"):
+                frames = features(out)["frame_num"]
+                out.pop("num_frames", None)
+                # generate.py wants 4n+1 frames
+                out["frame_num"] = max(5, int((frames - 1) * profile["frame_scale"]) // 4 * 4 + 1)
+        out["memory_profile"] = name
+        return out
+
+    def next_profile(self, params):
+        """The next more aggressive profile after the one params ran with, or None.
+        Profiles that shorten the clip are skipped unless the request sets
+        allow_frame_reduction (default MEMORY_ALLOW_FRAME_REDUCTION)."""
+        name = params.get("memory_profile")
+        allow = _flag(params.get("allow_frame_reduction", MEMORY_ALLOW_FRAME_REDUCTION))
+        names = list(PROFILES)
+        if name in PROFILES:
+            rest = names[names.index(name) + 1:]
+            return next((n for n in rest if allow or not PROFILES[n].get("frame_scale")), None)
+        flags = {k: _flag(params.get(k, True)) for k in PROFILE_FLAGS}
+        for n, p in PROFILES.items():
+            if p.get("frame_scale") and not allow:
+                continue
+            if all(p[k] >= flags[k] for k in PROFILE_FLAGS) and any(p[k] != flags[k] for k in PROFILE_FLAGS):
+                return n
+        return None
+
+    def record(self, params, ok):
+        """Record a run's outcome (ok, or out of GPU memory) for its profile, task and latent size."""
+        name = params.get("memory_profile")
+        if name not in PROFILES:
+            return
+        f = features(params)
+        gpu = gpu_info()["name"]
+
+        def add(data):
+            o = (data.setdefault(gpu, {}).setdefault(f["task"], {})
+                 .setdefault(name, {"ok": 0, "oom": 0, "ok_tokens": 0, "oom_tokens": None}))
+            if ok:
+                o["ok"] += 1
+                o["ok_tokens"] = max(o["ok_tokens"], f["tokens"])
+            else:
+                o["oom"] += 1
+                o["oom_tokens"] = f["tokens"] if o["oom_tokens"] is None else min(o["oom_tokens"], f["tokens"])
+
+        with self.lock:
+            self._update(add)
+
+    def summary(self):
+        with self.lock:
+            return {"default": self.default, "profiles": dict(PROFILES),
+                    "outcomes": json.loads(json.dumps(self.data.get(gpu_info()["name"], {})))}
@@ -0,0 +1,399 @@
+# Local Model Cache Module
+# Container-local disk tier in front of the network volume. Model folders
+# (WAN CLI) and model files (ComfyUI) that jobs actually use are copied in the
+# background to local disk, checked against the source's sha256 where the
+# volume records one and published with an atomic rename; the tier is bounded by a byte budget and evicted LRU by size.
+#
+# Both backends see the tier through a generated path overlay:
+#   - WAN: <root>/overlay/<model folder> is a symlink to the volume folder,
+#     swapped atomically to the local copy once it is complete. The handler
+#     always passes the overlay path, so a resident pipeline's ckpt_dir never
+#     changes and warm reloads hit local disk.
+#   - ComfyUI: a generated extra_model_paths file registers
+#     <root>/comfyui/<category>/ ahead of the volume roots (is_default).
+
+import os
+import json
+import time
+import uuid
+import queue
+import shutil
+import hashlib
+import threading
+from collections import Counter
+
+LOCAL_MODEL_CACHE_DIR = os.environ.get("LOCAL_MODEL_CACHE_DIR", "/workspace/model_cache")
+# 0 disables the tier
+LOCAL_MODEL_CACHE_MAX_BYTES = int(float(os.environ.get("LOCAL_MODEL_CACHE_GB", "0")) * (1 << 30))
+# Uses before a model is copied locally
+LOCAL_MODEL_CACHE_MIN_HITS = int(os.environ.get("LOCAL_MODEL_CACHE_MIN_HITS", "1"))
+# Free space always left on the local disk
+LOCAL_MODEL_CACHE_RESERVE_GB = float(os.environ.get("LOCAL_MODEL_CACHE_RESERVE_GB", "10"))
+# Seconds between checks that a cached model's volume source is unchanged
+# (each check stats every file of the folder on the volume)
+LOCAL_MODEL_CACHE_CHECK_S = float(os.environ.get("LOCAL_MODEL_CACHE_CHECK_S", "300"))
+
+COPY_CHUNK_BYTES = 16 << 20
+
+
+# huggingface-cli --local-dir download metadata (commit, etag, timestamp per
+# line); for LFS files the etag is the content sha256. Older hub versions
+# used .huggingface/download
+HF_METADATA_DIRS = (os.path.join(".cache", "huggingface", "download"), os.path.join(".huggingface", "download"))
+
+
+def source_digest(root, rel):
+    """
+    sha256 the volume records for a model file, or None when it has none.
+
+    Args:
+        root: downloaded folder (a WAN model folder, or a ComfyUI file's directory)
+        rel: file path relative to root
+    """
+    for d in HF_METADATA_DIRS:
+        try:
+            with open(os.path.join(root, d, f"{rel}.metadata")) as f:
+                lines = f.read().split("\n")
+        except OSError:
+            continue
+        etag = lines[1].strip().strip('"').lower() if len(lines) > 1 else ""
+        if len(etag) == 64 and all(c in "0123456789abcdef" for c in etag):
+            return etag
+    return None
+
+
+def _copy_verified(src, dst, expected=None):
+    """
+    Copy src to dst (via a temp file), hashing the bytes as they are copied.
+
+    Args:
+        expected: the source's recorded sha256; the copy is rejected if the
+            bytes read from the volume do not match it
+
+    Returns:
+        sha256 hex of the content
+
+    Raises:
+        OSError: on I/O errors or checksum mismatch (dst is not created)
+    """
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp = os.path.join(os.path.dirname(dst), f".{os.path.basename(dst)}.{uuid.uuid4().hex}.tmp")
+    h = hashlib.sha256()
+    try:
+        with open(src, "rb") as fi, open(tmp, "wb") as fo:
+            for chunk in iter(lambda: fi.read(COPY_CHUNK_BYTES), b""):
+                h.update(chunk)
+                fo.write(chunk)
+            fo.flush()
+            os.fsync(fo.fileno())
+        if expected and h.hexdigest() != expected:
+            raise OSError(f"checksum mismatch copying {src}: got {h.hexdigest()}, source records {expected}")
+        shutil.copystat(src, tmp)
+        os.replace(tmp, dst)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+    return h.hexdigest()
+
+
+def _source_files(src):
+    """{relative path: (size, mtime_ns)} of a file or every file under a folder."""
+    if os.path.isfile(src):
+        st = os.stat(src)
+        return {"": (st.st_size, st.st_mtime_ns)}
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(src, followlinks=True):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for fn in filenames:
+            full = os.path.join(dirpath, fn)
+            try:
+                st = os.stat(full)
+            except OSError:
+                continue
+            files[os.path.relpath(full, src)] = (st.st_size, st.st_mtime_ns)
+    return files
+
+
+class ModelCache:
+    """
+    Size-bounded LRU copy of hot model folders/files on local disk.
+
+    Args:
+        root: local cache directory (container disk, not the volume)
+        max_bytes: byte budget; 0 disables the tier
+        min_hits: uses of a model before it is copied
+    """
+
+    def __init__(self, root=LOCAL_MODEL_CACHE_DIR, max_bytes=LOCAL_MODEL_CACHE_MAX_BYTES,
+                 min_hits=LOCAL_MODEL_CACHE_MIN_HITS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.min_hits = min_hits
+        self.enabled = max_bytes > 0
+        self.lock = threading.RLock()
+        self.hits = Counter()
+        self.pending = set()
+        self.queue = queue.Queue()
+        self.thread = None
+        # Cleared while a GPU job runs so copies don't compete with model loads
+        self.idle = threading.Event()
+        self.idle.set()
+        self.stats = {"copied": 0, "copied_bytes": 0, "copy_s": 0.0, "evicted": 0,
+                      "evicted_bytes": 0, "failures": 0, "local_hits": 0}
+        self.index = {}
+        # monotonic time each entry's source was last found unchanged
+        self.checked = {}
+        self.check_s = LOCAL_MODEL_CACHE_CHECK_S
+        if self.enabled:
+            os.makedirs(os.path.join(root, "overlay"), exist_ok=True)
+            self.index = self._load_index()
+
+    # -- index --------------------------------------------------------------
+
+    def _index_path(self):
+        return os.path.join(self.root, "index.json")
+
+    def _load_index(self):
+        try:
+            with open(self._index_path()) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # Drop entries whose local copy vanished (e.g. a fresh container disk)
+        return {k: e for k, e in index.items() if os.path.exists(e["dst"])}
+
+    def _save_index(self):
+        tmp = f"{self._index_path()}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self._index_path())
+
+    def used_bytes(self):
+        return sum(e["bytes"] for e in self.index.values())
+
+    def _fresh(self, entry):
+        """True while the volume source is unchanged since it was copied (re-checked every check_s)."""
+        last = self.checked.get(entry["src"])
+        if last is not None and time.monotonic() - last < self.check_s:
+            return True
+        try:
+            current = _source_files(entry["src"])
+        except OSError:
+            return False
+        fresh = {k: list(v) for k, v in current.items()} == {k: v[:2] for k, v in entry["files"].items()}
+        if fresh:
+            self.checked[entry["src"]] = time.monotonic()
+        return fresh
+
+    # -- overlay ------------------------------------------------------------
+
+    def _overlay_link(self, name):
+        return os.path.join(self.root, "overlay", name)
+
+    def _point(self, link, target):
+        """Atomically (re)point a symlink."""
+        if os.path.islink(link) and os.readlink(link) == target:
+            return
+        tmp = f"{link}.{uuid.uuid4().hex}.tmp"
+        os.symlink(target, tmp)
+        os.replace(tmp, link)
+
+    def wan_path(self, src_dir):
+        """
+        Stable ckpt_dir for a WAN model folder: the overlay symlink (local copy
+        when cached and fresh, else the volume folder). Records the use.
+        """
+        if not self.enabled:
+            return src_dir
+        with self.lock:
+            entry = self.index.get(src_dir)
+            target = src_dir
+            if entry and self._fresh(entry):
+                target = entry["dst"]
+                entry["last_used"] = time.time()
+                self.stats["local_hits"] += 1
+            elif entry:
+                self._evict(src_dir)
+            link = self._overlay_link(os.path.basename(src_dir.rstrip("/")))
+            try:
+                self._point(link, target)
+            except OSError as e:
+                print(f"[model_cache] overlay unavailable for {src_dir}: {e}")
+                return src_dir
+        self.touch(src_dir, "wan")
+        return link
+
+    def comfyui_dir(self, category):
+        return os.path.join(self.root, "comfyui", category)
+
+    def write_comfyui_config(self, path, categories):
+        """
+        Generate an extra_model_paths file that puts the local tier ahead of the
+        volume for each ComfyUI model category (pass it with
+        --extra-model-paths-config).
+        """
+        lines = ["# Generated by model_cache.py - local disk tier for ComfyUI models",
+                 "local_model_cache:", f"  base_path: {os.path.join(self.root, 'comfyui')}", "  is_default: true"]
+        for cat in sorted(set(categories)):
+            os.makedirs(self.comfyui_dir(cat), exist_ok=True)
+            lines.append(f"  {cat}: {cat}/")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        return path
+
+    # -- promotion ----------------------------------------------------------
+
+    def touch(self, src, kind, category=None, rel=None):
+        """
+        Record a use of a model folder ("wan") or file ("comfyui"); queues a
+        background copy once it is hot.
+        """
+        if not self.enabled or not src:
+            return
+        with self.lock:
+            entry = self.index.get(src)
+            if entry:
+                entry["last_used"] = time.time()
+                return
+            self.hits[src] += 1
+            if self.hits[src] < self.min_hits or src in self.pending:
+                return
+            self.pending.add(src)
+        self.queue.put((src, kind, category, rel))
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, daemon=True, name="model-cache")
+            self.thread.start()
+
+    def pause(self):
+        self.idle.clear()
+
+    def resume(self):
+        self.idle.set()
+
+    def _run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=60)
+            except queue.Empty:
+                return
+            self.idle.wait()
+            try:
+                self._promote(*item)
+            except Exception as e:
+                self.stats["failures"] += 1
+                print(f"[model_cache] copy of {item[0]} failed: {e}")
+            finally:
+                with self.lock:
+                    self.pending.discard(item[0])
+
+    def _promote(self, src, kind, category, rel):
+        files = _source_files(src)
+        size = sum(s for s, _ in files.values())
+        with self.lock:
+            if not self._ensure_space(size, protect=src):
+                print(f"[model_cache] {src} ({size / (1 << 30):.1f} GB) does not fit the local budget")
+                return
+        t0 = time.monotonic()
+        if kind == "wan":
+            name = os.path.basename(src.rstrip("/"))
+            dst = os.path.join(self.root, "wan", name)
+            staging = os.path.join(self.root, ".staging", uuid.uuid4().hex)
+            try:
+                digests = {}
+                for r in files:
+                    self.idle.wait()
+                    digests[r] = _copy_verified(os.path.join(src, r), os.path.join(staging, r), source_digest(src, r))
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                if os.path.exists(dst):
+                    old = f"{dst}.old-{uuid.uuid4().hex}"
+                    os.replace(dst, old)
+                    shutil.rmtree(old, ignore_errors=True)
+                os.replace(staging, dst)
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+        else:
+            dst = os.path.join(self.comfyui_dir(category or "other"), rel or os.path.basename(src))
+            digests = {"": _copy_verified(src, dst, source_digest(os.path.dirname(src), os.path.basename(src)))}
+        if _source_files(src) != files:
+            # Source changed during the copy; let the next use retry
+            if os.path.isdir(dst):
+                shutil.rmtree(dst, ignore_errors=True)
+            elif os.path.exists(dst):
+                os.unlink(dst)
+            return
+        with self.lock:
+            self.index[src] = {"kind": kind, "src": src, "dst": dst, "bytes": size, "last_used": time.time(),
+                               "files": {r: [s, m, digests[r]] for r, (s, m) in files.items()}}
+            self.checked[src] = time.monotonic()
+            self._save_index()
+            if kind == "wan":
+                self._point(self._overlay_link(os.path.basename(src.rstrip("/"))), dst)
+            self.stats["copied"] += 1
+            self.stats["copied_bytes"] += size
+            self.stats["copy_s"] += time.monotonic() - t0
+        print(f"[model_cache] cached {src} -> {dst} ({size / (1 << 30):.2f} GB in {time.monotonic() - t0:.1f}s)")
+
+    # -- eviction -----------------------------------------------------------
+
+    def _ensure_space(self, nbytes, protect=None):
+        """Evict LRU entries until nbytes fits the budget and the disk reserve."""
+        if nbytes > self.max_bytes:
+            return False
+
+        def disk_free():
+            try:
+                return shutil.disk_usage(self.root).free - int(LOCAL_MODEL_CACHE_RESERVE_GB * (1 << 30))
+            except OSError:
+                return 0
+
+        for key in sorted(self.index, key=lambda k: self.index[k]["last_used"]):
+            if self.used_bytes() + nbytes <= self.max_bytes and disk_free() >= nbytes:
+                break
+            if key != protect:
+                self._evict(key)
+        return self.used_bytes() + nbytes <= self.max_bytes and disk_free() >= nbytes
+
+    def _evict(self, key):
+        self.checked.pop(key, None)
+        entry = self.index.pop(key, None)
+        if entry is None:
+            return
+        if entry["kind"] == "wan":
+            # Point the overlay back at the volume before removing the copy;
+            # processes that already opened files keep their inodes
+            link = self._overlay_link(os.path.basename(entry["src"].rstrip("/")))
+            if os.path.islink(link):
+                self._point(link, entry["src"])
+            shutil.rmtree(entry["dst"], ignore_errors=True)
+        elif os.path.exists(entry["dst"]):
+            os.unlink(entry["dst"])
+        self.stats["evicted"] += 1
+        self.stats["evicted_bytes"] += entry["bytes"]
+        self._save_index()
+
+    def summary(self):
+        with self.lock:
+            return {
+                "enabled": self.enabled,
+                "root": self.root,
+                "max_bytes": self.max_bytes,
+                "used_bytes": self.used_bytes(),
+                "entries": {k: {"dst": e["dst"], "bytes": e["bytes"], "last_used": e["last_used"]}
+                            for k, e in self.index.items()},
+                "pending": sorted(self.pending),
+                **self.stats,
+            }
+
+
+if __name__ == "__main__":
+    # bootstrap.sh: write the ComfyUI overlay config before ComfyUI starts
+    import sys
+    from model_catalog import comfyui_roots
+    out = sys.argv[1]
+    comfyui_root = os.environ.get("COMFYUI_ROOT", "/workspace/runpod-slim/ComfyUI")
+    cache = ModelCache()
+    if not cache.enabled:
+        sys.exit(1)
+    cats = comfyui_roots([os.path.join(comfyui_root, "extra_model_paths.yaml")], comfyui_root)
+    print(cache.write_comfyui_config(out, cats))
@@ -0,0 +1,314 @@
+# Model Catalog Module
+# Index of the models this worker can serve, built once at startup: WAN CLI
+# model folders under WAN_CKPT_DIR and ComfyUI model files under the roots in
+# extra_model_paths.yaml. The scan is cached as a JSON manifest keyed on
+# directory mtimes, and requests resolve a task to its folder with one dict
+# lookup instead of guessing paths per request.
+
+import os
+import json
+import glob
+import time
+import threading
+
+_default_manifest = ("/runpod-volume/cache/model_catalog.json" if os.path.isdir("/runpod-volume")
+                     else "/workspace/outputs/model_catalog.json")
+MODEL_CATALOG_PATH = os.environ.get("MODEL_CATALOG_PATH", _default_manifest)
+# Lookup misses re-walk the model roots at most this often (new downloads show up within it)
+MODEL_CATALOG_REFRESH_S = float(os.environ.get("MODEL_CATALOG_REFRESH_S", "30"))
+
+# WAN CLI model folders: task prefix, tasks served, files generate.py needs
+WAN_FAMILIES = {
+    "Wan2.2-T2V-A14B": {"prefix": "t2v", "tasks": ["t2v-A14B"],
+                        "required": ["models_t5_*.pth", "Wan2.1_VAE.pth", "high_noise_model", "low_noise_model"]},
+    "Wan2.2-I2V-A14B": {"prefix": "i2v", "tasks": ["i2v-A14B"],
+                        "required": ["models_t5_*.pth", "Wan2.1_VAE.pth", "high_noise_model", "low_noise_model"]},
+    "Wan2.2-TI2V-5B": {"prefix": "ti2v", "tasks": ["ti2v-5B"],
+                       "required": ["models_t5_*.pth", "Wan2.2_VAE.pth"]},
+    "Wan2.2-S2V-14B": {"prefix": "s2v", "tasks": ["s2v-14B"],
+                       "required": ["models_t5_*.pth", "Wan2.1_VAE.pth"]},
+    "Wan2.2-Animate-14B": {"prefix": "animate", "tasks": ["animate-14B"],
+                           "required": ["models_t5_*.pth", "Wan2.1_VAE.pth"]},
+}
+TASK_PREFIXES = {spec["prefix"]: name for name, spec in WAN_FAMILIES.items()}
+
+MODEL_FILE_EXTS = (".safetensors", ".pt", ".pth", ".ckpt", ".bin", ".gguf", ".sft")
+
+# Tokens in ComfyUI file names that tell which task a file serves (longest first)
+COMFYUI_TASK_TOKENS = ("ti2v", "s2v", "i2v", "t2v", "animate")
+
+
+class ModelNotFoundError(ValueError):
+    """No installed model can serve the requested task."""
+
+
+def task_prefix(task):
+    """'ti2v-5B' -> 'ti2v' (exact token, so ti2v never matches i2v)."""
+    return str(task or "").strip().lower().split("-", 1)[0]
+
+
+def _dir_mtimes(roots):
+    """mtime_ns of every directory under roots (files are not stat'ed)."""
+    sig = {}
+    for root in roots:
+        if not os.path.isdir(root):
+            sig[root] = None
+            continue
+        for dirpath, dirnames, _ in os.walk(root, followlinks=True):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            try:
+                sig[dirpath] = os.stat(dirpath).st_mtime_ns
+            except OSError:
+                pass
+    return sig
+
+
+def _scan_files(path):
+    """{relative path: size} of every file under path."""
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(path, followlinks=True):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for fn in filenames:
+            full = os.path.join(dirpath, fn)
+            try:
+                files[os.path.relpath(full, path)] = os.path.getsize(full)
+            except OSError:
+                pass
+    return files
+
+
+def comfyui_roots(config_paths, comfyui_root=None):
+    """
+    Model category directories from ComfyUI's extra_model_paths.yaml.
+
+    Returns:
+        {category: [directories]} (ComfyUI's own models/ dir included)
+    """
+    roots = {}
+    if comfyui_root:
+        base = os.path.join(comfyui_root, "models")
+        if os.path.isdir(base):
+            for cat in sorted(os.listdir(base)):
+                if os.path.isdir(os.path.join(base, cat)):
+                    roots.setdefault(cat, []).append(os.path.join(base, cat))
+    try:
+        import yaml
+    except ImportError:
+        return roots
+    for cfg in config_paths:
+        if not cfg or not os.path.isfile(cfg):
+            continue
+        try:
+            with open(cfg) as f:
+                doc = yaml.safe_load(f) or {}
+        except Exception as e:
+            print(f"[model_catalog] Could not parse {cfg}: {e}")
+            continue
+        for section in doc.values():
+            if not isinstance(section, dict):
+                continue
+            base = os.path.expanduser(str(section.get("base_path", "")))
+            for cat, rel in section.items():
+                if cat in ("base_path", "is_default") or not isinstance(rel, str):
+                    continue
+                for line in rel.splitlines():
+                    line = line.strip()
+                    if line:
+                        d = os.path.normpath(os.path.join(base, line))
+                        if d not in roots.get(cat, []):
+                            roots.setdefault(cat, []).append(d)
+    return roots
+
+
+class ModelCatalog:
+    """
+    Startup index of WAN model folders and ComfyUI model files.
+
+    Args:
+        ckpt_dir: WAN_CKPT_DIR holding Wan2.2-* model folders
+        comfyui_configs: extra_model_paths.yaml files to read
+        comfyui_root: ComfyUI install (its models/ dir is scanned too)
+        manifest_path: JSON manifest cache (None disables it)
+    """
+
+    def __init__(self, ckpt_dir, comfyui_configs=(), comfyui_root=None, manifest_path=MODEL_CATALOG_PATH,
+                 refresh_s=MODEL_CATALOG_REFRESH_S):
+        self.ckpt_dir = ckpt_dir
+        self.comfyui_configs = [p for p in comfyui_configs if p]
+        self.comfyui_root = comfyui_root
+        self.manifest_path = manifest_path
+        self.refresh_s = refresh_s
+        self.checked_at = None
+        self.lock = threading.Lock()
+        self.wan = {}
+        self.by_task = {}
+        self.comfyui = {}
+        self.signature = None
+        self.built_at = None
+        self.source = None
+
+    def _roots(self):
+        # Only the WAN family folders under ckpt_dir: WAN_CKPT_DIR may be the
+        # volume root, whose cache/ (this manifest, logs, results) changes constantly
+        cats = comfyui_roots(self.comfyui_configs, self.comfyui_root)
+        wan_roots = [os.path.join(self.ckpt_dir, name) for name in sorted(WAN_FAMILIES)]
+        return cats, wan_roots + sorted({d for dirs in cats.values() for d in dirs})
+
+    def _signature(self, roots):
+        try:
+            ckpt_mtime = os.stat(self.ckpt_dir).st_mtime_ns
+        except OSError:
+            ckpt_mtime = None
+        return {"ckpt_dir": self.ckpt_dir, "ckpt_dir_mtime": ckpt_mtime,
+                "configs": {p: os.path.getmtime(p) if os.path.exists(p) else None for p in self.comfyui_configs},
+                "dirs": _dir_mtimes(roots)}
+
+    def load(self, force=False):
+        """Use the manifest if directory mtimes still match, else rescan. Returns self."""
+        with self.lock:
+            self.checked_at = time.monotonic()
+            cats, roots = self._roots()
+            sig = self._signature(roots)
+            if not force and sig == self.signature:
+                return self
+            manifest = None if force else self._read_manifest()
+            if manifest and manifest.get("signature") == sig:
+                self._apply(manifest, "manifest")
+                return self
+            t0 = time.monotonic()
+            data = {"signature": sig, "built_at": time.time(),
+                    "wan": self._scan_wan(), "comfyui": self._scan_comfyui(cats)}
+            data["scan_s"] = round(time.monotonic() - t0, 3)
+            self._apply(data, "scan")
+            self._write_manifest(data)
+            return self
+
+    def refresh(self):
+        """Rescan only if something changed on disk."""
+        return self.load()
+
+    def _refresh_on_miss(self):
+        """refresh() after a lookup miss, at most once per refresh_s (each check walks every root)."""
+        checked = self.checked_at
+        if checked is None or time.monotonic() - checked >= self.refresh_s:
+            self.refresh()
+
+    def _apply(self, data, source):
+        self.wan = data["wan"]
+        self.comfyui = data["comfyui"]
+        self.signature = data["signature"]
+        self.built_at = data.get("built_at")
+        self.source = source
+        by_task = {}
+        for name, entry in self.wan.items():
+            for task in entry["tasks"]:
+                by_task[task.lower()] = entry
+            by_task.setdefault(task_prefix(entry["tasks"][0]), entry)
+            by_task[name.lower()] = entry
+        self.by_task = by_task
+
+    def _scan_wan(self):
+        wan = {}
+        if not os.path.isdir(self.ckpt_dir):
+            return wan
+        for name in sorted(os.listdir(self.ckpt_dir)):
+            path = os.path.join(self.ckpt_dir, name)
+            spec = WAN_FAMILIES.get(name)
+            if spec is None or not os.path.isdir(path):
+                continue
+            files = _scan_files(path)
+            missing = [pat for pat in spec["required"] if not glob.glob(os.path.join(path, pat))]
+            wan[name] = {
+                "name": name,
+                "path": path,
+                "backend": "wan",
+                "tasks": spec["tasks"],
+                "files": files,
+                "bytes": sum(files.values()),
+                "missing": missing,
+            }
+        return wan
+
+    def _scan_comfyui(self, cats):
+        out = {}
+        for cat, dirs in cats.items():
+            for d in dirs:
+                if not os.path.isdir(d):
+                    continue
+                for rel, size in _scan_files(d).items():
+                    if not rel.lower().endswith(MODEL_FILE_EXTS):
+                        continue
+                    low = os.path.basename(rel).lower()
+                    tasks = [t for t in COMFYUI_TASK_TOKENS if t in low.replace("-", "_").split("_")]
+                    # ComfyUI lists files by path relative to the category root
+                    out.setdefault(cat, {}).setdefault(rel, {"path": os.path.join(d, rel), "bytes": size,
+                                                              "tasks": tasks, "backend": "comfyui"})
+        return out
+
+    def _read_manifest(self):
+        if not self.manifest_path or not os.path.isfile(self.manifest_path):
+            return None
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def _write_manifest(self, data):
+        if not self.manifest_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.manifest_path) or ".", exist_ok=True)
+            tmp = f"{self.manifest_path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.manifest_path)
+        except OSError as e:
+            print(f"[model_catalog] Could not write manifest: {e}")
+
+    def resolve(self, task):
+        """
+        WAN model folder entry for a task ('i2v-A14B', 'ti2v-5B', ...).
+
+        Raises:
+            ModelNotFoundError: no complete model folder serves the task
+        """
+        key = str(task or "").strip().lower()
+        entry = self.by_task.get(key) or self.by_task.get(task_prefix(key))
+        if entry is None or entry["missing"]:
+            self._refresh_on_miss()  # picks up freshly downloaded models
+            entry = self.by_task.get(key) or self.by_task.get(task_prefix(key))
+        if entry is None:
+            family = TASK_PREFIXES.get(task_prefix(key))
+            if family is None:
+                raise ModelNotFoundError(
+                    f"Unknown task '{task}'. Supported: {', '.join(t for s in WAN_FAMILIES.values() for t in s['tasks'])}")
+            raise ModelNotFoundError(
+                f"Model for task '{task}' not installed: expected folder {os.path.join(self.ckpt_dir, family)} "
+                f"(installed: {', '.join(sorted(self.wan)) or 'none'})")
+        if entry["missing"]:
+            raise ModelNotFoundError(
+                f"Model folder {entry['path']} for task '{task}' is incomplete; missing {', '.join(entry['missing'])}")
+        return entry
+
+    def has_comfyui_model(self, category, name):
+        """True/False for a ComfyUI model file, None when the category was not scanned."""
+        files = self.comfyui.get(category)
+        if not files or name not in files:
+            self._refresh_on_miss()  # files copied to the volume after startup
+            files = self.comfyui.get(category)
+        if not files:
+            return None
+        return name in files
+
+    def summary(self):
+        """Catalog overview without per-file listings."""
+        return {
+            "ckpt_dir": self.ckpt_dir,
+            "source": self.source,
+            "built_at": self.built_at,
+            "wan": {name: {"path": e["path"], "tasks": e["tasks"], "bytes": e["bytes"],
+                           "files": len(e["files"]), "missing": e["missing"]} for name, e in self.wan.items()},
+            "comfyui": {cat: {name: {"bytes": f["bytes"], "tasks": f["tasks"]} for name, f in files.items()}
+                        for cat, files in self.comfyui.items()},
+        }
@@ -0,0 +1,117 @@
+# Object Storage Delivery Module
+# Uploads outputs to an S3-compatible bucket (AWS S3, MinIO, R2, ...) with
+# parallel multipart transfers and returns presigned GET URLs, so large
+# results don't have to travel inline as base64 in the job response.
+
+import os
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+S3_BUCKET = os.environ.get("S3_BUCKET", "")
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL") or None
+S3_REGION = os.environ.get("S3_REGION") or None
+S3_PREFIX = os.environ.get("S3_PREFIX", "wan22/")
+S3_PRESIGN_EXPIRES_S = int(os.environ.get("S3_PRESIGN_EXPIRES_S", "86400"))
+S3_MULTIPART_CHUNK_MB = int(os.environ.get("S3_MULTIPART_CHUNK_MB", "16"))
+S3_UPLOAD_WORKERS = int(os.environ.get("S3_UPLOAD_WORKERS", "8"))
+
+# RunPod rejects job outputs above its payload limit (10 MB for /run)
+RESPONSE_LIMIT_BYTES = int(float(os.environ.get("RUNPOD_RESPONSE_LIMIT_MB", "10")) * (1 << 20))
+
+
+def inline_size(nbytes, prefix_len=32):
+    """Size of a base64 data URI for nbytes of payload."""
+    return 4 * math.ceil(nbytes / 3) + prefix_len
+
+
+class OutputStore:
+    """
+    S3-compatible output backend.
+
+    Args:
+        bucket: target bucket (empty disables the store)
+        endpoint_url: custom endpoint for MinIO/R2/moto; None for AWS
+        client: pre-built boto3 S3 client (tests, custom sessions)
+    """
+
+    def __init__(self, bucket=S3_BUCKET, endpoint_url=S3_ENDPOINT_URL, region=S3_REGION,
+                 prefix=S3_PREFIX, expires_s=S3_PRESIGN_EXPIRES_S, client=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.expires_s = expires_s
+        self.client = client
+        self.transfer = None
+        boto3 = None
+        if bucket:
+            # boto3 is optional and slow to import; only load it when a bucket is configured
+            try:
+                import boto3
+                from boto3.s3.transfer import TransferConfig
+                from botocore.config import Config as BotoConfig
+            except ImportError:
+                boto3 = None
+        self.enabled = bool(bucket) and (client is not None or boto3 is not None)
+        if self.enabled and self.client is None:
+            self.client = boto3.client(
+                "s3", endpoint_url=endpoint_url, region_name=region,
+                config=BotoConfig(max_pool_connections=max(10, S3_UPLOAD_WORKERS * 2),
+                                  signature_version="s3v4"),
+            )
+        if self.enabled and boto3 is not None:
+            self.transfer = TransferConfig(
+                multipart_threshold=S3_MULTIPART_CHUNK_MB << 20,
+                multipart_chunksize=S3_MULTIPART_CHUNK_MB << 20,
+                max_concurrency=S3_UPLOAD_WORKERS,
+                use_threads=True,
+            )
+        # Background uploads so the handler can finalize while bytes are in flight
+        self.pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="s3-upload")
+
+    def object_key(self, rid, path):
+        return f"{self.prefix}{rid}/{os.path.basename(path)}"
+
+    def upload(self, path, key):
+        """Upload one file (multipart, parallel parts) and return its key."""
+        ctype = "video/webm" if path.lower().endswith(".webm") else (
+            "video/mp4" if path.lower().endswith((".mp4", ".mov")) else "application/octet-stream")
+        extra = {"Config": self.transfer} if self.transfer else {}
+        self.client.upload_file(path, self.bucket, key, ExtraArgs={"ContentType": ctype}, **extra)
+        return key
+
+    def upload_async(self, path, key):
+        return self.pool.submit(self.upload, path, key)
+
+    def presign(self, key, expires_s=None):
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": key},
+            ExpiresIn=expires_s or self.expires_s,
+        )
+
+    def describe(self, key, path):
+        """Result entry for URL delivery."""
+        return {
+            "filename": os.path.basename(path),
+            "url": self.presign(key),
+            "bucket": self.bucket,
+            "key": key,
+            "size": os.path.getsize(path) if os.path.exists(path) else None,
+            "expires_in": self.expires_s,
+        }
+
+
+def want_url(delivery, total_bytes, store):
+    """
+    Decide URL vs inline delivery.
+
+    delivery: "inline", "url" or "auto" (URL once the base64 payload would
+    exceed the RunPod response limit). Without a configured store everything
+    stays inline.
+    """
+    if store is None or not store.enabled:
+        return False
+    delivery = (delivery or "auto").lower()
+    if delivery == "url":
+        return True
+    if delivery == "inline":
+        return False
+    return inline_size(total_bytes) > RESPONSE_LIMIT_BYTES
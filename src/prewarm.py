@@ -0,0 +1,340 @@
+# Page-Cache Prewarm Module
+# Reads the model files the next job is most likely to need into the OS page
+# cache while ComfyUI and the handler start, using large sequential reads from
+# several threads (network volumes reward concurrency). Priorities come from
+# recent job history in the job index; the run reports throughput to a status
+# file and stops when the handler asks for the I/O bandwidth back.
+#
+#   python3 prewarm.py               # prewarm (launched by bootstrap.sh)
+#   python3 prewarm.py --benchmark   # volume throughput by read size/concurrency
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from job_registry import JOB_DB_PATH
+from model_catalog import ModelCatalog, task_prefix
+
+PREWARM_ENABLED = os.environ.get("PREWARM_ENABLED", "true").lower() in ("1", "true", "yes")
+PREWARM_WORKERS = int(os.environ.get("PREWARM_WORKERS", "8"))
+PREWARM_READ_MB = int(os.environ.get("PREWARM_READ_MB", "16"))
+# 0 = 60% of MemAvailable (prewarming more than fits only evicts itself)
+PREWARM_MAX_GB = float(os.environ.get("PREWARM_MAX_GB", "0"))
+PREWARM_HISTORY = int(os.environ.get("PREWARM_HISTORY", "200"))
+PREWARM_DEFAULT_TASKS = [t for t in os.environ.get("PREWARM_DEFAULT_TASKS", "i2v-A14B").split(",") if t.strip()]
+PREWARM_STATUS_PATH = os.environ.get("PREWARM_STATUS_PATH", "/tmp/prewarm_status.json")
+PREWARM_CANCEL_PATH = os.environ.get("PREWARM_CANCEL_PATH", "/tmp/prewarm.cancel")
+
+# Large files are split so several threads can stream one file at once
+SEGMENT_BYTES = 256 << 20
+STATUS_INTERVAL_S = 2.0
+
+
+def mem_available():
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def default_budget():
+    if PREWARM_MAX_GB > 0:
+        return int(PREWARM_MAX_GB * (1 << 30))
+    avail = mem_available()
+    return int(avail * 0.6) if avail else 32 << 30
+
+
+def cancel():
+    """Ask a running prewarm to stop (called by the handler when a job starts)."""
+    try:
+        with open(PREWARM_CANCEL_PATH, "w") as f:
+            f.write(str(time.time()))
+    except OSError:
+        pass
+
+
+def read_status():
+    try:
+        with open(PREWARM_STATUS_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def recent_usage(db_path=JOB_DB_PATH, limit=PREWARM_HISTORY):
+    """
+    Task and ComfyUI model usage over the most recent jobs in the job index.
+
+    Returns:
+        (Counter of task prefixes, Counter of ComfyUI model file names)
+    """
+    tasks, models = Counter(), Counter()
+    if not db_path or not os.path.exists(db_path):
+        return tasks, models
+    try:
+        db = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=5)
+        rows = db.execute("SELECT record FROM jobs ORDER BY updated DESC LIMIT ?", (limit,)).fetchall()
+        db.close()
+    except sqlite3.Error as e:
+        print(f"[prewarm] job history unavailable: {e}")
+        return tasks, models
+    for (record,) in rows:
+        try:
+            rec = json.loads(record)
+        except (TypeError, ValueError):
+            continue
+        if rec.get("task"):
+            tasks[task_prefix(rec["task"])] += 1
+        for name in rec.get("models") or []:
+            models[name] += 1
+    return tasks, models
+
+
+def plan(catalog, budget, tasks=None, models=None):
+    """
+    Ordered list of (path, size) to prewarm within budget bytes.
+
+    WAN folders of the most used tasks come first (default tasks when there is
+    no history), then ComfyUI files by use count. Within a folder the largest
+    files go first since they dominate load time.
+    """
+    if tasks is None:
+        tasks, models = recent_usage()
+    models = models or Counter()
+    order = [p for p, _ in tasks.most_common()] or [task_prefix(t) for t in PREWARM_DEFAULT_TASKS]
+    files, seen, total = [], set(), 0
+
+    def add(path, size):
+        nonlocal total
+        if path in seen or total + size > budget:
+            return
+        seen.add(path)
+        files.append((path, size))
+        total += size
+
+    for prefix in order:
+        entry = catalog.by_task.get(prefix)
+        if entry is None:
+            continue
+        for rel, size in sorted(entry["files"].items(), key=lambda kv: -kv[1]):
+            add(os.path.join(entry["path"], rel), size)
+    comfy = {name: f for cat in catalog.comfyui.values() for name, f in cat.items()}
+    for name, _ in models.most_common():
+        f = comfy.get(name)
+        if f:
+            add(f["path"], f["bytes"])
+    return files
+
+
+class Prewarmer:
+    """
+    Parallel sequential reader for a list of files.
+
+    Args:
+        files: [(path, size)] in priority order
+        workers: concurrent reader threads
+        read_bytes: size of each read() call
+        cancel_path: file whose appearance stops the run
+    """
+
+    def __init__(self, files, workers=PREWARM_WORKERS, read_bytes=PREWARM_READ_MB << 20,
+                 cancel_path=PREWARM_CANCEL_PATH, status_path=PREWARM_STATUS_PATH):
+        self.files = files
+        self.workers = workers
+        self.read_bytes = read_bytes
+        self.cancel_path = cancel_path
+        self.status_path = status_path
+        self.lock = threading.Lock()
+        self.bytes_read = 0
+        self.files_done = 0
+        self.errors = 0
+        self.cancelled = False
+        self.started = None
+        self.state = "pending"
+        self._last_status = 0.0
+
+    def _stop(self):
+        if not self.cancelled and self.cancel_path and os.path.exists(self.cancel_path):
+            self.cancelled = True
+        return self.cancelled
+
+    def _segments(self):
+        for path, size in self.files:
+            if size <= SEGMENT_BYTES:
+                yield path, 0, size, True
+                continue
+            for off in range(0, size, SEGMENT_BYTES):
+                yield path, off, min(SEGMENT_BYTES, size - off), off + SEGMENT_BYTES >= size
+
+    def _read(self, path, offset, length, last):
+        if self._stop():
+            return
+        buf = bytearray(min(self.read_bytes, max(length, 1)))
+        view = memoryview(buf)
+        try:
+            with open(path, "rb", buffering=0) as f:
+                if hasattr(os, "posix_fadvise"):
+                    os.posix_fadvise(f.fileno(), offset, length, os.POSIX_FADV_SEQUENTIAL)
+                f.seek(offset)
+                left = length
+                while left > 0:
+                    if self._stop():
+                        return
+                    n = f.readinto(view[:min(left, len(buf))])
+                    if not n:
+                        break
+                    left -= n
+                    with self.lock:
+                        self.bytes_read += n
+                    self._write_status()
+        except OSError as e:
+            print(f"[prewarm] read failed for {path}: {e}")
+            with self.lock:
+                self.errors += 1
+            return
+        if last:
+            with self.lock:
+                self.files_done += 1
+
+    def status(self):
+        elapsed = time.monotonic() - self.started if self.started else 0.0
+        total = sum(s for _, s in self.files)
+        return {
+            "state": self.state,
+            "files": len(self.files),
+            "files_done": self.files_done,
+            "bytes_total": total,
+            "bytes_read": self.bytes_read,
+            "elapsed_s": round(elapsed, 2),
+            "mb_per_s": round(self.bytes_read / elapsed / (1 << 20), 1) if elapsed > 0 else None,
+            "errors": self.errors,
+            "workers": self.workers,
+            "pid": os.getpid(),
+            "updated": time.time(),
+        }
+
+    def _write_status(self, force=False):
+        now = time.monotonic()
+        if not self.status_path or (not force and now - self._last_status < STATUS_INTERVAL_S):
+            return
+        self._last_status = now
+        try:
+            tmp = f"{self.status_path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.status(), f)
+            os.replace(tmp, self.status_path)
+        except OSError:
+            pass
+
+    def run(self):
+        """Read every planned segment; returns the final status dict."""
+        if self.cancel_path and os.path.exists(self.cancel_path):
+            os.unlink(self.cancel_path)  # stale request from a previous run
+        self.started = time.monotonic()
+        self.state = "running"
+        self._write_status(force=True)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="prewarm") as pool:
+            for fut in [pool.submit(self._read, *seg) for seg in self._segments()]:
+                fut.result()
+        self.state = "cancelled" if self.cancelled else "done"
+        self._write_status(force=True)
+        return self.status()
+
+
+def benchmark(paths, read_sizes_mb=(1, 4, 16, 64), concurrency=(1, 2, 4, 8, 16), bytes_per_run=2 << 30):
+    """
+    Volume read throughput per (read size, concurrency).
+
+    Each run reads a fresh region of the given files, dropping it from the page
+    cache first where the OS allows, so results reflect the volume rather than RAM.
+    """
+    files = [(p, os.path.getsize(p)) for p in paths if os.path.isfile(p)]
+    files = [(p, size) for p, size in files if size > 0]
+    if not files:
+        raise ValueError("No readable files to benchmark")
+    per_file = max(1, min(bytes_per_run, sum(s for _, s in files)) // len(files))
+    results = []
+    run = 0
+    for size_mb in read_sizes_mb:
+        for conc in concurrency:
+            # Each run reads the next region of every file so runs don't overlap
+            segs = []
+            for path, size in files:
+                length = min(per_file, size)
+                start = (run * length) % size
+                length = min(length, size - start)
+                try:
+                    fd = os.open(path, os.O_RDONLY)
+                    if hasattr(os, "posix_fadvise"):
+                        os.posix_fadvise(fd, start, length, os.POSIX_FADV_DONTNEED)
+                    os.close(fd)
+                except OSError:
+                    pass
+                for off in range(start, start + length, SEGMENT_BYTES):
+                    segs.append((path, off, min(SEGMENT_BYTES, start + length - off), False))
+            run += 1
+            pw = Prewarmer([], workers=conc, read_bytes=size_mb << 20, cancel_path=None, status_path=None)
+            t0 = time.monotonic()
+            with ThreadPoolExecutor(max_workers=conc) as pool:
+                for fut in [pool.submit(pw._read, *seg) for seg in segs]:
+                    fut.result()
+            secs = time.monotonic() - t0
+            row = {"read_mb": size_mb, "concurrency": conc, "bytes": pw.bytes_read,
+                   "seconds": round(secs, 3), "mb_per_s": round(pw.bytes_read / secs / (1 << 20), 1) if secs else None}
+            print(f"[prewarm] read {size_mb:>3} MB x {conc:>2} threads: {row['mb_per_s']} MB/s")
+            results.append(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prewarm model weights into the page cache")
+    parser.add_argument("--ckpt-dir", default=os.environ.get("WAN_CKPT_DIR", "/workspace/models"))
+    parser.add_argument("--comfyui-root", default=os.environ.get("COMFYUI_ROOT", "/workspace/runpod-slim/ComfyUI"))
+    parser.add_argument("--workers", type=int, default=PREWARM_WORKERS)
+    parser.add_argument("--read-mb", type=int, default=PREWARM_READ_MB)
+    parser.add_argument("--max-gb", type=float, default=None, help="Byte budget (default: PREWARM_MAX_GB or 60%% of free RAM)")
+    parser.add_argument("--dry-run", action="store_true", help="Print the plan without reading")
+    parser.add_argument("--benchmark", action="store_true", help="Measure volume throughput instead of prewarming")
+    parser.add_argument("--bench-files", nargs="*", help="Files to benchmark (default: largest planned files)")
+    parser.add_argument("--bench-read-mb", default="1,4,16,64")
+    parser.add_argument("--bench-concurrency", default="1,2,4,8,16")
+    parser.add_argument("--bench-gb", type=float, default=2.0, help="Bytes read per benchmark run")
+    args = parser.parse_args()
+
+    catalog = ModelCatalog(args.ckpt_dir, [os.path.join(args.comfyui_root, "extra_model_paths.yaml")],
+                           args.comfyui_root).load()
+    budget = int(args.max_gb * (1 << 30)) if args.max_gb else default_budget()
+    files = plan(catalog, budget)
+
+    if args.benchmark:
+        paths = args.bench_files or [p for p, _ in sorted(files, key=lambda f: -f[1])[:4]]
+        results = benchmark(paths, [int(x) for x in args.bench_read_mb.split(",")],
+                            [int(x) for x in args.bench_concurrency.split(",")], int(args.bench_gb * (1 << 30)))
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"[prewarm] {len(files)} files, {sum(s for _, s in files) / (1 << 30):.1f} GB planned "
+          f"(budget {budget / (1 << 30):.1f} GB, {args.workers} workers, {args.read_mb} MB reads)")
+    if args.dry_run:
+        for path, size in files:
+            print(f"  {size / (1 << 20):>10.1f} MB  {path}")
+        return
+    if not PREWARM_ENABLED or not files:
+        return
+    result = Prewarmer(files, workers=args.workers, read_bytes=args.read_mb << 20).run()
+    print(f"[prewarm] {result['state']}: {result['bytes_read'] / (1 << 30):.1f} GB in {result['elapsed_s']}s "
+          f"({result['mb_per_s']} MB/s)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+# Progress Telemetry Module
+# Parses generate.py / wan_worker output (stdout and the tqdm bars on stderr)
+# into phase, step N/M, it/s and ETA, and rate-limits progress updates.
+
+import re
+import threading
+import time
+
+# (phase, start %, end %) - overall percent is interpolated inside a phase
+PHASES = (
+    ("load", 5, 15),
+    ("text_encode", 15, 20),
+    ("sampling", 20, 90),
+    ("vae_decode", 90, 95),
+    ("save", 95, 99),
+    ("done", 100, 100),
+)
+PHASE_RANGES = {name: (lo, hi) for name, lo, hi in PHASES}
+PHASE_ORDER = [name for name, _, _ in PHASES]
+
+PHASE_MESSAGES = {
+    "load": "Loading models...",
+    "text_encode": "Encoding prompt...",
+    "sampling": "Sampling",
+    "vae_decode": "Decoding video...",
+    "save": "Saving video...",
+    "done": "Completed",
+}
+
+# Log lines printed by Wan2.2's generate.py that mark a phase boundary
+PHASE_MARKERS = (
+    ("saving generated video", "save"),
+    ("finished", "done"),
+    ("generating video", "text_encode"),
+    ("input prompt", "text_encode"),
+    ("creating wan", "load"),
+    ("loading", "load"),
+)
+
+# e.g. " 45%|████▌     | 18/40 [01:23<01:42,  4.65s/it]"
+TQDM_RE = re.compile(
+    r"(?P<pct>\d{1,3})%\|[^|]*\|\s*(?P<n>\d+)/(?P<total>\d+)"
+    r"(?:\s*\[(?P<elapsed>[\d:]+)<(?P<remaining>[\d:?]+)"
+    r"(?:,\s*(?P<rate>[\d.]+)\s*(?P<unit>it/s|s/it))?)?"
+)
+
+
+def _parse_clock(s):
+    """Parse tqdm's [HH:]MM:SS into seconds (None for '?')."""
+    if not s or "?" in s:
+        return None
+    secs = 0
+    for part in s.split(":"):
+        secs = secs * 60 + int(part)
+    return secs
+
+
+class ProgressTracker:
+    """
+    Thread-safe progress state fed line by line from both output streams.
+
+    Args:
+        emit: callback(snapshot dict) for rate-limited updates
+        min_interval_s: minimum seconds between updates within one phase
+        clock: monotonic time source (overridable in tests)
+    """
+
+    def __init__(self, emit=None, min_interval_s=2.0, clock=time.monotonic):
+        self.emit = emit
+        self.min_interval_s = min_interval_s
+        self.clock = clock
+        self.lock = threading.Lock()
+        now = clock()
+        self.started = now
+        self.phase = "load"
+        self.phase_started = {"load": now}
+        self.phase_s = {}
+        self.step = 0
+        self.total_steps = 0
+        self.rate = None
+        self.remaining_s = None
+        self.sampling_started = None
+        self.last_change = now
+        self.last_emit = None
+        self.first_output = None
+
+    def _enter(self, phase, now):
+        if phase == self.phase or PHASE_ORDER.index(phase) < PHASE_ORDER.index(self.phase):
+            return False
+        self.phase_s[self.phase] = now - self.phase_started[self.phase]
+        self.phase = phase
+        self.phase_started[phase] = now
+        self.last_change = now
+        return True
+
+    def feed(self, line, stream="stdout"):
+        """Consume one output line; emits an update if due."""
+        now = self.clock()
+        changed = False
+        with self.lock:
+            if self.first_output is None:
+                self.first_output = now
+            m = TQDM_RE.search(line)
+            if m:
+                desc = line[:m.start()].lower()
+                if "load" in desc or "shard" in desc:
+                    changed = self._enter("load", now)
+                else:
+                    changed = self._on_step(m, now)
+            else:
+                low = line.lower()
+                for marker, phase in PHASE_MARKERS:
+                    if marker in low:
+                        changed = self._enter(phase, now)
+                        break
+        self._maybe_emit(now, force=changed)
+
+    def _on_step(self, m, now):
+        changed = self._enter("sampling", now)
+        if self.sampling_started is None:
+            self.sampling_started = now
+        n, total = int(m.group("n")), int(m.group("total"))
+        if n != self.step or total != self.total_steps:
+            self.last_change = now
+        self.step, self.total_steps = n, total
+        if m.group("rate"):
+            r = float(m.group("rate"))
+            if r > 0:
+                self.rate = r if m.group("unit") == "it/s" else 1.0 / r
+        elif n > 0:
+            self.rate = n / max(now - self.sampling_started, 1e-6)
+        self.remaining_s = _parse_clock(m.group("remaining"))
+        if total and n >= total:
+            changed = self._enter("vae_decode", now) or changed
+        return changed
+
+    def heartbeat(self):
+        """Emit the current state if the interval has elapsed (no fake advance)."""
+        self._maybe_emit(self.clock())
+
+    def finish(self):
+        """Mark the job done and emit the final snapshot (100%, ETA 0)."""
+        now = self.clock()
+        with self.lock:
+            self._enter("done", now)
+        self._maybe_emit(now, force=True)
+
+    def _maybe_emit(self, now, force=False):
+        if self.emit is None:
+            return
+        if not force and self.last_emit is not None and now - self.last_emit < self.min_interval_s:
+            return
+        self.last_emit = now
+        try:
+            self.emit(self.snapshot())
+        except Exception:
+            pass
+
+    def _eta_s(self, now):
+        if self.phase == "done":
+            return 0.0
+        if self.phase != "sampling" or not self.total_steps:
+            return None
+        if self.remaining_s is not None:
+            return float(self.remaining_s)
+        if self.rate:
+            return (self.total_steps - self.step) / self.rate
+        return None
+
+    def _percent(self):
+        lo, hi = PHASE_RANGES[self.phase]
+        if self.phase == "sampling" and self.total_steps:
+            return int(lo + (hi - lo) * min(self.step, self.total_steps) / self.total_steps)
+        return lo
+
+    def snapshot(self):
+        """Current progress as a JSON-serializable dict."""
+        now = self.clock()
+        with self.lock:
+            eta = self._eta_s(now)
+            message = PHASE_MESSAGES[self.phase]
+            if self.phase == "sampling" and self.total_steps:
+                message += f" step {self.step}/{self.total_steps}"
+                if self.rate:
+                    message += f" ({self.rate:.2f} it/s)"
+            if eta is not None and self.phase != "done":
+                message += f", ETA {int(eta)}s"
+            return {
+                "phase": self.phase,
+                "percent": self._percent(),
+                "step": self.step,
+                "total_steps": self.total_steps,
+                "it_per_s": round(self.rate, 4) if self.rate else None,
+                "eta_s": round(eta, 1) if eta is not None else None,
+                "elapsed_s": round(now - self.started, 2),
+                "idle_s": round(now - self.last_change, 2),
+                "message": message,
+            }
+
+    def summary(self):
+        """Per-job throughput record (phase durations and step rate)."""
+        now = self.clock()
+        with self.lock:
+            phase_s = dict(self.phase_s)
+            if self.phase != "done":
+                phase_s[self.phase] = now - self.phase_started[self.phase]
+            sampling_s = phase_s.get("sampling")
+            return {
+                "steps": self.step,
+                "total_steps": self.total_steps,
+                "it_per_s": round(self.step / sampling_s, 4) if sampling_s and self.step else None,
+                "sampling_s": round(sampling_s, 3) if sampling_s is not None else None,
+                "phase_s": {k: round(v, 3) for k, v in phase_s.items()},
+                "first_output_s": round(self.first_output - self.started, 3) if self.first_output else None,
+            }
@@ -0,0 +1,223 @@
+# Result Cache Module
+# Content-addressed cache of finished outputs shared by the WAN CLI and
+# ComfyUI paths. Entries live on the volume as immutable directories
+# <root>/<key[:2]>/<key>/ holding the output files plus meta.json, and are
+# evicted LRU once the cache exceeds its byte budget. Several workers may
+# share one cache directory: writers publish with an atomic rename and hold
+# an flock only while publishing/evicting. The running byte total lives in
+# <root>/.usage.json, so the tree is only scanned once it passes the budget.
+# Hits are hardlinked into the output directory, or symlinked into the cache
+# when it is on another filesystem, so a hit never copies the video.
+
+import os
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import threading
+
+_default_root = "/runpod-volume/cache/results" if os.path.isdir("/runpod-volume") else "/workspace/cache/results"
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", _default_root)
+RESULT_CACHE_MAX_BYTES = int(float(os.environ.get("RESULT_CACHE_MAX_GB", "20")) * (1 << 30))
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# An eviction pass frees down to this fraction of the budget, so the next
+# puts do not each trigger a scan
+EVICT_LOW_WATER = 0.9
+
+# Request keys that never change the generated pixels
+VOLATILE_KEYS = {
+    "action", "request_id", "id", "return_video", "return_base64", "timeout",
+    "use_cache", "save_file", "offload_model", "t5_cpu", "webhook_url",
+    "delivery", "deadline_s", "admission", "memory_profile", "allow_frame_reduction",
+    "nproc", "multi_gpu", "ulysses_size", "t5_fsdp", "dit_fsdp",
+}
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """sha256 of a file, read in chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _norm(v):
+    if isinstance(v, bool):
+        return "true" if v else "false"
+    if isinstance(v, (dict, list, tuple)):
+        return v
+    if v is None:
+        return None
+    s = str(v).strip()
+    return s.lower() if s.lower() in ("true", "false") else s
+
+
+def cache_key(kind, params, assets=None, workflow=None, drop=()):
+    """
+    Canonical hash of a generation request.
+
+    Args:
+        kind: backend/action name ("wan", "comfyui_i2v", "comfyui_workflow")
+        params: request parameters (volatile and `drop` keys are ignored)
+        assets: {name: content sha256} of input files, replacing their URLs/paths
+        workflow: ComfyUI workflow dict, hashed as canonical JSON
+
+    Returns:
+        hex sha256 key
+    """
+    norm = {k: _norm(v) for k, v in (params or {}).items()
+            if k not in VOLATILE_KEYS and k not in drop and v is not None and v != ""}
+    doc = {"kind": kind, "params": norm, "assets": assets or {}, "workflow": workflow}
+    blob = json.dumps(doc, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Size-bounded LRU store of output files keyed by cache_key()."""
+
+    def __init__(self, root=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_BYTES, enabled=RESULT_CACHE_ENABLED):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def _entry(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def _usage_path(self):
+        return os.path.join(self.root, ".usage.json")
+
+    def _lock(self):
+        os.makedirs(self.root, exist_ok=True)
+        f = open(os.path.join(self.root, ".lock"), "a")
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def _count(self, hit):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self, key=None, hit=False):
+        return {"hit": hit, "key": key, "hits": self.hits, "misses": self.misses}
+
+    def get(self, key, dest_dir, rename=None):
+        """
+        Materialize a cached entry into dest_dir without copying: hardlinks,
+        or symlinks into the cache across filesystems (those dangle once the
+        entry is evicted).
+
+        Args:
+            key: cache key
+            dest_dir: directory for the restored files
+            rename: optional callable(original filename) -> new filename
+
+        Returns:
+            list of restored paths, or None on a miss
+        """
+        if not self.enabled or not key:
+            return None
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, "meta.json")) as f:
+                meta = json.load(f)
+            os.makedirs(dest_dir, exist_ok=True)
+            paths = []
+            for name in meta["files"]:
+                dst = os.path.join(dest_dir, rename(name) if rename else name)
+                if os.path.exists(dst):
+                    os.unlink(dst)
+                try:
+                    os.link(os.path.join(entry, name), dst)
+                except OSError:
+                    os.symlink(os.path.join(entry, name), dst)
+                paths.append(dst)
+            # mtime of meta.json is the LRU clock
+            os.utime(os.path.join(entry, "meta.json"))
+        except (OSError, ValueError, KeyError):
+            self._count(False)
+            return None
+        self._count(True)
+        return paths
+
+    def put(self, key, paths, info=None):
+        """Store output files under key (no-op if already present)."""
+        if not self.enabled or not key or not paths:
+            return
+        entry = self._entry(key)
+        if os.path.exists(entry):
+            return
+        tmp = f"{entry}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            os.makedirs(tmp, exist_ok=True)
+            names, size = [], 0
+            for p in paths:
+                name = os.path.basename(p)
+                try:
+                    os.link(p, os.path.join(tmp, name))
+                except OSError:
+                    shutil.copy2(p, os.path.join(tmp, name))
+                names.append(name)
+                size += os.path.getsize(p)
+            with open(os.path.join(tmp, "meta.json"), "w") as f:
+                json.dump({"files": names, "bytes": size, "created": time.time(), "info": info or {}}, f)
+            with self._lock():
+                if os.path.exists(entry):
+                    shutil.rmtree(tmp, ignore_errors=True)
+                    return
+                os.rename(tmp, entry)
+                self._add_usage_locked(size)
+        except OSError as e:
+            print(f"[result_cache] put failed for {key}: {e}")
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def _add_usage_locked(self, size):
+        """Add a new entry's bytes to the tracked total; scan and evict only past the budget."""
+        try:
+            with open(self._usage_path()) as f:
+                total = json.load(f)["bytes"] + size
+        except (OSError, ValueError, KeyError, TypeError):
+            total = None  # first put, or an unreadable index: rebuild it from the tree
+        if total is None or total > self.max_bytes:
+            total = self._evict_locked()
+        self._write_usage_locked(total)
+
+    def _write_usage_locked(self, total):
+        tmp = f"{self._usage_path()}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"bytes": total, "updated": time.time()}, f)
+        os.replace(tmp, self._usage_path())
+
+    def _evict_locked(self):
+        """Scan the tree, drop LRU entries down to the low-water mark; returns the remaining bytes."""
+        entries, total = [], 0
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for e in os.scandir(shard.path):
+                if ".tmp-" in e.name:
+                    continue
+                try:
+                    st = os.stat(os.path.join(e.path, "meta.json"))
+                    with open(os.path.join(e.path, "meta.json")) as f:
+                        size = json.load(f).get("bytes", 0)
+                except (OSError, ValueError):
+                    continue
+                entries.append((st.st_mtime, size, e.path))
+                total += size
+        if total <= self.max_bytes:
+            return total
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes * EVICT_LOW_WATER:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+        return total
@@ -0,0 +1,161 @@
+# Startup Orchestration Module
+# Tracks readiness of the components the handler depends on (ComfyUI server,
+# model catalog, background model download) so the handler can accept jobs
+# immediately and only actions that need a component wait for it. Also keeps
+# a per-phase startup timeline merged from bootstrap.sh marks and the
+# handler's own phases.
+
+import os
+import json
+import time
+import threading
+
+STARTUP_TIMELINE_PATH = os.environ.get("STARTUP_TIMELINE_PATH", "/tmp/startup_timeline.jsonl")
+# Longest an action waits for a component before failing (components may
+# override it, e.g. the model download waits for as long as it runs)
+STARTUP_READY_TIMEOUT_S = float(os.environ.get("STARTUP_READY_TIMEOUT_S", "300"))
+
+
+class Readiness:
+    """
+    Component readiness flags plus the startup timeline.
+
+    Args:
+        timeline_path: JSON-lines file with {"phase", "event": start|end, "t"}
+            marks written by bootstrap.sh (wall-clock seconds)
+    """
+
+    def __init__(self, timeline_path=STARTUP_TIMELINE_PATH):
+        self.timeline_path = timeline_path
+        self.lock = threading.Lock()
+        self.components = {}
+        self.phases = {}
+
+    def mark(self, phase, start=None, end=None):
+        """Record a handler-side phase (wall-clock start/end; end defaults to now)."""
+        with self.lock:
+            p = self.phases.setdefault(phase, {})
+            if start is not None:
+                p["start"] = start
+            p["end"] = end if end is not None else time.time()
+
+    def _component(self, name, timeout=STARTUP_READY_TIMEOUT_S):
+        with self.lock:
+            if name not in self.components:
+                self.components[name] = {"event": threading.Event(), "error": None, "timeout": timeout,
+                                         "started": time.time(), "ready_at": None}
+            return self.components[name]
+
+    def set_ready(self, name, error=None):
+        c = self._component(name)
+        c["error"] = error
+        c["ready_at"] = time.time()
+        self.mark(name, start=c["started"], end=c["ready_at"])
+        c["event"].set()
+
+    def start(self, name, fn, timeout=STARTUP_READY_TIMEOUT_S):
+        """Run fn() in the background; the component is ready when it returns."""
+        self._component(name, timeout)
+
+        def run():
+            try:
+                fn()
+                self.set_ready(name)
+            except Exception as e:
+                print(f"[startup] {name} failed: {e}")
+                self.set_ready(name, f"{type(e).__name__}: {e}")
+        threading.Thread(target=run, daemon=True, name=f"startup-{name}").start()
+
+    def poll(self, name, check, interval_s=1.0, failed=None, timeout=STARTUP_READY_TIMEOUT_S):
+        """
+        Poll check() in the background until it returns True.
+
+        Args:
+            failed: optional callable returning an error string once the
+                component can no longer become ready (e.g. its process died)
+            timeout: longest wait() blocks on this component (None = until ready)
+        """
+        self._component(name, timeout)
+
+        def run():
+            while True:
+                try:
+                    if check():
+                        self.set_ready(name)
+                        return
+                except Exception:
+                    pass
+                error = failed() if failed else None
+                if error:
+                    print(f"[startup] {name} failed: {error}")
+                    self.set_ready(name, error)
+                    return
+                time.sleep(interval_s)
+        threading.Thread(target=run, daemon=True, name=f"startup-{name}").start()
+
+    def wait(self, names, timeout=None):
+        """
+        Block until the named components are ready.
+
+        Args:
+            timeout: overrides each component's own timeout
+
+        Returns:
+            None when all are usable, else an error message
+        """
+        t0 = time.monotonic()
+        for name in names:
+            c = self.components.get(name)
+            if c is None:
+                continue
+            limit = c["timeout"] if timeout is None else timeout
+            left = None if limit is None else max(0.0, t0 + limit - time.monotonic())
+            if not c["event"].wait(left):
+                return f"{name} not ready after {limit:g}s"
+            if c["error"]:
+                return f"{name} unavailable: {c['error']}"
+        return None
+
+    def status(self):
+        out = {}
+        for name, c in list(self.components.items()):
+            state = "pending" if not c["event"].is_set() else ("failed" if c["error"] else "ready")
+            out[name] = {"state": state, "error": c["error"],
+                         "ready_s": round(c["ready_at"] - c["started"], 3) if c["ready_at"] else None}
+        return out
+
+    def _bootstrap_marks(self):
+        phases = {}
+        try:
+            with open(self.timeline_path) as f:
+                for line in f:
+                    try:
+                        m = json.loads(line)
+                        phases.setdefault(m["phase"], {})[m["event"]] = float(m["t"])
+                    except (ValueError, KeyError, TypeError):
+                        continue
+        except OSError:
+            pass
+        return phases
+
+    def timeline(self):
+        """Phases sorted by start, in seconds since the earliest mark."""
+        phases = self._bootstrap_marks()
+        with self.lock:
+            for name, p in self.phases.items():
+                phases.setdefault(name, {}).update(p)
+        starts = [t for p in phases.values() for t in p.values()]
+        if not starts:
+            return []
+        t0 = min(starts)
+        rows = []
+        for name, p in phases.items():
+            start, end = p.get("start"), p.get("end")
+            rows.append({
+                "phase": name,
+                "start_s": round(start - t0, 3) if start is not None else None,
+                "end_s": round(end - t0, 3) if end is not None else None,
+                "duration_s": round(end - start, 3) if start is not None and end is not None else None,
+            })
+        rows.sort(key=lambda r: (r["start_s"] if r["start_s"] is not None else r["end_s"] or 0.0))
+        return rows
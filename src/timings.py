@@ -0,0 +1,106 @@
+# Stage Timing Module
+# Monotonic per-stage timing of a job (download, spawn, model load, sampling,
+# decode, file I/O, base64, ComfyUI polling, ...) plus worker-wide aggregate
+# statistics, so we can see where wall time actually goes.
+
+import time
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# generate.py phases reported by progress.ProgressTracker -> timing stage names
+PHASE_STAGES = {
+    "load": "model_load",
+    "text_encode": "text_encode",
+    "sampling": "sampling",
+    "vae_decode": "vae_decode",
+    "save": "save_video",
+}
+
+
+class StageTimer:
+    """Accumulates named stage durations for one job."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.started = clock()
+        self.stages = OrderedDict()
+
+    @contextmanager
+    def stage(self, name):
+        t = self.clock()
+        try:
+            yield
+        finally:
+            self.add(name, self.clock() - t)
+
+    def add(self, name, seconds):
+        if seconds is None:
+            return
+        self.stages[name] = self.stages.get(name, 0.0) + max(0.0, seconds)
+
+    def add_phases(self, throughput, within=None):
+        """
+        Split a generate.py run into spawn/model load/sampling/... stages.
+
+        Args:
+            throughput: ProgressTracker.summary() of the run
+            within: stage that measured the whole run; it is replaced by the split
+        """
+        if not throughput:
+            return
+        spawn = throughput.get("first_output_s")
+        phases = dict(throughput.get("phase_s") or {})
+        if spawn is not None and "load" in phases:
+            self.add("spawn", spawn)
+            phases["load"] = max(0.0, phases["load"] - spawn)
+        for phase, seconds in phases.items():
+            self.add(PHASE_STAGES.get(phase, phase), seconds)
+        if within and within in self.stages:
+            rest = self.stages.pop(within) - sum(phases.values()) - (spawn or 0.0)
+            if rest > 0.001:
+                self.add(f"{within}_other", rest)
+
+    def result(self):
+        total = self.clock() - self.started
+        measured = sum(self.stages.values())
+        return {
+            "stages": {k: round(v, 3) for k, v in self.stages.items()},
+            "total_s": round(total, 3),
+            "unaccounted_s": round(max(0.0, total - measured), 3),
+        }
+
+
+class TimingStats:
+    """Worker-wide per-stage aggregates over all jobs (recent window for percentiles)."""
+
+    def __init__(self, window=256):
+        self.window = window
+        self.lock = threading.Lock()
+        self.data = {}
+
+    def record(self, result, kind="job"):
+        with self.lock:
+            for name, seconds in list(result.get("stages", {}).items()) + [("total", result.get("total_s"))]:
+                if seconds is None:
+                    continue
+                d = self.data.setdefault(f"{kind}.{name}", {"count": 0, "total_s": 0.0, "max_s": 0.0,
+                                                           "recent": deque(maxlen=self.window)})
+                d["count"] += 1
+                d["total_s"] += seconds
+                d["max_s"] = max(d["max_s"], seconds)
+                d["recent"].append(seconds)
+
+    def summary(self):
+        out = {}
+        with self.lock:
+            for name, d in sorted(self.data.items()):
+                recent = sorted(d["recent"])
+                out[name] = {
+                    "count": d["count"],
+                    "mean_s": round(d["total_s"] / d["count"], 3),
+                    "max_s": round(d["max_s"], 3),
+                    "p50_s": round(recent[len(recent) // 2], 3),
+                    "p95_s": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))], 3),
+                }
+        return out
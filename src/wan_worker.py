@@ -0,0 +1,506 @@
+# Persistent WAN 2.2 Worker Module
+# Keeps Wan2.2 pipelines resident in a long-lived process and serves
+# generation jobs over a local IPC channel, so jobs skip the per-request
+# python/torch import, checkpoint load and CUDA init of `generate.py`.
+#
+# Run standalone:  python3 wan_worker.py --address /tmp/wan_worker.sock
+# The handler starts it on demand (see WorkerClient) and falls back to
+# spawning generate.py when the worker cannot serve a job.
+
+import os
+import io
+import gc
+import sys
+import time
+import argparse
+import threading
+import traceback
+from collections import OrderedDict
+from multiprocessing.connection import Listener, Client
+
+WAN_HOME = os.environ.get("WAN_HOME", "/workspace/Wan2.2")
+WORKER_ADDRESS = os.environ.get("WAN_WORKER_SOCKET", "/tmp/wan_worker.sock")
+WORKER_MAX_PIPELINES = int(os.environ.get("WAN_WORKER_MAX_PIPELINES", "1"))
+WORKER_STUB = os.environ.get("WAN_WORKER_STUB", "false").lower() in ("1", "true", "yes")
+WORKER_STUB_STEP_S = float(os.environ.get("WAN_WORKER_STUB_STEP_S", "0"))
+
+# Tasks the worker can run in-process; everything else goes through generate.py
+SUPPORTED_TASK_PREFIXES = ("t2v", "ti2v", "i2v")
+
+# Flags that decide which weights get loaded and how; they form the cache key
+PIPELINE_KEY_FLAGS = ("task", "ckpt_dir", "t5_cpu", "convert_model_dtype", "t5_fsdp", "dit_fsdp")
+
+# generate.py options handler._build_cmd emits: those taking a value, and switches.
+# Anything else (e.g. extra_args passthrough) only the real CLI understands.
+VALUE_OPTIONS = frozenset((
+    "task", "size", "ckpt_dir", "offload_model", "image", "prompt", "base_seed", "frame_num",
+    "sample_steps", "sample_shift", "sample_guide_scale", "sample_solver", "ulysses_size",
+    "prompt_extend_method", "prompt_extend_model", "prompt_extend_target_lang", "save_file",
+    "src_root_path", "refert_num", "infer_frames", "audio", "tts_prompt_audio", "tts_prompt_text",
+    "tts_text", "pose_video",
+))
+SWITCH_OPTIONS = frozenset((
+    "convert_model_dtype", "t5_cpu", "t5_fsdp", "dit_fsdp", "use_prompt_extend", "replace_flag",
+    "use_relighting_lora", "start_from_ref", "enable_tts",
+))
+
+
+def parse_generate_argv(argv, strict=False):
+    """
+    Parse a generate.py argv (as built by handler._build_cmd) into a dict.
+
+    Switches (e.g. --t5_cpu) map to True. Known value options always take the
+    following token, so a prompt starting with "--" stays the prompt; unknown
+    flags take it only when it does not look like a flag. Only used for
+    routing and cache keys, the real pipeline uses generate.py's own argparse.
+
+    Raises:
+        ValueError with strict=True on an unknown or repeated option, a stray
+            token or a value option without its value
+    """
+    opts, seen = {}, []
+    i = 0
+    while i < len(argv):
+        tok = argv[i]
+        if not tok.startswith("--"):
+            if strict:
+                raise ValueError(f"unexpected argument {tok!r}")
+            i += 1
+            continue
+        name, eq, value = tok[2:].partition("=")
+        if eq:
+            opts[name] = value
+        elif name in VALUE_OPTIONS:
+            if i + 1 >= len(argv):
+                if strict:
+                    raise ValueError(f"--{name} needs a value")
+                opts[name] = True
+            else:
+                opts[name] = argv[i + 1]
+                i += 1
+        elif name in SWITCH_OPTIONS or i + 1 >= len(argv) or argv[i + 1].startswith("--"):
+            opts[name] = True
+        else:
+            opts[name] = argv[i + 1]
+            i += 1
+        if strict and name not in VALUE_OPTIONS and name not in SWITCH_OPTIONS:
+            raise ValueError(f"unknown option --{name}")
+        i += 1
+        seen.append(name)
+    if strict and len(seen) != len(set(seen)):
+        raise ValueError("repeated option")
+    return opts
+
+
+def can_serve(argv):
+    """Return True if the persistent worker can run this generate.py argv."""
+    try:
+        # Options beyond what _build_cmd emits come from extra_args
+        opts = parse_generate_argv(argv, strict=True)
+    except ValueError:
+        return False
+    task = str(opts.get("task", "")).lower()
+    if not task.startswith(SUPPORTED_TASK_PREFIXES):
+        return False
+    # Multi-GPU, prompt extension and extra passthrough need the real CLI
+    if str(opts.get("ulysses_size", "1")) not in ("", "1"):
+        return False
+    if opts.get("use_prompt_extend") or opts.get("t5_fsdp") or opts.get("dit_fsdp"):
+        return False
+    return True
+
+
+def pipeline_key(opts):
+    """Build the resident-pipeline key for a parsed argv dict."""
+    return tuple((k, str(opts.get(k, ""))) for k in PIPELINE_KEY_FLAGS)
+
+
+class PipelineCache:
+    """LRU of loaded pipelines keyed by task/ckpt dir/load flags."""
+
+    def __init__(self, factory, max_resident=1):
+        self.factory = factory
+        self.max_resident = max(1, int(max_resident))
+        self.pipelines = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key, args):
+        if key in self.pipelines:
+            self.pipelines.move_to_end(key)
+            self.stats["hits"] += 1
+            return self.pipelines[key]
+        self.stats["misses"] += 1
+        while len(self.pipelines) >= self.max_resident:
+            self.evict_one()
+        pipe = self.factory.build(args)
+        self.pipelines[key] = pipe
+        return pipe
+
+    def evict_one(self):
+        if not self.pipelines:
+            return
+        _, pipe = self.pipelines.popitem(last=False)
+        self.stats["evictions"] += 1
+        self.factory.release(pipe)
+
+    def clear(self):
+        while self.pipelines:
+            self.evict_one()
+
+    def keys(self):
+        return [dict(k) for k in self.pipelines.keys()]
+
+
+class WanPipelineFactory:
+    """Loads real Wan2.2 pipelines from WAN_HOME (imported once per process)."""
+
+    def __init__(self, wan_home=WAN_HOME):
+        self.wan_home = wan_home
+        self._generate = None
+
+    def _import(self):
+        if self._generate is None:
+            if self.wan_home not in sys.path:
+                sys.path.insert(0, self.wan_home)
+            import generate as wan_generate
+            self._generate = wan_generate
+        return self._generate
+
+    def parse_args(self, argv):
+        """Translate argv with generate.py's own parser and validation."""
+        gen = self._import()
+        saved = sys.argv
+        try:
+            sys.argv = ["generate.py"] + list(argv)
+            args = gen._parse_args()
+        finally:
+            sys.argv = saved
+        if args.offload_model is None:
+            args.offload_model = True
+        return args
+
+    def build(self, args):
+        gen = self._import()
+        wan = gen.wan
+        cfg = gen.WAN_CONFIGS[args.task]
+        kwargs = dict(
+            config=cfg,
+            checkpoint_dir=args.ckpt_dir,
+            device_id=int(os.getenv("LOCAL_RANK", 0)),
+            rank=0,
+            t5_fsdp=args.t5_fsdp,
+            dit_fsdp=args.dit_fsdp,
+            use_sp=False,
+            t5_cpu=args.t5_cpu,
+            convert_model_dtype=args.convert_model_dtype,
+        )
+        if "t2v" in args.task:
+            return wan.WanT2V(**kwargs)
+        if "ti2v" in args.task:
+            return wan.WanTI2V(**kwargs)
+        return wan.WanI2V(**kwargs)
+
+    def run(self, pipe, args):
+        gen = self._import()
+        cfg = gen.WAN_CONFIGS[args.task]
+        common = dict(
+            frame_num=args.frame_num,
+            shift=args.sample_shift,
+            sample_solver=args.sample_solver,
+            sampling_steps=args.sample_steps,
+            guide_scale=args.sample_guide_scale,
+            seed=args.base_seed,
+            offload_model=args.offload_model,
+        )
+        img = None
+        if args.image is not None:
+            from PIL import Image
+            img = Image.open(args.image).convert("RGB")
+        if "t2v" in args.task:
+            video = pipe.generate(args.prompt, size=gen.SIZE_CONFIGS[args.size], **common)
+        elif "ti2v" in args.task:
+            video = pipe.generate(args.prompt, img=img, size=gen.SIZE_CONFIGS[args.size],
+                                  max_area=gen.MAX_AREA_CONFIGS[args.size], **common)
+        else:
+            video = pipe.generate(args.prompt, img, max_area=gen.MAX_AREA_CONFIGS[args.size], **common)
+        print(f"[wan_worker] Saving generated video to {args.save_file}")
+        gen.save_video(tensor=video[None], save_file=args.save_file, fps=cfg.sample_fps,
+                       nrow=1, normalize=True, value_range=(-1, 1))
+        del video
+        return args.save_file
+
+    def release(self, pipe):
+        del pipe
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except Exception:
+            pass
+
+
+class StubPipelineFactory:
+    """CPU-only stand-in for WanPipelineFactory (WAN_WORKER_STUB=true)."""
+
+    def __init__(self, load_s=0.0, step_s=0.0):
+        self.load_s = load_s
+        self.step_s = step_s
+        self.builds = 0
+        self.releases = 0
+
+    def parse_args(self, argv):
+        opts = parse_generate_argv(argv)
+        return argparse.Namespace(**{k: v for k, v in opts.items()})
+
+    def build(self, args):
+        time.sleep(self.load_s)
+        self.builds += 1
+        return {"task": args.task, "ckpt_dir": getattr(args, "ckpt_dir", "")}
+
+    def run(self, pipe, args):
+        steps = int(getattr(args, "sample_steps", 4) or 4)
+        for i in range(steps):
+            time.sleep(self.step_s)
+            sys.stderr.write(f"\r{int((i + 1) * 100 / steps)}%| | {i + 1}/{steps} [00:00<00:00, 1.00it/s]")
+        sys.stderr.write("\n")
+        save_file = getattr(args, "save_file", None)
+        print(f"[wan_worker] Saving generated video to {save_file}")
+        if save_file:
+            with open(save_file, "wb") as f:
+                f.write(b"\x00\x00\x00\x18ftypmp42stub")
+        return save_file
+
+    def release(self, pipe):
+        self.releases += 1
+
+
+class _LineForwarder(io.TextIOBase):
+    """Text stream that forwards complete lines (\\n or tqdm's \\r) to a callback."""
+
+    def __init__(self, stream, emit):
+        self.stream = stream
+        self.emit = emit
+        self.buf = ""
+
+    def writable(self):
+        return True
+
+    def write(self, s):
+        self.buf += s
+        while True:
+            cut = [i for i in (self.buf.find("\n"), self.buf.find("\r")) if i >= 0]
+            if not cut:
+                break
+            i = min(cut)
+            line, self.buf = self.buf[:i + 1], self.buf[i + 1:]
+            self.emit(self.stream, line)
+        return len(s)
+
+    def flush(self):
+        if self.buf:
+            self.emit(self.stream, self.buf)
+            self.buf = ""
+
+
+class WanWorker:
+    """Serves generate jobs on one IPC connection at a time."""
+
+    def __init__(self, factory, max_resident=WORKER_MAX_PIPELINES):
+        self.factory = factory
+        self.cache = PipelineCache(factory, max_resident)
+        self.jobs = 0
+        self.started = time.time()
+
+    def handle(self, msg, send):
+        op = msg.get("op")
+        if op == "ping":
+            return {"type": "pong", "pid": os.getpid()}
+        if op == "stats":
+            return {"type": "stats", "jobs": self.jobs, "uptime_s": time.time() - self.started,
+                    "resident": self.cache.keys(), **self.cache.stats}
+        if op == "evict":
+            self.cache.clear()
+            return {"type": "evicted"}
+        if op == "generate":
+            return self.generate(msg.get("argv") or [], send)
+        return {"type": "error", "error": f"Unknown op: {op}"}
+
+    def generate(self, argv, send):
+        if not can_serve(argv):
+            return {"type": "result", "returncode": None, "unsupported": True}
+
+        def emit(stream, line):
+            try:
+                send({"type": "log", "stream": stream, "line": line})
+            except Exception:
+                pass
+
+        out = _LineForwarder("stdout", emit)
+        err = _LineForwarder("stderr", emit)
+        saved = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = out, err
+        t0 = time.time()
+        try:
+            args = self.factory.parse_args(argv)
+            key = pipeline_key(vars(args))
+            hit = key in self.cache.pipelines
+            if not hit:
+                print(f"[wan_worker] Creating pipeline for {args.task} from {args.ckpt_dir}")
+            pipe = self.cache.get(key, args)
+            t_load = time.time()
+            # Same markers generate.py logs, so progress phases line up
+            print("[wan_worker] Generating video ...")
+            save_file = self.factory.run(pipe, args)
+            self.jobs += 1
+            return {"type": "result", "returncode": 0, "save_file": save_file, "reused": hit,
+                    "load_s": t_load - t0, "run_s": time.time() - t_load}
+        except BaseException as e:
+            traceback.print_exc()
+            # CUDA OOM leaves fragments behind; start the next job from a clean slate
+            if "out of memory" in str(e).lower():
+                self.cache.clear()
+            if isinstance(e, KeyboardInterrupt):
+                raise
+            return {"type": "result", "returncode": 1, "error": f"{type(e).__name__}: {e}"}
+        finally:
+            out.flush()
+            err.flush()
+            sys.stdout, sys.stderr = saved
+
+    def serve(self, address=WORKER_ADDRESS, authkey=None):
+        if isinstance(address, str) and os.path.exists(address):
+            os.unlink(address)
+        listener = Listener(address, authkey=authkey)
+        print(f"[wan_worker] listening on {address} (pid {os.getpid()})", flush=True)
+        try:
+            while True:
+                conn = listener.accept()
+                try:
+                    while True:
+                        try:
+                            msg = conn.recv()
+                        except EOFError:
+                            break
+                        if msg.get("op") == "shutdown":
+                            conn.send({"type": "bye"})
+                            return
+                        conn.send(self.handle(msg, conn.send))
+                finally:
+                    conn.close()
+        finally:
+            listener.close()
+
+
+class WorkerClient:
+    """
+    Handler-side client that starts the worker on demand and relays jobs.
+
+    Jobs run one at a time over a single connection; log lines from the
+    worker are passed to `on_line(stream, line)` as they arrive.
+    """
+
+    def __init__(self, address=WORKER_ADDRESS, python="python3", start_timeout=60):
+        self.address = address
+        self.python = python
+        self.start_timeout = start_timeout
+        self.authkey = os.urandom(16)
+        self.proc = None
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def _start(self):
+        import subprocess
+        env = dict(os.environ, WAN_WORKER_AUTHKEY=self.authkey.hex())
+        self.proc = subprocess.Popen(
+            [self.python, os.path.abspath(__file__), "--address", self.address],
+            cwd=WAN_HOME if os.path.isdir(WAN_HOME) else None,
+            env=env,
+            # Own process group, so a cancelled job can be signalled without touching the handler
+            start_new_session=True,
+        )
+        deadline = time.time() + self.start_timeout
+        while time.time() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"wan_worker exited during startup (code {self.proc.returncode})")
+            try:
+                self.conn = Client(self.address, authkey=self.authkey)
+                return
+            except (FileNotFoundError, ConnectionRefusedError):
+                time.sleep(0.2)
+        raise RuntimeError(f"wan_worker did not start within {self.start_timeout}s")
+
+    def _ensure(self):
+        if self.conn is None or self.proc is None or self.proc.poll() is not None:
+            self.close()
+            self._start()
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+        self.conn = None
+
+    def request(self, msg, on_line=None, poll_s=5.0, on_idle=None):
+        """Send one request and return the final (non-log) reply."""
+        with self.lock:
+            self._ensure()
+            try:
+                self.conn.send(msg)
+                while True:
+                    if not self.conn.poll(poll_s):
+                        if self.proc.poll() is not None:
+                            raise EOFError("wan_worker exited")
+                        if on_idle:
+                            on_idle()
+                        continue
+                    reply = self.conn.recv()
+                    if reply.get("type") == "log":
+                        if on_line:
+                            on_line(reply["stream"], reply["line"])
+                        continue
+                    return reply
+            except (EOFError, OSError):
+                self.close()
+                raise
+
+    def kill(self):
+        """
+        Stop the worker process group (SIGINT -> SIGTERM -> SIGKILL) to abort the
+        running job; safe to call from another thread while a request is
+        blocked. The worker restarts on the next request.
+
+        Returns:
+            cancellation.terminate_group() report, or None when no worker runs
+        """
+        from cancellation import terminate_group
+        proc = self.proc
+        if proc is None or proc.poll() is not None:
+            return None
+        return terminate_group(proc)
+
+    def generate(self, argv, on_line=None, poll_s=5.0, on_idle=None):
+        return self.request({"op": "generate", "argv": list(argv)}, on_line, poll_s, on_idle)
+
+    def stats(self):
+        return self.request({"op": "stats"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Persistent WAN 2.2 generation worker")
+    parser.add_argument("--address", default=WORKER_ADDRESS, help="Unix socket path to listen on")
+    parser.add_argument("--max-pipelines", type=int, default=WORKER_MAX_PIPELINES)
+    parser.add_argument("--stub", action="store_true", default=WORKER_STUB,
+                        help="Use a CPU stub pipeline (protocol testing without a GPU)")
+    opts = parser.parse_args()
+
+    authkey = os.environ.get("WAN_WORKER_AUTHKEY")
+    authkey = bytes.fromhex(authkey) if authkey else None
+    factory = StubPipelineFactory(step_s=WORKER_STUB_STEP_S) if opts.stub else WanPipelineFactory()
+    WanWorker(factory, opts.max_pipelines).serve(opts.address, authkey)
+
+
+if __name__ == "__main__":
+    main()
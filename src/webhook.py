@@ -0,0 +1,257 @@
+# Webhook Module
+# Completion callbacks so clients don't have to poll `status`. Payloads are
+# JSON, signed with HMAC-SHA256 over "<timestamp>.<body>", and delivered by
+# one background thread with exponential-backoff retries, so a slow or
+# failing receiver never holds up the next job. Receivers must resolve to
+# public addresses (unless allowlisted) and redirects are not followed, so a
+# webhook_url cannot reach the pod's loopback, private network or cloud
+# metadata endpoints. Pending retries live in memory only.
+
+import os
+import hmac
+import json
+import time
+import uuid
+import heapq
+import socket
+import hashlib
+import ipaddress
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+
+# HMAC key for X-Webhook-Signature (empty = payloads go out unsigned)
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get("WEBHOOK_MAX_ATTEMPTS", "8"))
+# First retry delay; doubles per attempt up to WEBHOOK_BACKOFF_MAX_S
+WEBHOOK_BACKOFF_S = float(os.environ.get("WEBHOOK_BACKOFF_S", "2"))
+WEBHOOK_BACKOFF_MAX_S = float(os.environ.get("WEBHOOK_BACKOFF_MAX_S", "300"))
+WEBHOOK_TIMEOUT_S = float(os.environ.get("WEBHOOK_TIMEOUT_S", "10"))
+# Deliveries remembered for `stats` / job status
+WEBHOOK_HISTORY = int(os.environ.get("WEBHOOK_HISTORY", "256"))
+# Hosts, IPs or CIDR networks receivers may use even though they are not public
+WEBHOOK_ALLOW_HOSTS = tuple(h.strip().lower() for h in os.environ.get("WEBHOOK_ALLOW_HOSTS", "").split(",") if h.strip())
+
+# Receiver responses worth retrying; any other 4xx is final
+RETRY_STATUS = {408, 425, 429}
+
+
+def _public(addr):
+    if addr.version == 6 and addr.ipv4_mapped:
+        addr = addr.ipv4_mapped
+    return not (addr.is_private or addr.is_loopback or addr.is_link_local or addr.is_reserved
+                or addr.is_multicast or addr.is_unspecified)
+
+
+def _allowed(host, addr, allow_hosts):
+    for entry in allow_hosts:
+        if entry == host:
+            return True
+        try:
+            if addr in ipaddress.ip_network(entry, strict=False):
+                return True
+        except (ValueError, TypeError):
+            continue
+    return False
+
+
+def check_host(url, allow_hosts=WEBHOOK_ALLOW_HOSTS):
+    """
+    Resolve a webhook URL's host and require public addresses.
+
+    Raises:
+        ValueError: url is not an absolute http(s) URL, or its host resolves
+            to a loopback, private, link-local, reserved, multicast or
+            unspecified address that allow_hosts does not cover
+        OSError: the host does not resolve (socket.gaierror)
+    """
+    parts = urllib.parse.urlsplit(str(url))
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError(f"Invalid webhook_url '{url}', expected an http(s) URL")
+    host = parts.hostname.lower()
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    for info in infos:
+        addr = ipaddress.ip_address(info[4][0].split("%", 1)[0])
+        if not _public(addr) and not _allowed(host, addr, allow_hosts):
+            raise ValueError(f"webhook_url host '{host}' resolves to non-public address {addr} "
+                             f"(allow it with WEBHOOK_ALLOW_HOSTS)")
+
+
+def validate_url(url, allow_hosts=WEBHOOK_ALLOW_HOSTS):
+    """
+    Raises:
+        ValueError: url is not an absolute http(s) URL, does not resolve, or
+            points at a non-public address (see check_host)
+    """
+    try:
+        check_host(url, allow_hosts)
+    except OSError as e:
+        raise ValueError(f"webhook_url host does not resolve: {e}")
+    return str(url)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """A redirect could point past check_host, so 3xx ends the delivery."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+def sign(body, timestamp, secret=WEBHOOK_SECRET):
+    """Signature header value for a body (bytes) sent at timestamp (int seconds)."""
+    mac = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256)
+    return "sha256=" + mac.hexdigest()
+
+
+def verify(body, headers, secret=WEBHOOK_SECRET, tolerance_s=300):
+    """
+    Check a received payload's signature and age (for receivers and tests).
+
+    Args:
+        body: raw request body (bytes)
+        headers: mapping with X-Webhook-Timestamp and X-Webhook-Signature
+    """
+    try:
+        ts = int(headers.get("X-Webhook-Timestamp"))
+    except (TypeError, ValueError):
+        return False
+    if abs(time.time() - ts) > tolerance_s:
+        return False
+    return hmac.compare_digest(sign(body, ts, secret), str(headers.get("X-Webhook-Signature", "")))
+
+
+def backoff_s(attempt, base=WEBHOOK_BACKOFF_S, cap=WEBHOOK_BACKOFF_MAX_S):
+    """Delay before retry number attempt (1-based)."""
+    return min(cap, base * (2 ** (attempt - 1)))
+
+
+class WebhookSender:
+    """
+    Background delivery of signed webhook payloads with retries.
+
+    Args:
+        secret: HMAC key (empty = unsigned)
+        max_attempts: attempts per delivery before it counts as failed
+        on_done: callback(delivery dict) once a delivery succeeds or gives up
+    """
+
+    def __init__(self, secret=WEBHOOK_SECRET, max_attempts=WEBHOOK_MAX_ATTEMPTS, timeout_s=WEBHOOK_TIMEOUT_S,
+                 backoff=backoff_s, on_done=None, history=WEBHOOK_HISTORY, allow_hosts=WEBHOOK_ALLOW_HOSTS):
+        self.secret = secret
+        self.allow_hosts = allow_hosts
+        self.opener = urllib.request.build_opener(_NoRedirect)
+        self.max_attempts = max_attempts
+        self.timeout_s = timeout_s
+        self.backoff = backoff
+        self.on_done = on_done
+        self.history = history
+        self.cond = threading.Condition()
+        self.due = []  # heap of (due time, seq, delivery id)
+        self.seq = 0
+        self.deliveries = OrderedDict()
+        self.thread = None
+        self.stats = {"sent": 0, "delivered": 0, "failed": 0, "retries": 0}
+
+    def send(self, url, payload, job_id=None):
+        """
+        Queue a payload for delivery; returns immediately.
+
+        Returns:
+            the delivery record ({"id", "url", "status": "pending", ...})
+        """
+        body = json.dumps(payload, separators=(",", ":"), default=str).encode()
+        delivery = {"id": str(uuid.uuid4()), "url": validate_url(url, self.allow_hosts), "job_id": job_id, "event": payload.get("event"),
+                    "status": "pending", "attempts": 0, "last_error": None, "created_at": time.time()}
+        with self.cond:
+            self.deliveries[delivery["id"]] = dict(delivery, body=body)
+            while len(self.deliveries) > self.history:
+                old = next(iter(self.deliveries))
+                if self.deliveries[old]["status"] == "pending":
+                    break
+                del self.deliveries[old]
+            self._schedule(delivery["id"], 0.0)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, daemon=True, name="webhook-sender")
+                self.thread.start()
+        return delivery
+
+    def _schedule(self, did, delay_s):
+        self.seq += 1
+        heapq.heappush(self.due, (time.monotonic() + delay_s, self.seq, did))
+        self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.due or self.due[0][0] > time.monotonic():
+                    self.cond.wait(None if not self.due else self.due[0][0] - time.monotonic())
+                _, _, did = heapq.heappop(self.due)
+                d = self.deliveries.get(did)
+            if d is not None:
+                self._attempt(d)
+
+    def _post(self, d):
+        """One POST. Returns (ok, retryable, error, retry-after seconds or None)."""
+        # Re-resolved per attempt: DNS may have changed since the job was accepted
+        try:
+            check_host(d["url"], self.allow_hosts)
+        except ValueError as e:
+            return False, False, str(e), None
+        except OSError as e:
+            return False, True, f"{type(e).__name__}: {e}", None
+        ts = int(time.time())
+        headers = {"Content-Type": "application/json", "User-Agent": "wan22-worker-webhook",
+                   "X-Webhook-Id": d["id"], "X-Webhook-Timestamp": str(ts),
+                   "X-Webhook-Attempt": str(d["attempts"])}
+        if self.secret:
+            headers["X-Webhook-Signature"] = sign(d["body"], ts, self.secret)
+        req = urllib.request.Request(d["url"], data=d["body"], headers=headers, method="POST")
+        try:
+            with self.opener.open(req, timeout=self.timeout_s) as r:
+                r.read(1024)
+            return True, False, None, None
+        except urllib.error.HTTPError as e:
+            retry_after = e.headers.get("Retry-After") if e.headers else None
+            retry_after = float(retry_after) if retry_after and retry_after.isdigit() else None
+            return False, e.code >= 500 or e.code in RETRY_STATUS, f"HTTP {e.code}", retry_after
+        except Exception as e:
+            return False, True, f"{type(e).__name__}: {e}", None
+
+    def _attempt(self, d):
+        d["attempts"] += 1
+        ok, retryable, error, retry_after = self._post(d)
+        with self.cond:
+            self.stats["sent"] += 1
+            d["last_error"] = error
+            if ok or not retryable or d["attempts"] >= self.max_attempts:
+                d["status"] = "delivered" if ok else "failed"
+                d["finished_at"] = time.time()
+                self.stats[d["status"]] += 1
+            else:
+                self.stats["retries"] += 1
+                self._schedule(d["id"], max(self.backoff(d["attempts"]), retry_after or 0))
+                return
+        if d["status"] == "failed":
+            print(f"[webhook] Giving up on {d['url']} for {d['job_id']} after {d['attempts']} attempts: {error}")
+        if self.on_done:
+            try:
+                self.on_done(self.describe(d))
+            except Exception as e:
+                print(f"[webhook] on_done failed: {e}")
+
+    @staticmethod
+    def describe(d):
+        return {k: v for k, v in d.items() if k != "body"}
+
+    def get(self, did):
+        with self.cond:
+            d = self.deliveries.get(did)
+            return self.describe(d) if d else None
+
+    def summary(self):
+        with self.cond:
+            pending = sum(1 for d in self.deliveries.values() if d["status"] == "pending")
+            return dict(self.stats, pending=pending, signed=bool(self.secret))